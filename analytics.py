@@ -0,0 +1,414 @@
+"""Cross-campaign analytics.
+
+Rollup tables are kept current incrementally:
+  - rollup_groups: per campaign × department × title — recipients (at ingest),
+    opened/infected recipients and open/infect hits (at each summary refresh)
+  - rollup_hourly: hits per campaign × hour × kind (at each summary refresh)
+  - rollup_time_to_click: first-open delay after sending, bucketed (at each summary refresh)
+  - rollup_people: per person across finished campaigns (once, when a campaign ends)
+so the API reads a few hundred pre-aggregated rows instead of scanning recipients.
+Ad-hoc questions over exported parquet reports go through DuckDB.
+
+    python analytics.py --rebuild    # recompute rollups from recipients/events
+"""
+import os
+import glob
+import asyncio
+import logging
+import argparse
+
+import db
+import trackfilter
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS rollup_groups (
+        campaign_id BIGINT NOT NULL REFERENCES campaigns (id),
+        department  TEXT NOT NULL,
+        title       TEXT NOT NULL,
+        recipients  INT NOT NULL DEFAULT 0,
+        opened      INT NOT NULL DEFAULT 0,
+        infected    INT NOT NULL DEFAULT 0,
+        opens       BIGINT NOT NULL DEFAULT 0,
+        infects     BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (campaign_id, department, title)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_hourly (
+        campaign_id BIGINT NOT NULL REFERENCES campaigns (id),
+        hour        TIMESTAMP NOT NULL,
+        kind        TEXT NOT NULL,
+        hits        BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (campaign_id, hour, kind)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_time_to_click (
+        campaign_id BIGINT NOT NULL REFERENCES campaigns (id),
+        bucket      SMALLINT NOT NULL,
+        clicks      INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (campaign_id, bucket)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_people (
+        person           TEXT PRIMARY KEY,     -- 소문자 이메일
+        name             TEXT,
+        department       TEXT,
+        campaigns        INT NOT NULL DEFAULT 0,
+        opened           INT NOT NULL DEFAULT 0,
+        infected         INT NOT NULL DEFAULT 0,
+        last_campaign_id BIGINT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS rollup_people_infected_idx ON rollup_people (infected DESC, opened DESC)",
+    "ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS people_rolled_up BOOLEAN NOT NULL DEFAULT false",
+]
+
+# 발송 → 최초 열람까지 걸린 시간 구간 (초)
+TTC_EDGES = [60, 300, 900, 3600, 14400, 86400, 259200]
+_TTC_BUCKET = "width_bucket(EXTRACT(EPOCH FROM clicked_at - sent_at)::float8, %(edges)s::float8[])"
+TTC_LABELS = ["1분 미만", "1-5분", "5-15분", "15분-1시간", "1-4시간", "4-24시간", "1-3일", "3일 이상"]
+GROUP_DIMENSIONS = ("department", "title")
+REPORTS_GLOB = os.path.join("logs", "final_report_*.parquet")
+ADHOC_DIMENSIONS = {"department": "department", "title": "title", "report": "filename"}
+
+
+class AnalyticsError(ValueError):
+    pass
+
+
+async def create_schema():
+    async with db.connection() as conn:
+        for ddl in SCHEMA:
+            await conn.execute(ddl)
+        # recipients.ttc_bucket: 소요 시간 롤업에 반영된 구간 — 기존 설치는 열을 추가할 때 한 번 현재 값으로 채움
+        cur = await conn.execute(
+            "SELECT 1 FROM information_schema.columns WHERE table_name = 'recipients' AND column_name = 'ttc_bucket'"
+        )
+        if await cur.fetchone() is None:
+            await conn.execute("ALTER TABLE recipients ADD COLUMN IF NOT EXISTS ttc_bucket SMALLINT")
+            await conn.execute(
+                f"UPDATE recipients SET ttc_bucket = {_TTC_BUCKET} WHERE clicked_at IS NOT NULL AND sent_at IS NOT NULL",
+                {"edges": TTC_EDGES},
+            )
+        # 아직 반영되지 않은(열람·발송 시각이 모두 있는데 구간이 없는) 수신자만 담는 작은 인덱스
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS recipients_ttc_pending_idx ON recipients (campaign_id)"
+            " WHERE ttc_bucket IS NULL AND clicked_at IS NOT NULL AND sent_at IS NOT NULL"
+        )
+
+
+# ───────── 증분 갱신 (summaries.refresh 트랜잭션 안에서 호출) ─────────
+async def apply(conn, campaign_id: int, changes: list[tuple], lo: str, hi: str):
+    """Add one summary refresh to the rollups.
+
+    `changes` holds one row per updated recipient:
+    (department, title, first_open, first_infect, opens, infects, recipient_id).
+    Time-to-click is folded separately by fold_time_to_click().
+    """
+    groups: dict[tuple, list[int]] = {}
+    for dept, title, first_open, first_infect, opens, infects, _ in changes:
+        g = groups.setdefault((dept or "", title or ""), [0, 0, 0, 0])
+        g[0] += int(first_open)
+        g[1] += int(first_infect)
+        g[2] += opens
+        g[3] += infects
+    if groups:
+        keys = list(groups)
+        await conn.execute(
+            """
+            INSERT INTO rollup_groups AS r (campaign_id, department, title, opened, infected, opens, infects)
+            SELECT %s, * FROM unnest(%s::text[], %s::text[], %s::int[], %s::int[], %s::bigint[], %s::bigint[])
+            ON CONFLICT (campaign_id, department, title) DO UPDATE
+              SET opened   = r.opened + EXCLUDED.opened,
+                  infected = r.infected + EXCLUDED.infected,
+                  opens    = r.opens + EXCLUDED.opens,
+                  infects  = r.infects + EXCLUDED.infects
+            """,
+            (campaign_id, [k[0] for k in keys], [k[1] for k in keys],
+             *([groups[k][i] for k in keys] for i in range(4))),
+            prepare=True,
+        )
+    # 시간대별 요청 수는 같은 워터마크 구간의 이벤트에서 직접 집계 (수신자 목록에 없는 요청 포함)
+    await conn.execute(
+        """
+        INSERT INTO rollup_hourly AS r (campaign_id, hour, kind, hits)
+        SELECT e.campaign_id, date_trunc('hour', e.occurred_at), e.kind, COUNT(*)
+          FROM events e
+          LEFT JOIN recipients s ON s.campaign_id = e.campaign_id AND s.id = e.recipient_id
+         WHERE e.campaign_id = %s AND e.xid >= %s::xid8 AND e.xid < %s::xid8 AND e.scanner IS NULL
+           -- 수신자 요약과 같은 기준: 발송 직후(TRACK_SCANNER_DELAY 이내) 요청 제외
+           AND (s.sent_at IS NULL OR e.occurred_at >= s.sent_at + make_interval(secs => %s))
+         GROUP BY 1, 2, 3
+        ON CONFLICT (campaign_id, hour, kind) DO UPDATE SET hits = r.hits + EXCLUDED.hits
+        """,
+        (campaign_id, lo, hi, trackfilter.TRACK_SCANNER_DELAY),
+        prepare=True,
+    )
+
+
+async def fold_time_to_click(conn, campaign_id: int, touched: list):
+    """Keep rollup_time_to_click equal to bucketing every recipient's clicked_at - sent_at.
+
+    recipients.ttc_bucket records the bucket each recipient is counted in;
+    a recipient is (re)counted when both times are known and its bucket
+    differs — a new open, an earlier open folded late, or sent_at written
+    after the open. rebuild() applies the same rule from scratch.
+    """
+    await conn.execute(
+        f"""
+        WITH cur AS (
+            SELECT id, ttc_bucket AS old, {_TTC_BUCKET} AS new
+              FROM recipients
+             WHERE campaign_id = %(campaign_id)s AND clicked_at IS NOT NULL AND sent_at IS NOT NULL
+               AND (ttc_bucket IS NULL OR id = ANY(%(touched)s::uuid[]))
+        ), upd AS (
+            UPDATE recipients AS r SET ttc_bucket = cur.new
+              FROM cur
+             WHERE r.campaign_id = %(campaign_id)s AND r.id = cur.id AND cur.old IS DISTINCT FROM cur.new
+            RETURNING cur.old, cur.new
+        ), delta AS (
+            SELECT new AS bucket, 1 AS d FROM upd
+            UNION ALL
+            SELECT old, -1 FROM upd WHERE old IS NOT NULL
+        )
+        INSERT INTO rollup_time_to_click AS t (campaign_id, bucket, clicks)
+        SELECT %(campaign_id)s, bucket, SUM(d) FROM delta GROUP BY bucket
+        ON CONFLICT (campaign_id, bucket) DO UPDATE SET clicks = t.clicks + EXCLUDED.clicks
+        """,
+        {"campaign_id": campaign_id, "touched": touched, "edges": TTC_EDGES},
+        prepare=True,
+    )
+
+
+async def close_campaign(campaign_id: int):
+    """Fold a finished campaign into the per-person rollup (once per campaign)."""
+    async with db.connection() as conn, conn.transaction():
+        cur = await conn.execute(
+            "UPDATE campaigns SET people_rolled_up = true WHERE id = %s AND NOT people_rolled_up RETURNING id",
+            (campaign_id,),
+        )
+        if await cur.fetchone() is None:
+            return
+        await conn.execute(
+            """
+            INSERT INTO rollup_people AS p (person, name, department, campaigns, opened, infected, last_campaign_id)
+            SELECT lower(email), MAX(name), MAX(department), 1,
+                   (COUNT(clicked_at) > 0)::int, (COUNT(infected_at) > 0)::int, %(campaign_id)s
+              FROM recipients
+             WHERE campaign_id = %(campaign_id)s AND COALESCE(email, '') <> ''
+             GROUP BY lower(email)
+            ON CONFLICT (person) DO UPDATE
+              SET name             = EXCLUDED.name,
+                  department       = EXCLUDED.department,
+                  campaigns        = p.campaigns + 1,
+                  opened           = p.opened + EXCLUDED.opened,
+                  infected         = p.infected + EXCLUDED.infected,
+                  last_campaign_id = EXCLUDED.last_campaign_id
+            """,
+            {"campaign_id": campaign_id},
+        )
+
+
+async def rebuild(campaign_id: int):
+    """Recompute one campaign's rollups from recipients and already-summarized events."""
+    async with db.connection() as conn, conn.transaction():
+        # 요약 갱신과 같은 행 잠금 → 도중에 증분이 끼어들지 않음
+        cur = await conn.execute(
+            "SELECT summarized_xid::text FROM campaigns WHERE id = %s FOR NO KEY UPDATE", (campaign_id,)
+        )
+        row = await cur.fetchone()
+        if row is None:
+            return
+        (hi,) = row
+        for table in ("rollup_groups", "rollup_hourly", "rollup_time_to_click"):
+            await conn.execute(f"DELETE FROM {table} WHERE campaign_id = %s", (campaign_id,))
+        await conn.execute(
+            """
+            INSERT INTO rollup_groups (campaign_id, department, title, recipients, opened, infected, opens, infects)
+            SELECT campaign_id, COALESCE(department, ''), COALESCE(title, ''), COUNT(*),
+                   COUNT(clicked_at), COUNT(infected_at), SUM(open_count), SUM(infect_count)
+              FROM recipients WHERE campaign_id = %s
+             GROUP BY 1, 2, 3
+            """,
+            (campaign_id,),
+        )
+        await conn.execute(
+            """
+            INSERT INTO rollup_hourly (campaign_id, hour, kind, hits)
+            SELECT e.campaign_id, date_trunc('hour', e.occurred_at), e.kind, COUNT(*)
+              FROM events e
+              LEFT JOIN recipients s ON s.campaign_id = e.campaign_id AND s.id = e.recipient_id
+             WHERE e.campaign_id = %s AND e.xid < %s::xid8 AND e.scanner IS NULL
+               AND (s.sent_at IS NULL OR e.occurred_at >= s.sent_at + make_interval(secs => %s))
+             GROUP BY 1, 2, 3
+            """,
+            (campaign_id, hi, trackfilter.TRACK_SCANNER_DELAY),
+        )
+        # 증분 갱신(fold_time_to_click)과 같은 기준: 열람·발송 시각이 모두 있는 수신자의 구간
+        await conn.execute(
+            f"""
+            UPDATE recipients
+               SET ttc_bucket = CASE WHEN clicked_at IS NOT NULL AND sent_at IS NOT NULL THEN {_TTC_BUCKET} END
+             WHERE campaign_id = %(campaign_id)s
+            """,
+            {"campaign_id": campaign_id, "edges": TTC_EDGES},
+        )
+        await conn.execute(
+            """
+            INSERT INTO rollup_time_to_click (campaign_id, bucket, clicks)
+            SELECT campaign_id, ttc_bucket, COUNT(*)
+              FROM recipients
+             WHERE campaign_id = %s AND ttc_bucket IS NOT NULL
+             GROUP BY 1, 2
+            """,
+            (campaign_id,),
+        )
+
+
+# ───────── 조회 ─────────
+def _rate(part, total) -> float:
+    return round(part / total * 100, 2) if total else 0.0
+
+
+async def campaign_trend() -> list[dict]:
+    rows = await db.fetch_all(
+        """
+        SELECT c.name, c.started_at, c.ended_at,
+               COALESCE(SUM(g.recipients), 0), COALESCE(SUM(g.opened), 0), COALESCE(SUM(g.infected), 0),
+               COALESCE(SUM(g.opens), 0), COALESCE(SUM(g.infects), 0)
+          FROM campaigns c LEFT JOIN rollup_groups g ON g.campaign_id = c.id
+         GROUP BY c.id ORDER BY c.started_at
+        """,
+        prepare=True,
+    )
+    return [
+        {
+            "campaign": name, "started_at": started, "ended_at": ended,
+            "recipients": total, "opened": opened, "infected": infected,
+            "opens": opens, "infects": infects,
+            "open_rate": _rate(opened, total), "infection_rate": _rate(infected, total),
+        }
+        for name, started, ended, total, opened, infected, opens, infects in rows
+    ]
+
+
+async def group_trend(by: str = "department", finished_only: bool = False) -> list[dict]:
+    """Rates per campaign for each department or title."""
+    if by not in GROUP_DIMENSIONS:
+        raise AnalyticsError(f"알 수 없는 기준: {by}")
+    rows = await db.fetch_all(
+        f"""
+        SELECT c.name, g.{by}, SUM(g.recipients), SUM(g.opened), SUM(g.infected)
+          FROM rollup_groups g JOIN campaigns c ON c.id = g.campaign_id
+         WHERE %s = false OR c.ended_at IS NOT NULL
+         GROUP BY c.id, g.{by} ORDER BY c.started_at, g.{by}
+        """,
+        (finished_only,),
+        prepare=True,
+    )
+    return [
+        {
+            "campaign": name, by: key, "recipients": total, "opened": opened, "infected": infected,
+            "open_rate": _rate(opened, total), "infection_rate": _rate(infected, total),
+        }
+        for name, key, total, opened, infected in rows
+    ]
+
+
+async def hourly(campaign_id: int) -> list[dict]:
+    rows = await db.fetch_all(
+        "SELECT hour, kind, hits FROM rollup_hourly WHERE campaign_id = %s ORDER BY hour, kind",
+        (campaign_id,),
+        prepare=True,
+    )
+    return [{"hour": hour, "kind": kind, "hits": hits} for hour, kind, hits in rows]
+
+
+async def time_to_click(campaign_id: int | None = None) -> list[dict]:
+    rows = await db.fetch_all(
+        "SELECT bucket, SUM(clicks) FROM rollup_time_to_click"
+        " WHERE %s::bigint IS NULL OR campaign_id = %s GROUP BY bucket",
+        (campaign_id, campaign_id),
+        prepare=True,
+    )
+    counts = dict(rows)
+    return [{"bucket": label, "clicks": counts.get(i, 0)} for i, label in enumerate(TTC_LABELS)]
+
+
+async def repeat_offenders(min_infected: int = 2, limit: int = 100) -> list[dict]:
+    rows = await db.fetch_all(
+        """
+        SELECT person, name, department, campaigns, opened, infected
+          FROM rollup_people WHERE infected >= %s
+         ORDER BY infected DESC, opened DESC LIMIT %s
+        """,
+        (min_infected, limit),
+        dict_rows=True,
+        prepare=True,
+    )
+    return rows
+
+
+def adhoc(group_by: str, since=None, until=None, pattern: str = REPORTS_GLOB) -> list[dict]:
+    """Aggregate exported parquet reports with DuckDB (vectorized, no database round trips)."""
+    if group_by not in ADHOC_DIMENSIONS:
+        raise AnalyticsError(f"알 수 없는 기준: {group_by}")
+    try:
+        import duckdb
+    except ImportError:
+        raise AnalyticsError("보고서 집계에는 duckdb 패키지가 필요합니다")
+    if not glob.glob(pattern):
+        return []
+    dim = ADHOC_DIMENSIONS[group_by]
+    where, params = [], [pattern]
+    if since:
+        where.append("clicked_at >= ?")
+        params.append(since)
+    if until:
+        where.append("clicked_at < ?")
+        params.append(until)
+    sql = f"""
+        SELECT {dim} AS key,
+               COUNT(*) AS recipients,
+               COUNT(clicked_at) AS opened,
+               COUNT(infected_at) AS infected,
+               ROUND(COUNT(infected_at) * 100.0 / COUNT(*), 2) AS infection_rate,
+               MEDIAN(epoch(infected_at) - epoch(clicked_at)) AS median_click_to_infect_sec
+          FROM read_parquet(?, filename = true, union_by_name = true)
+         {"WHERE " + " AND ".join(where) if where else ""}
+         GROUP BY 1 ORDER BY infection_rate DESC
+    """
+    with duckdb.connect() as con:
+        cur = con.execute(sql, params)
+        names = [d[0] for d in cur.description]
+        return [dict(zip(names, row)) for row in cur.fetchall()]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Rebuild analytics rollups")
+    parser.add_argument("--rebuild", action="store_true", help="recompute every campaign's rollups")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if not args.rebuild:
+        parser.print_help()
+        return
+    await db.open_pool()
+    try:
+        await create_schema()
+        # 파티션을 삭제한 보관 훈련은 원본이 없으므로 기존 집계를 그대로 둠
+        for campaign_id, name, ended in await db.fetch_all(
+            "SELECT id, name, ended_at IS NOT NULL FROM campaigns WHERE NOT archive_dropped"
+        ):
+            await rebuild(campaign_id)
+            if ended:
+                await close_campaign(campaign_id)
+            logging.info("%s: rollups rebuilt", name)
+    finally:
+        await db.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,158 @@
+import json
+import queue
+import logging
+import asyncio
+import threading
+import concurrent.futures
+
+import httpx
+
+# ───────── GUI 용 API 클라이언트 ─────────
+# 모든 HTTP 호출은 전용 스레드의 이벤트 루프에서 하나의 keep-alive 세션(httpx.AsyncClient)으로 처리하고,
+# 결과 콜백은 스레드 안전 큐에 넣어 Tk 메인 스레드가 after() 로 꺼내 실행한다 (위젯은 메인 스레드에서만 변경).
+DEFAULT_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+STREAM_RETRY_DELAY = 2.0   # 스트림이 끊기면 재접속까지 대기(초)
+PUMP_INTERVAL_MS = 50      # UI 큐 확인 주기
+
+
+class ApiError(Exception):
+    """Non-2xx response; carries the status and decoded body."""
+
+    def __init__(self, status: int, body):
+        self.status = status
+        self.body = body
+        message = body.get("error") if isinstance(body, dict) else None
+        super().__init__(message or f"HTTP {status}")
+
+
+class Call:
+    """Handle for one in-flight request or stream; cancel() is safe from any thread."""
+
+    def __init__(self, future: concurrent.futures.Future):
+        self._future = future
+
+    def cancel(self):
+        self._future.cancel()  # 루프 쪽 Task 도 취소됨
+
+    @property
+    def done(self) -> bool:
+        return self._future.done()
+
+
+class ApiClient:
+    def __init__(self, base_url: str, timeout: httpx.Timeout = DEFAULT_TIMEOUT):
+        self.base_url = base_url
+        self.timeout = timeout
+        self._ui: queue.SimpleQueue = queue.SimpleQueue()  # (callback, args) → 메인 스레드에서 실행
+        self._calls: set[Call] = set()
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, name="api-client", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    # ───────── 백그라운드 루프 ─────────
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._session = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout)
+        self._ready.set()
+        self._loop.run_forever()
+
+    def _submit(self, coro) -> Call:
+        call = Call(asyncio.run_coroutine_threadsafe(coro, self._loop))
+        self._calls.add(call)
+        call._future.add_done_callback(lambda _: self._calls.discard(call))
+        return call
+
+    def _deliver(self, callback, *args):
+        if callback is not None:
+            self._ui.put((callback, args))
+
+    # ───────── 요청 ─────────
+    def request(self, method: str, path: str, *, params=None, json_body=None,
+                on_done=None, on_error=None, timeout: float | None = None) -> Call:
+        """Send a request in the background; on_done(data) or on_error(exc) runs on the UI thread."""
+        async def run():
+            try:
+                res = await self._session.request(
+                    method, path, params=params, json=json_body,
+                    timeout=timeout if timeout is not None else self.timeout,
+                )
+                try:
+                    data = res.json()
+                except ValueError:
+                    data = res.text
+                if res.is_error:
+                    raise ApiError(res.status_code, data)
+            except asyncio.CancelledError:
+                raise  # 취소된 요청은 콜백 없음
+            except Exception as e:
+                self._deliver(on_error, e)
+                return
+            self._deliver(on_done, data)
+        return self._submit(run())
+
+    def get(self, path: str, **kwargs) -> Call:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> Call:
+        return self.request("POST", path, **kwargs)
+
+    def stream_events(self, path: str, on_event, on_error=None, retry_delay: float = STREAM_RETRY_DELAY) -> Call:
+        """Follow a server-sent event stream, reconnecting until cancelled; on_event(data) per `data:` line."""
+        async def run():
+            while True:
+                try:
+                    # 읽기 타임아웃 없음 (이벤트가 없을 때도 연결 유지)
+                    async with self._session.stream("GET", path, timeout=httpx.Timeout(None, connect=5.0)) as res:
+                        res.raise_for_status()
+                        async for line in res.aiter_lines():
+                            if line.startswith("data: "):
+                                self._deliver(on_event, json.loads(line[len("data: "):]))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self._deliver(on_error, e)
+                await asyncio.sleep(retry_delay)
+        return self._submit(run())
+
+    def call_in_thread(self, fn, *args, on_done=None, on_error=None) -> Call:
+        """Run blocking fn(*args) on a worker thread; on_done(result) or on_error(exc) runs on the UI thread."""
+        async def run():
+            try:
+                result = await asyncio.to_thread(fn, *args)
+            except Exception as e:
+                self._deliver(on_error, e)
+                return
+            self._deliver(on_done, result)
+        return self._submit(run())
+
+    def cancel_all(self):
+        for call in list(self._calls):
+            call.cancel()
+
+    # ───────── UI 스레드 ─────────
+    def pump(self):
+        """Run queued callbacks; call from the Tk main thread."""
+        while True:
+            try:
+                callback, args = self._ui.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                callback(*args)
+            except Exception:
+                logging.exception("api callback error")  # 콜백 하나가 실패해도 펌프는 계속
+
+    def attach(self, widget, interval_ms: int = PUMP_INTERVAL_MS):
+        """Pump callbacks from `widget`'s event loop every interval_ms."""
+        def tick():
+            self.pump()
+            widget.after(interval_ms, tick)
+        widget.after(interval_ms, tick)
+
+    def close(self):
+        self.cancel_all()
+        asyncio.run_coroutine_threadsafe(self._session.aclose(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
@@ -0,0 +1,371 @@
+"""Columnar archive tier for finished campaigns.
+
+`archive(name)` streams an ended campaign's recipients and events
+partitions into zstd-compressed Parquet files under ARCHIVE_DIR/<name>/
+with a manifest.json (row counts, checksums, summary). With drop=True the
+two partitions are then dropped from Postgres; the campaigns row and the
+analytics rollups stay, so cross-campaign trends keep working.
+
+Archived campaigns are read back through ArchiveStore, which scans the
+Parquet files with pyarrow.dataset (only the columns a query needs, row
+groups pruned by the filter) — historical look-ups and report re-exports
+never touch the database.
+
+    python archive.py --all --older-than 30 [--drop]    # every ended campaign older than 30 days
+    python archive.py phishing_click_logs_20250101_090000_locked --drop
+    python archive.py --list
+"""
+import os
+import json
+import shutil
+import asyncio
+import hashlib
+import logging
+import argparse
+from datetime import datetime
+
+import db
+import reports
+import campaigns
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_CACHE_SIZE = int(os.getenv("ARCHIVE_CACHE_SIZE", "8"))  # 파일 메타데이터(footer)를 캐시해 둘 훈련 수
+BATCH_SIZE = reports.BATCH_SIZE
+FORMAT_VERSION = 1
+
+RECIPIENT_COLUMNS = [
+    "id", "employee_no", "name", "email", "department", "title", "ip_address", "user_agent", "referer",
+    "accept_language", "clicked_at", "infected_at", "open_count", "infect_count", "last_seen_at", "sent_at",
+]
+EVENT_COLUMNS = [
+    "recipient_id", "kind", "occurred_at", "ip_address", "user_agent", "referer", "accept_language", "scanner",
+]
+UUID_COLUMNS = {"id", "recipient_id"}
+RECIPIENTS_GLOB = os.path.join(ARCHIVE_DIR, "*", "recipients.parquet")  # analytics.adhoc 로 훈련 간 집계
+STATUS_FILTERS = ("unopened", "opened", "infected")
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        import pyarrow.compute as pc
+        import pyarrow.dataset as ds
+    except ImportError:
+        raise ArchiveError("보관(아카이브)에는 pyarrow 패키지가 필요합니다")
+    return pa, pq, pc, ds
+
+
+def _schema(pa, columns: list[str]):
+    return pa.schema([
+        pa.field(c, pa.timestamp("us") if c.endswith("_at") else pa.int32() if c.endswith("_count") else pa.string())
+        for c in columns
+    ])
+
+
+def campaign_dir(name: str) -> str:
+    if not name or name.startswith(".") or os.sep in name or "/" in name:
+        raise ArchiveError(f"잘못된 훈련 이름: {name}")
+    return os.path.join(ARCHIVE_DIR, name)
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+# ───────── 보관 ─────────
+async def _export_partition(table: str, columns: list[str], campaign_id: int, path: str,
+                            order_by: str | None = None) -> int:
+    """Stream one partition into a Parquet file through a server-side cursor; returns the row count."""
+    pa, pq, _, _ = _pyarrow()
+    schema = _schema(pa, columns)
+    writer = pq.ParquetWriter(path, schema, compression="zstd")
+    uuid_idx = [i for i, c in enumerate(columns) if c in UUID_COLUMNS]
+    rows_written = 0
+    try:
+        async with db.connection() as conn:
+            async with conn.cursor(name=f"archive_{table}_c{campaign_id}") as cur:
+                order = f" ORDER BY {order_by}" if order_by else ""
+                await cur.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE campaign_id = %s{order}", (campaign_id,))
+                while True:
+                    rows = await cur.fetchmany(BATCH_SIZE)
+                    if not rows:
+                        break
+                    arrays = [list(col) for col in zip(*rows)]
+                    for i in uuid_idx:
+                        arrays[i] = [str(v) if v is not None else None for v in arrays[i]]
+                    batch = pa.Table.from_arrays(arrays, schema=schema)
+                    await asyncio.to_thread(writer.write_table, batch)  # 압축·기록은 스레드에서
+                    rows_written += len(rows)
+    finally:
+        await asyncio.to_thread(writer.close)
+    return rows_written
+
+
+async def archive(name: str, drop: bool = False) -> dict:
+    """Write an ended campaign to ARCHIVE_DIR/<name>/ and optionally drop its partitions; returns the manifest."""
+    _pyarrow()
+    row = await db.fetch_one(
+        "SELECT id, started_at, ended_at, archived_at, archive_dropped FROM campaigns WHERE name = %s", (name,)
+    )
+    if row is None:
+        raise LookupError(f"훈련 없음: {name}")
+    campaign_id, started_at, ended_at, archived_at, dropped = row
+    if ended_at is None:
+        raise ArchiveError(f"종료되지 않은 훈련은 보관할 수 없습니다: {name}")
+
+    final = campaign_dir(name)
+    if archived_at is None or not os.path.exists(os.path.join(final, "manifest.json")):
+        if dropped:
+            raise ArchiveError(f"DB 에서 삭제된 훈련의 보관 파일이 없습니다: {final}")
+        # 임시 디렉터리에 모두 쓴 뒤 rename → 중간에 실패해도 반쯤 쓴 보관본이 남지 않음
+        tmp = f"{final}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        try:
+            counts = {
+                "recipients": await _export_partition("recipients", RECIPIENT_COLUMNS, campaign_id,
+                                                      os.path.join(tmp, "recipients.parquet")),
+                # 수신자별 조회가 row group 통계로 건너뛸 수 있도록 recipient_id 순으로 기록
+                "events": await _export_partition("events", EVENT_COLUMNS, campaign_id,
+                                                  os.path.join(tmp, "events.parquet"), "recipient_id, occurred_at"),
+            }
+            manifest = {
+                "format": FORMAT_VERSION,
+                "campaign_id": campaign_id,
+                "name": name,
+                "started_at": started_at.isoformat(),
+                "ended_at": ended_at.isoformat(),
+                "archived_at": datetime.now().isoformat(timespec="seconds"),
+                "summary": await reports.summary(name),
+                "files": {},
+                "dropped": False,
+            }
+            for part, rows in counts.items():
+                path = os.path.join(tmp, f"{part}.parquet")
+                manifest["files"][part] = {
+                    "path": f"{part}.parquet", "rows": rows,
+                    "bytes": os.path.getsize(path), "sha256": await asyncio.to_thread(_sha256, path),
+                }
+            _write_manifest(tmp, manifest)
+            shutil.rmtree(final, ignore_errors=True)
+            os.replace(tmp, final)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        await db.execute("UPDATE campaigns SET archived_at = now() WHERE id = %s", (campaign_id,))
+        store.forget(name)
+        logging.info("archived %s: %d recipients, %d events", name, counts["recipients"], counts["events"])
+
+    manifest = read_manifest(name)
+    if drop and not dropped:
+        await _drop_partitions(campaign_id, manifest)
+        manifest["dropped"] = True
+        _write_manifest(final, manifest)
+    return manifest
+
+
+async def _drop_partitions(campaign_id: int, manifest: dict):
+    """Drop the live partitions once the archive is verified to hold every row."""
+    _, pq, _, _ = _pyarrow()
+    for part, info in manifest["files"].items():
+        path = os.path.join(campaign_dir(manifest["name"]), info["path"])
+        if await asyncio.to_thread(_sha256, path) != info["sha256"]:
+            raise ArchiveError(f"보관 파일 검증 실패(체크섬): {path}")
+        if pq.ParquetFile(path).metadata.num_rows != info["rows"]:
+            raise ArchiveError(f"보관 파일 검증 실패(행 수): {path}")
+    cid = int(campaign_id)
+    async with db.connection() as conn, conn.transaction():
+        for part in ("recipients", "events"):
+            cur = await conn.execute(f"SELECT count(*) FROM {part} WHERE campaign_id = %s", (cid,))
+            (live,) = await cur.fetchone()
+            if live != manifest["files"][part]["rows"]:
+                raise ArchiveError(f"{part}: DB {live}행 / 보관본 {manifest['files'][part]['rows']}행 — 다시 보관 필요")
+        # DDL 은 파라미터를 받을 수 없으므로 정수 id 만 문자열로 넣음
+        await conn.execute(f"DROP TABLE IF EXISTS recipients_c{cid}")
+        await conn.execute(f"DROP TABLE IF EXISTS events_c{cid}")
+        await conn.execute("UPDATE campaigns SET archive_dropped = true WHERE id = %s", (cid,))
+    logging.info("dropped live partitions of %s", manifest["name"])
+
+
+def _write_manifest(directory: str, manifest: dict):
+    tmp = os.path.join(directory, "manifest.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, os.path.join(directory, "manifest.json"))
+
+
+def read_manifest(name: str) -> dict:
+    path = os.path.join(campaign_dir(name), "manifest.json")
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise LookupError(f"보관본 없음: {name}")
+
+
+def list_archives() -> list[dict]:
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    found = []
+    for name in sorted(os.listdir(ARCHIVE_DIR)):
+        if os.path.exists(os.path.join(ARCHIVE_DIR, name, "manifest.json")):
+            found.append(read_manifest(name))
+    return found
+
+
+async def is_dropped(name: str) -> bool:
+    row = await db.fetch_one("SELECT archive_dropped FROM campaigns WHERE name = %s", (name,), prepare=True)
+    return bool(row and row[0])
+
+
+# ───────── 조회 (DB 없이) ─────────
+class ArchiveStore:
+    """Parquet dataset handles of recently read archives (LRU, per process).
+
+    Only the file footers are kept; each query reads just the columns it
+    needs and skips row groups whose statistics rule out its filter.
+    """
+
+    def __init__(self, max_open: int = ARCHIVE_CACHE_SIZE):
+        self.max_open = max_open
+        self._open: dict[tuple[str, str], object] = {}
+
+    def dataset(self, name: str, part: str):
+        key = (name, part)
+        dataset = self._open.pop(key, None)
+        if dataset is None:
+            _, _, _, ds = _pyarrow()
+            info = read_manifest(name)["files"][part]
+            # 열 때는 footer(스키마·row group 통계)만 읽음 — 데이터는 조회마다 필요한 열·row group 만 압축 해제
+            dataset = ds.dataset(os.path.join(campaign_dir(name), info["path"]), format="parquet")
+            while len(self._open) >= self.max_open * 2:
+                self._open.pop(next(iter(self._open)))
+        self._open[key] = dataset  # 최근 사용 순서로 다시 넣음
+        return dataset
+
+    def forget(self, name: str):
+        for key in [k for k in self._open if k[0] == name]:
+            del self._open[key]
+
+    def recipients(self, name: str, status: str | None = None, department: str | None = None,
+                   fields: list[str] | None = None, limit: int = 100, offset: int = 0) -> dict:
+        _, _, _, ds = _pyarrow()
+        dataset = self.dataset(name, "recipients")
+        fields = fields or RECIPIENT_COLUMNS
+        unknown = [f for f in fields if f not in RECIPIENT_COLUMNS]
+        if unknown:
+            raise ArchiveError(f"알 수 없는 컬럼: {', '.join(unknown)}")
+        if status is not None and status not in STATUS_FILTERS:
+            raise ArchiveError(f"알 수 없는 상태: {status}")
+        where = None
+        clicked, infected = ds.field("clicked_at").is_valid(), ds.field("infected_at").is_valid()
+        if status == "unopened":
+            where = ~clicked & ~infected
+        elif status == "opened":
+            where = clicked & ~infected
+        elif status == "infected":
+            where = infected
+        if department:
+            dept = ds.field("department") == department
+            where = dept if where is None else where & dept
+        total = dataset.count_rows(filter=where)  # 조건 열만 읽음
+        # 요청한 열만, 페이지 끝까지만 읽음
+        page = dataset.scanner(columns=fields, filter=where).head(offset + limit).slice(offset)
+        return {"total": total, "rows": page.to_pylist()}
+
+    def departments(self, name: str) -> list[dict]:
+        _, _, pc, _ = _pyarrow()
+        table = self.dataset(name, "recipients").to_table(columns=["department", "clicked_at", "infected_at"])
+        grouped = table.group_by("department").aggregate([
+            ("department", "count", pc.CountOptions(mode="all")), ("clicked_at", "count"), ("infected_at", "count"),
+        ])
+        rows = []
+        for g in grouped.to_pylist():
+            total, infected = g["department_count"], g["infected_at_count"]
+            rows.append({
+                "department": g["department"], "total": total, "opened": g["clicked_at_count"], "infected": infected,
+                "infection_rate": round(infected / total * 100, 2) if total else 0,
+            })
+        return sorted(rows, key=lambda r: -r["infection_rate"])
+
+    def events(self, name: str, recipient_id: str, limit: int = 100) -> list[dict]:
+        _, _, _, ds = _pyarrow()
+        # 보관 시 recipient_id 순으로 기록 → row group 통계로 해당 수신자가 없는 구간은 건너뜀
+        table = self.dataset(name, "events").to_table(filter=ds.field("recipient_id") == recipient_id)
+        return table.sort_by("occurred_at").slice(0, limit).to_pylist()
+
+    def batches(self, name: str, batch_size: int = BATCH_SIZE):
+        """Recipient rows as tuples in reports.COLUMNS order, for report writers."""
+        for batch in self.dataset(name, "recipients").to_batches(columns=reports.COLUMNS, batch_size=batch_size):
+            yield list(zip(*(col.to_pylist() for col in batch.columns)))
+
+
+store = ArchiveStore()
+
+
+async def _batches(name: str):
+    # Parquet 읽기·압축 해제는 작업 스레드에서 — 배치마다 하나씩 받아 옴
+    it = store.batches(name)
+    while (rows := await asyncio.to_thread(next, it, None)) is not None:
+        yield rows
+
+
+async def export(name: str, formats: list[str], out_dir: str = "logs") -> list[str]:
+    """Re-export the final report of an archived campaign (no database access)."""
+    return await reports.export(name, formats, out_dir, stats=read_manifest(name)["summary"], batches=_batches(name))
+
+
+def stream_csv(name: str):
+    return reports.stream_csv(name, stats=read_manifest(name)["summary"], batches=_batches(name))
+
+
+# ───────── 보관 작업 (CLI) ─────────
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("names", nargs="*", help="campaign names to archive")
+    parser.add_argument("--all", action="store_true", help="every ended campaign that is not archived yet")
+    parser.add_argument("--older-than", type=float, default=0, help="with --all: ended at least this many days ago")
+    parser.add_argument("--drop", action="store_true", help="drop the live partitions after archiving")
+    parser.add_argument("--list", action="store_true", help="print the archive manifests")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.list:
+        for m in list_archives():
+            print(f"{m['name']}\t{m['files']['recipients']['rows']} recipients\t"
+                  f"{m['files']['events']['rows']} events\t{'dropped' if m['dropped'] else 'kept'}")
+        return
+    await db.open_pool()
+    try:
+        await campaigns.create_schema()
+        names = list(args.names)
+        if args.all:
+            rows = await db.fetch_all(
+                "SELECT name FROM campaigns WHERE ended_at IS NOT NULL AND ended_at < now() - make_interval(secs => %s)"
+                " AND (archived_at IS NULL OR (%s AND NOT archive_dropped)) ORDER BY ended_at",
+                (args.older_than * 86400, args.drop),
+            )
+            names += [name for (name,) in rows]
+        for name in names:
+            # 훈련 하나씩 — 실패해도 나머지는 계속
+            try:
+                manifest = await archive(name, drop=args.drop)
+            except Exception as e:
+                logging.error("%s: archive failed: %s", name, e)
+                continue
+            logging.info("%s: archived to %s%s", name, campaign_dir(name), " (partitions dropped)" if manifest["dropped"] else "")
+    finally:
+        await db.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,366 @@
+"""Benchmark suite: sending throughput and tracking-path load, saved as JSON.
+
+Creates a throwaway Postgres database and a local SMTP sink (aiosmtpd),
+starts the server against them, then
+
+  1. send  — submits /send-emails for a generated recipient CSV and times
+             the job until every message has reached the sink
+  2. track — replays click bursts against /track, /view-info, /submit-info
+             and /infect for the recipients just sent to
+
+and reports per-endpoint p50/p99 latency, throughput, errors and the
+number of DB connections the server held. Results are written to
+bench/results/load_suite_<time>.json; pass --compare with an earlier file
+to fail (exit code 1) when throughput drops or p99 rises past --tolerance.
+
+    DATABASE_URL=postgresql://user:pw@localhost/postgres python bench/load_suite.py
+    python bench/load_suite.py --compare bench/results/load_suite_20260101_120000.json
+"""
+import os
+import csv
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import Counter
+
+import httpx
+import psycopg
+from aiosmtpd.controller import Controller
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db  # noqa: E402
+
+TRACK_ENDPOINTS = ["/track", "/view-info", "/submit-info", "/infect"]
+
+
+# ───────── 테스트 환경 ─────────
+class ThrowawayDatabase:
+    """CREATE DATABASE on enter, DROP on exit (same server as DATABASE_URL / DB_*)."""
+
+    def __init__(self, keep: bool = False):
+        self.name = f"phishing_bench_{os.getpid()}_{int(time.time())}"
+        self.keep = keep
+        self.admin = db.conninfo()
+        self.url = psycopg.conninfo.make_conninfo(self.admin, dbname=self.name)
+
+    def __enter__(self):
+        with psycopg.connect(self.admin, autocommit=True) as conn:
+            conn.execute(f'CREATE DATABASE "{self.name}"')
+        return self
+
+    def __exit__(self, *exc):
+        if self.keep:
+            print(f"kept database {self.name}")
+            return
+        with psycopg.connect(self.admin, autocommit=True) as conn:
+            conn.execute(f'DROP DATABASE IF EXISTS "{self.name}" WITH (FORCE)')
+
+    def connections(self) -> int:
+        with psycopg.connect(self.admin, autocommit=True) as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM pg_stat_activity WHERE datname = %s", (self.name,)
+            ).fetchone()[0]
+
+
+class SinkHandler:
+    """aiosmtpd handler that only counts accepted messages."""
+
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 OK"
+
+
+class ConnectionSampler:
+    """Polls pg_stat_activity in the background; keeps max and mean."""
+
+    def __init__(self, database: ThrowawayDatabase, interval: float = 0.5):
+        self.database = database
+        self.interval = interval
+        self.samples: list[int] = []
+        self._task: asyncio.Task | None = None
+
+    async def _run(self):
+        while True:
+            self.samples.append(await asyncio.to_thread(self.database.connections))
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        self.samples = []
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+    def result(self) -> dict:
+        if not self.samples:
+            return {"max": None, "mean": None}
+        return {"max": max(self.samples), "mean": round(sum(self.samples) / len(self.samples), 1)}
+
+
+def latency_stats(latencies: list[float], duration: float) -> dict:
+    latencies = sorted(latencies)
+    n = len(latencies)
+    return {
+        "requests": n,
+        "rps": round(n / duration, 1) if duration else None,
+        "p50_ms": round(latencies[n // 2] * 1000, 2) if n else None,
+        "p99_ms": round(latencies[min(n - 1, int(n * 0.99))] * 1000, 2) if n else None,
+    }
+
+
+async def wait_ready(base: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{base}/db/pool-stats")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.3)
+    raise RuntimeError("server did not start")
+
+
+def write_csv(path: str, count: int):
+    departments = [f"부서{i}" for i in range(20)]
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["사번", "성명", "이메일", "부서", "직책"])
+        for i in range(count):
+            writer.writerow([f"E{i:06d}", f"사용자{i}", f"user{i}@example.com", random.choice(departments), "사원"])
+
+
+def recipient_ids(database: ThrowawayDatabase) -> list[str]:
+    with psycopg.connect(database.url) as conn:
+        return [str(r[0]) for r in conn.execute("SELECT id FROM recipients")]
+
+
+# ───────── 시나리오 ─────────
+async def bench_send(client: httpx.AsyncClient, sink: SinkHandler, database, args, workdir: str) -> dict:
+    csv_path = os.path.join(workdir, "recipients.csv")
+    write_csv(csv_path, args.recipients)
+    started = time.perf_counter()
+    with ConnectionSampler(database) as sampler:
+        r = await client.post("/send-emails", json={
+            "csv_path": csv_path, "template_name": args.template, "training_mode": 3,
+            "server_base": str(client.base_url), "shards": args.shards,
+        })
+        r.raise_for_status()
+        job_id = r.json()["job_id"]
+        while True:
+            progress = (await client.get(f"/jobs/{job_id}")).json()
+            if progress["status"] not in ("queued", "running", "paused"):
+                break
+            await asyncio.sleep(0.5)
+    elapsed = time.perf_counter() - started
+    return {
+        "recipients": args.recipients,
+        "shards": args.shards,
+        "status": progress["status"],
+        "sent": progress.get("sent"),
+        "failed": progress.get("failed"),
+        "received_by_sink": sink.received,
+        "seconds": round(elapsed, 2),
+        "messages_per_sec": round(sink.received / elapsed, 1) if elapsed else None,
+        "db_connections": sampler.result(),
+    }
+
+
+async def bench_track(client: httpx.AsyncClient, ids: list[str], database, args) -> dict:
+    """Open-loop click replay: a steady trickle plus periodic bursts (e.g. right after a mail wave).
+
+    Each simulated recipient opens the mail (sometimes several times), and a
+    share of them goes on to the info page, submits it, and runs the attachment.
+    """
+    latencies: dict[str, list[float]] = {e: [] for e in TRACK_ENDPOINTS}
+    statuses: dict[str, Counter] = {e: Counter() for e in TRACK_ENDPOINTS}
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async def hit(method: str, path: str, rid: str):
+        async with gate:
+            started = time.perf_counter()
+            try:
+                r = await client.request(method, path, params={"id": rid}, follow_redirects=False)
+                statuses[path][r.status_code] += 1
+            except httpx.HTTPError as e:
+                statuses[path][type(e).__name__] += 1
+            latencies[path].append(time.perf_counter() - started)
+
+    async def session(rid: str):
+        for _ in range(1 + (random.random() < 0.3)):  # 30% 는 메일을 두 번 열어봄
+            await hit("GET", "/track", rid)
+        if random.random() < args.funnel:
+            await asyncio.sleep(random.uniform(0.05, 0.5))
+            await hit("GET", "/view-info", rid)
+            if random.random() < args.funnel:
+                await hit("POST", "/submit-info", rid)
+                await hit("GET", "/infect", rid)
+
+    sessions: set[asyncio.Task] = set()
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    next_burst = started + args.burst_every
+    with ConnectionSampler(database) as sampler:
+        while (now := loop.time()) < started + args.duration:
+            batch = 1
+            if now >= next_burst:
+                batch += args.burst_size
+                next_burst += args.burst_every
+            for _ in range(batch):
+                task = loop.create_task(session(random.choice(ids)))
+                sessions.add(task)
+                task.add_done_callback(sessions.discard)
+            await asyncio.sleep(random.expovariate(args.rate))
+        await asyncio.gather(*sessions)
+    duration = loop.time() - started
+    pool = (await client.get("/db/pool-stats")).json()
+    buffer = (await client.get("/events/buffer-stats")).json()
+    endpoints = {}
+    for path in TRACK_ENDPOINTS:
+        stats = latency_stats(latencies[path], duration)
+        codes = statuses[path]
+        stats["errors"] = sum(n for code, n in codes.items() if not isinstance(code, int) or code >= 500)
+        stats["status"] = {str(code): n for code, n in codes.items()}
+        endpoints[path] = stats
+    return {
+        "duration": round(duration, 2),
+        "rps": round(sum(e["requests"] for e in endpoints.values()) / duration, 1),
+        "endpoints": endpoints,
+        "db_connections": sampler.result(),
+        "server_pool": {k: pool[k] for k in ("max_size", "pool_size", "wait_ms_avg", "wait_ms_max", "timeouts")},
+        "event_buffer": {k: buffer.get(k) for k in ("pending", "written", "spilled", "dropped")},
+    }
+
+
+# ───────── 회귀 비교 ─────────
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Throughput down or p99 up by more than `tolerance` (fraction) counts as a regression."""
+    problems = []
+
+    def check(label, now, before, higher_is_better):
+        if now is None or not before:
+            return
+        change = (now - before) / before
+        worse = -change if higher_is_better else change
+        if worse > tolerance:
+            problems.append(f"{label}: {before} → {now} ({change:+.0%})")
+
+    s_now, s_before = current.get("send", {}), baseline.get("send", {})
+    check("send messages/s", s_now.get("messages_per_sec"), s_before.get("messages_per_sec"), True)
+    t_now, t_before = current.get("track", {}), baseline.get("track", {})
+    check("track rps", t_now.get("rps"), t_before.get("rps"), True)
+    for path in TRACK_ENDPOINTS:
+        now, before = t_now.get("endpoints", {}).get(path, {}), t_before.get("endpoints", {}).get(path, {})
+        check(f"{path} p99_ms", now.get("p99_ms"), before.get("p99_ms"), False)
+    return problems
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> dict:
+    sink = SinkHandler()
+    smtp = Controller(sink, hostname="127.0.0.1", port=args.smtp_port)
+    smtp.start()
+    try:
+        with ThrowawayDatabase(keep=args.keep_db) as database, tempfile.TemporaryDirectory() as workdir:
+            base = f"http://127.0.0.1:{args.port}"
+            env = {
+                **os.environ,
+                "DATABASE_URL": database.url,
+                "SMTP_HOST": "127.0.0.1",
+                "SMTP_PORT": str(args.smtp_port),
+                "SMTP_STARTTLS": "false",
+                "SMTP_FROM": "bench@example.com",
+                "SMTP_RATE_PER_SEC": "0",
+                "JOBS_DIR": os.path.join(workdir, "jobs"),
+                "EVENT_SPILL_FILE": os.path.join(workdir, "events_spill.jsonl"),
+                # 부하는 한 IP 에서 나가고 같은 수신자를 반복하므로 수집 필터는 끄고 기록 경로 자체를 측정
+                "TRACK_IP_RATE": "0",
+                "TRACK_DEDUPE_TTL": "0",
+            }
+            for key in ("SMTP_USER", "SMTP_PASSWORD"):  # 싱크는 인증 없음
+                env.pop(key, None)
+            proc = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+                 "--workers", str(args.workers), "--log-level", "warning"],
+                cwd=ROOT, env=env,
+            )
+            try:
+                await wait_ready(base)
+                limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+                async with httpx.AsyncClient(base_url=base, limits=limits, timeout=30) as client:
+                    (await client.post("/start-training")).raise_for_status()
+                    await asyncio.sleep(1)  # 다른 워커로 NOTIFY 전파 대기
+                    result = {"send": await bench_send(client, sink, database, args, workdir)}
+                    print(json.dumps({"send": result["send"]}, ensure_ascii=False))
+                    ids = recipient_ids(database)
+                    result["track"] = await bench_track(client, ids, database, args)
+                    print(json.dumps({"track": result["track"]}, ensure_ascii=False))
+                return result
+            finally:
+                proc.terminate()
+                proc.wait(timeout=15)
+    finally:
+        smtp.stop()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--recipients", type=int, default=5000)
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--template", default="sample_email_step3.html")
+    parser.add_argument("--duration", type=float, default=20, help="tracking replay length (s)")
+    parser.add_argument("--rate", type=float, default=100, help="steady recipient sessions per second")
+    parser.add_argument("--burst-every", type=float, default=5, help="seconds between click bursts")
+    parser.add_argument("--burst-size", type=int, default=500, help="sessions started at once per burst")
+    parser.add_argument("--funnel", type=float, default=0.3, help="share moving on to each next step")
+    parser.add_argument("--concurrency", type=int, default=200, help="max in-flight HTTP requests")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--smtp-port", type=int, default=8025)
+    parser.add_argument("--keep-db", action="store_true", help="do not drop the throwaway database")
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--compare", default=None, help="earlier result JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    result = {
+        "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "keep_db")},
+        **await run(args),
+    }
+    out = args.out or os.path.join(ROOT, "bench", "results", f"load_suite_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"saved {out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            problems = compare(result, json.load(f), args.tolerance)
+        for p in problems:
+            print(f"REGRESSION {p}")
+        if problems:
+            sys.exit(1)
+        print(f"no regression vs {args.compare}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
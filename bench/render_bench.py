@@ -0,0 +1,81 @@
+"""Benchmark: campaign messages rendered per second.
+
+Compares the previous per-recipient path (Jinja render + EmailMessage +
+as_bytes) with render.MessageBuilder in-process and over a process pool.
+
+    python bench/render_bench.py --template sample_email_step2.html --count 20000 --processes 4
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+from email.message import EmailMessage
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from jinja2 import Environment, FileSystemLoader  # noqa: E402
+
+import render  # noqa: E402
+
+SUBJECT = "[중요] 의심스러운 로그인 시도가 차단됨"
+CONTEXT = {"training_mode": 2, "server_base": "http://127.0.0.1:8000"}
+
+
+def recipients(count: int):
+    return [(f"user{i}@example.com", {"name": f"사용자{i}", "uuid": str(uuid.uuid4())}) for i in range(count)]
+
+
+def naive(env, template_name, items):
+    template = env.get_template(template_name)
+    for to, values in items:
+        html = template.render(**CONTEXT, **values)
+        msg = EmailMessage()
+        msg["Subject"] = SUBJECT
+        msg["From"] = "security@example.com"
+        msg["To"] = to
+        msg.set_content("HTML 미지원 메일입니다.")
+        msg.add_alternative(html, subtype="html")
+        msg.as_bytes()
+
+
+def timed(fn) -> float:
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--template", default="sample_email_step2.html")
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--out", default="bench/results/render.json")
+    args = parser.parse_args()
+
+    env = Environment(loader=FileSystemLoader(os.path.join(ROOT, "templates")))
+    items = recipients(args.count)
+    builder = render.MessageBuilder(env, args.template, SUBJECT, "security@example.com", CONTEXT)
+
+    results = {"template": args.template, "count": args.count, "precompiled": builder.precompiled}
+    results["naive_msgs_per_sec"] = round(args.count / timed(lambda: naive(env, args.template, items)), 1)
+    results["builder_msgs_per_sec"] = round(args.count / timed(lambda: builder.build_chunk(items)), 1)
+
+    render.RENDER_PROCESSES = args.processes
+    render._pool()  # 워커 기동 시간은 측정에서 제외
+    asyncio.run(builder.build_many(items[:render.RENDER_CHUNK * 2]))
+    elapsed = timed(lambda: asyncio.run(builder.build_many(items)))
+    results[f"builder_pool{args.processes}_msgs_per_sec"] = round(args.count / elapsed, 1)
+    render.shutdown()
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
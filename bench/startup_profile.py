@@ -0,0 +1,162 @@
+"""Cold-start profile: import-time breakdown and launch wall time vs. a budget.
+
+Targets (each run in fresh interpreters so nothing is cached in-process):
+
+  server — `import main` (what uvicorn / the control panel pays before the
+           first request can be served; no DB connection is opened)
+  gui    — server_gui.py until the control panel window is first idle
+           (GUI_EXIT_AFTER_STARTUP=1; needs a display)
+  exe    — a packaged build given with --exe (PyInstaller bundle), wall time
+           only; the same exit-after-startup variable is set
+
+For each target the median / max wall time over --runs launches is compared
+with its budget (--budget name=ms), and a `python -X importtime` run is
+folded into self time per top-level package and cumulative time per direct
+import. Results go to bench/results/startup_<time>.json; any target over
+budget makes the exit code 1.
+
+    python bench/startup_profile.py
+    python bench/startup_profile.py --targets server --runs 10 --budget server=800
+    python bench/startup_profile.py --exe dist/PhishingTrainer/PhishingTrainer.exe
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 기본 예산(ms) — 측정 환경에 맞춰 --budget 으로 조정
+BUDGET_MS = {"server": 1500, "gui": 2500, "exe": 5000}
+TOP_N = 15
+
+
+def target_command(name: str, args) -> tuple[list[str], int] | None:
+    """(argv, depth of the target's direct imports in -X importtime output)."""
+    if name == "server":
+        return [sys.executable, "-c", "import main"], 1
+    if name == "gui":
+        return [sys.executable, os.path.join(ROOT, "server_gui.py")], 1  # 창 구성은 control_panel 에서
+    if name == "exe" and args.exe:
+        return [args.exe], 0
+    return None
+
+
+def launch_env() -> dict:
+    return {**os.environ, "GUI_EXIT_AFTER_STARTUP": "1"}
+
+
+# ───────── 측정 ─────────
+def wall_times(argv: list[str], runs: int, timeout: float) -> list[float]:
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(argv, cwd=ROOT, env=launch_env(), check=True, timeout=timeout,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        times.append((time.perf_counter() - started) * 1000)
+    return times
+
+
+def import_profile(argv: list[str], direct_depth: int, timeout: float) -> dict:
+    """Run once under -X importtime and fold the tree into per-package / per-direct-import totals."""
+    argv = [argv[0], "-X", "importtime", *argv[1:]]
+    proc = subprocess.run(argv, cwd=ROOT, env=launch_env(), timeout=timeout,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    packages: dict[str, float] = defaultdict(float)
+    direct: dict[str, float] = {}
+    total = 0.0
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        module = name.strip()
+        packages[module.split(".")[0]] += int(self_us) / 1000
+        total += int(self_us) / 1000
+        if depth == direct_depth:
+            direct[module] = int(cumulative_us) / 1000
+    top = lambda d: [{"module": k, "ms": round(v, 1)} for k, v in sorted(d.items(), key=lambda kv: -kv[1])[:TOP_N]]
+    return {"import_ms": round(total, 1), "packages": top(packages), "direct": top(direct)}
+
+
+def profile(name: str, args) -> dict:
+    argv, depth = target_command(name, args)
+    times = wall_times(argv, args.runs, args.timeout)
+    result = {
+        "runs": args.runs,
+        "median_ms": round(statistics.median(times), 1),
+        "max_ms": round(max(times), 1),
+        "budget_ms": args.budget.get(name, BUDGET_MS.get(name)),
+    }
+    if name != "exe":
+        result.update(import_profile(argv, depth, args.timeout))
+    result["within_budget"] = result["budget_ms"] is None or result["median_ms"] <= result["budget_ms"]
+    return result
+
+
+def print_report(name: str, r: dict):
+    status = "ok" if r["within_budget"] else "OVER BUDGET"
+    print(f"[{name}] median {r['median_ms']} ms, max {r['max_ms']} ms, budget {r['budget_ms']} ms — {status}")
+    if "packages" in r:
+        print(f"  imports: {r['import_ms']} ms total")
+        for entry in r["direct"]:
+            print(f"    {entry['ms']:>8.1f} ms  {entry['module']}")
+
+
+def parse_budget(values: list[str]) -> dict:
+    budget = {}
+    for value in values:
+        name, _, ms = value.partition("=")
+        budget[name] = float(ms)
+    return budget
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--targets", nargs="+", default=["server", "gui"], choices=["server", "gui", "exe"])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--exe", default=None, help="packaged build to time (adds the exe target)")
+    parser.add_argument("--budget", nargs="*", default=[], help="name=ms, e.g. server=800 gui=2000")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+    args.budget = parse_budget(args.budget)
+    targets = args.targets + (["exe"] if args.exe and "exe" not in args.targets else [])
+
+    result = {"ts": time.strftime("%Y-%m-%dT%H:%M:%S"), "revision": git_revision(),
+              "python": sys.version.split()[0], "targets": {}}
+    for name in targets:
+        if target_command(name, args) is None:
+            continue
+        try:
+            result["targets"][name] = r = profile(name, args)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            # GUI 는 디스플레이가 없으면 실행되지 않음 → 해당 대상만 건너뜀
+            stderr = (getattr(e, "stderr", None) or b"").decode(errors="replace").strip().splitlines()
+            print(f"[{name}] skipped: {stderr[-1] if stderr else e}")
+            continue
+        print_report(name, r)
+
+    out = args.out or os.path.join(ROOT, "bench", "results", f"startup_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"saved {out}")
+    if not all(r["within_budget"] for r in result["targets"].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
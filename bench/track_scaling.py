@@ -0,0 +1,168 @@
+"""Load test: /track throughput as a function of uvicorn worker count.
+
+Starts `uvicorn main:app --workers N` for each N, opens a fresh training,
+seeds recipients directly in Postgres, fires /track hits for a fixed
+duration and reports throughput, latency and how many clicks were
+recorded in the DB. Run it against a throwaway database:
+
+    DATABASE_URL=postgresql://... python bench/track_scaling.py --workers 1 2 4
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import asyncio
+import subprocess
+from datetime import datetime, timedelta
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db  # noqa: E402
+
+
+def campaign_id(conn, table: str) -> int:
+    return conn.execute("SELECT id FROM campaigns WHERE name = %s", (table,)).fetchone()[0]
+
+
+def seed_recipients(table: str, count: int) -> list[str]:
+    ids = [str(uuid.uuid4()) for _ in range(count)]
+    # 발송 시각을 충분히 과거로 — 요약이 발송 직후(스캐너) 판별을 위해 기다리거나 요청을 제외하지 않도록
+    sent_at = datetime.now() - timedelta(hours=1)
+    with db.get_connection() as conn:
+        cid = campaign_id(conn, table)
+        with conn.cursor() as cur:
+            with cur.copy("COPY recipients (campaign_id, id, name, email, sent_at) FROM STDIN") as copy:
+                for i, rid in enumerate(ids):
+                    copy.write_row((cid, rid, f"user{i}", f"user{i}@example.com", sent_at))
+    return ids
+
+
+def clicked_count(table: str) -> int:
+    with db.get_connection() as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM recipients WHERE campaign_id = %s AND clicked_at IS NOT NULL",
+            (campaign_id(conn, table),),
+        ).fetchone()[0]
+
+
+async def wait_summarized(table: str, timeout: float = 60):
+    """Wait until every buffered hit is written and folded into the recipient summaries."""
+    deadline = time.monotonic() + timeout
+    last = None
+    while time.monotonic() < deadline:
+        with db.get_connection() as conn:
+            state = conn.execute(
+                "SELECT (SELECT COUNT(*) FROM events WHERE campaign_id = c.id),"
+                " c.summarized_xid > COALESCE((SELECT max(xid) FROM events WHERE campaign_id = c.id), '0')"
+                " FROM campaigns c WHERE c.name = %s",
+                (table,),
+            ).fetchone()
+        # 이벤트 수가 한 주기 동안 그대로이고(버퍼 flush 완료) 워터마크가 마지막 이벤트를 지났으면 끝
+        if state == last and state[1]:
+            return
+        last = state
+        await asyncio.sleep(float(os.getenv("EVENT_FLUSH_INTERVAL", "1")) + float(os.getenv("SUMMARY_INTERVAL", "1")))
+    print(f"warning: summaries of {table} not caught up after {timeout:.0f}s", file=sys.stderr)
+
+
+async def wait_ready(base: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{base}/db/pool-stats")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.3)
+    raise RuntimeError("server did not start")
+
+
+async def hammer(base: str, ids: list[str], duration: float, concurrency: int) -> dict:
+    latencies, errors = [], 0
+    stop_at = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=10) as client:
+        async def user():
+            nonlocal errors
+            while time.monotonic() < stop_at:
+                started = time.perf_counter()
+                try:
+                    r = await client.get("/track", params={"id": random.choice(ids)})
+                    if r.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+    latencies.sort()
+    n = len(latencies)
+    return {
+        "requests": n,
+        "errors": errors,
+        "rps": round(n / duration, 1),
+        "p50_ms": round(latencies[n // 2] * 1000, 2) if n else None,
+        "p99_ms": round(latencies[min(n - 1, int(n * 0.99))] * 1000, 2) if n else None,
+    }
+
+
+async def run_one(workers: int, args) -> dict:
+    base = f"http://127.0.0.1:{args.port}"
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT,
+        # 부하는 한 IP 에서 나가고 같은 수신자를 반복하므로 수집 필터는 끄고 기록 경로 자체를 측정
+        env={**os.environ, "TRACK_IP_RATE": "0", "TRACK_DEDUPE_TTL": "0"},
+    )
+    try:
+        await wait_ready(base)
+        async with httpx.AsyncClient(base_url=base) as client:
+            await client.post("/start-training")
+            await asyncio.sleep(1)  # 다른 워커로 NOTIFY 전파 대기
+        with db.get_connection() as conn:
+            table = conn.execute("SELECT table_name FROM training_state WHERE id = 1").fetchone()[0]
+        ids = seed_recipients(table, args.recipients)
+        result = await hammer(base, ids, args.duration, args.concurrency)
+        # 버퍼 flush + 수신자 요약 갱신까지 대기
+        await wait_summarized(table)
+        result.update(workers=workers, table=table, clicked_in_db=clicked_count(table))
+        return result
+    finally:
+        proc.terminate()
+        proc.wait(timeout=15)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--recipients", type=int, default=5000)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--out", default="bench/results/track_scaling.json")
+    args = parser.parse_args()
+
+    results = []
+    for n in args.workers:
+        result = await run_one(n, args)
+        print(json.dumps(result, ensure_ascii=False))
+        results.append(result)
+
+    base_rps = results[0]["rps"] or 1
+    for r in results:
+        r["speedup"] = round(r["rps"] / base_rps, 2)
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({"ts": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"saved {args.out}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
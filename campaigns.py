@@ -0,0 +1,141 @@
+import db
+
+# ───────── 정규화 스키마 ─────────
+# 훈련(campaign)마다 테이블을 만드는 대신 campaigns / recipients / events 세 테이블을 두고,
+# recipients·events 는 campaign_id 로 LIST 파티셔닝한다 (훈련 하나 = 파티션 하나).
+# 모든 쿼리는 고정 SQL + campaign_id 파라미터라 prepared statement 캐시가 그대로 재사용된다.
+# 훈련 이름은 이전 버전의 테이블 이름 규칙(phishing_click_logs_<시각>, 종료 시 *_locked)을 유지한다.
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS campaigns (
+        id          BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+        name        TEXT NOT NULL UNIQUE,
+        started_at  TIMESTAMP NOT NULL DEFAULT now(),
+        ended_at    TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS recipients (
+        campaign_id     BIGINT NOT NULL REFERENCES campaigns (id),
+        id              UUID NOT NULL,
+        employee_no     TEXT,
+        name            TEXT,
+        email           TEXT,
+        department      TEXT,
+        title           TEXT,
+        ip_address      TEXT,
+        user_agent      TEXT,
+        referer         TEXT,
+        accept_language TEXT,
+        clicked_at      TIMESTAMP,
+        infected_at     TIMESTAMP,
+        PRIMARY KEY (campaign_id, id)
+    ) PARTITION BY LIST (campaign_id)
+    """,
+    # 파티션 테이블에 만든 인덱스는 모든 파티션에 자동 생성됨
+    "CREATE INDEX IF NOT EXISTS recipients_clicked_idx ON recipients (campaign_id, clicked_at DESC NULLS LAST, id)",
+    "CREATE INDEX IF NOT EXISTS recipients_infected_idx ON recipients (campaign_id, infected_at)",
+    "CREATE INDEX IF NOT EXISTS recipients_department_idx ON recipients (campaign_id, department)",
+    """
+    CREATE TABLE IF NOT EXISTS events (
+        campaign_id     BIGINT NOT NULL REFERENCES campaigns (id),
+        recipient_id    UUID NOT NULL,
+        kind            TEXT NOT NULL,
+        occurred_at     TIMESTAMP NOT NULL,
+        ip_address      TEXT,
+        user_agent      TEXT,
+        referer         TEXT,
+        accept_language TEXT
+    ) PARTITION BY LIST (campaign_id)
+    """,
+    "CREATE INDEX IF NOT EXISTS events_recipient_idx ON events (campaign_id, recipient_id, occurred_at)",
+    "CREATE INDEX IF NOT EXISTS events_time_idx ON events (campaign_id, occurred_at)",
+    # 수신자별 요약 (summaries.py 가 events 에서 증분 갱신, 기존 설치 대비 ALTER 로 추가)
+    "ALTER TABLE recipients ADD COLUMN IF NOT EXISTS open_count INT NOT NULL DEFAULT 0",
+    "ALTER TABLE recipients ADD COLUMN IF NOT EXISTS infect_count INT NOT NULL DEFAULT 0",
+    "ALTER TABLE recipients ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMP",
+    # 메일 발송 시각 (발송→열람 소요 시간 분석용, 발송 작업이 배치로 기록)
+    "ALTER TABLE recipients ADD COLUMN IF NOT EXISTS sent_at TIMESTAMP",
+    # 이벤트를 기록한 트랜잭션 ID — 요약 갱신 워터마크 (PostgreSQL 13+)
+    "ALTER TABLE events ADD COLUMN IF NOT EXISTS xid XID8 NOT NULL DEFAULT pg_current_xact_id()",
+    "CREATE INDEX IF NOT EXISTS events_xid_idx ON events (campaign_id, xid)",
+    "ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS summarized_xid XID8 NOT NULL DEFAULT '0'",
+    # 메일 스캐너로 판별된 요청의 사유 (trackfilter.py, NULL = 일반 요청) — 요약·집계에서 제외
+    "ALTER TABLE events ADD COLUMN IF NOT EXISTS scanner TEXT",
+    # 보관(archive.py): Parquet 로 내보낸 시각 / 내보낸 뒤 recipients·events 파티션을 삭제했는지
+    "ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP",
+    "ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS archive_dropped BOOLEAN NOT NULL DEFAULT false",
+]
+
+_ids: dict[str, int] = {}  # 훈련 이름 → campaign_id (id 는 바뀌지 않으므로 무효화 불필요)
+
+
+async def create_schema():
+    async with db.connection() as conn:
+        for ddl in SCHEMA:
+            await conn.execute(ddl)
+
+
+async def _create_partitions(conn, campaign_id: int):
+    # DDL 은 파라미터를 받을 수 없으므로 정수 id 만 문자열로 넣음
+    cid = int(campaign_id)
+    await conn.execute(f"CREATE TABLE IF NOT EXISTS recipients_c{cid} PARTITION OF recipients FOR VALUES IN ({cid})")
+    await conn.execute(f"CREATE TABLE IF NOT EXISTS events_c{cid} PARTITION OF events FOR VALUES IN ({cid})")
+
+
+async def create(name: str, started_at=None, ended_at=None, conn=None) -> int:
+    """Register a campaign and its partitions; returns the campaign id (idempotent by name)."""
+    async def _create(conn):
+        cur = await conn.execute(
+            """
+            INSERT INTO campaigns (name, started_at, ended_at)
+            VALUES (%s, COALESCE(%s, now()), %s)
+            ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
+            RETURNING id
+            """,
+            (name, started_at, ended_at),
+        )
+        (campaign_id,) = await cur.fetchone()
+        await _create_partitions(conn, campaign_id)
+        return campaign_id
+
+    if conn is not None:
+        campaign_id = await _create(conn)
+    else:
+        async with db.connection() as conn:
+            campaign_id = await _create(conn)
+    _ids[name] = campaign_id
+    return campaign_id
+
+
+async def end(name: str) -> str:
+    """Close a campaign: stamp ended_at and rename it to *_locked; returns the new name."""
+    locked = f"{name}_locked"
+    row = await db.fetch_one(
+        "UPDATE campaigns SET name = %s, ended_at = now() WHERE name = %s AND ended_at IS NULL RETURNING id",
+        (locked, name),
+    )
+    if row is None:
+        raise LookupError(f"진행 중인 훈련 없음: {name}")
+    _ids[locked] = row[0]
+    return locked
+
+
+async def campaign_id(name: str) -> int | None:
+    """Id of the campaign called `name`; cached, DB lookup only on a miss."""
+    cid = _ids.get(name)
+    if cid is None:
+        row = await db.fetch_one("SELECT id FROM campaigns WHERE name = %s", (name,), prepare=True)
+        if row is None:
+            return None
+        cid = _ids[name] = row[0]
+    return cid
+
+
+async def active_id(conn, name: str) -> int | None:
+    """Id of `name` only while it is still running (checked in the DB, not the cache)."""
+    cur = await conn.execute(
+        "SELECT id FROM campaigns WHERE name = %s AND ended_at IS NULL", (name,), prepare=True
+    )
+    row = await cur.fetchone()
+    return row[0] if row else None
@@ -0,0 +1,538 @@
+"""Control panel window (started through server_gui.py)."""
+import customtkinter as ctk
+import threading
+import os, sys
+from tkinter import filedialog
+from datetime import datetime
+import tkinter as tk
+
+from api_client import ApiClient
+
+# 시작 시간을 줄이기 위해 필요할 때만 로드하는 모듈:
+#   uvicorn·main(서버)   → 서버 시작 시 (서버 스레드에서)
+#   jinja2·webbrowser    → 템플릿 미리보기 시
+#   recipient_csv        → CSV 선택·미리보기 시 (작업 스레드에서, DB 계층은 불러오지 않음)
+#   PIL(로고)            → 창이 뜬 뒤
+
+# ───────── 설정 ─────────
+SERVER_HOST = "192.168.100.81"
+SERVER_PORT = 8000
+SERVER_BASE = f"http://{SERVER_HOST}:{SERVER_PORT}"
+
+# ───────── 경로 헬퍼 ─────────
+def resource_path(relative: str) -> str:
+    """Return absolute path to resource, compatible with PyInstaller"""
+    base = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base, relative)
+
+# Directory containing the server code
+BASE_DIR = os.path.dirname(resource_path("main.py"))
+
+# ───────── 상태 변수 ─────────
+server = None          # uvicorn.Server instance
+server_thread = None
+running = False
+csv_path = "spam.csv"
+csv_total = 0
+training_mode = 2   # 기본 2단계
+current_job_id = None  # 진행 중인 발송 작업 ID
+live_call = None       # /live/stream 구독 (서버 중지 시 취소)
+job_poll = None        # 진행 중인 작업 현황 요청 (겹쳐서 보내지 않음)
+STATUS_POLL_MS = 2000
+
+# ───────── GUI 초기화 ─────────
+ctk.set_appearance_mode("dark")
+ctk.set_default_color_theme("blue")
+app = ctk.CTk()
+app.title("Phishing Trainer 제어판")
+app.geometry("480x880")
+
+# API 호출은 백그라운드 스레드의 keep-alive 세션에서, 결과는 메인 스레드에서 처리
+api = ApiClient(SERVER_BASE)
+api.attach(app)
+
+# ───────── 템플릿 로딩 ─────────
+# 목록은 창이 뜬 뒤 채움 (refresh_templates), Jinja 환경은 첫 미리보기 때 생성
+template_dir = resource_path("templates")
+template_env = None
+template_files: list[str] = []
+selected_template = ctk.StringVar(value="(없음)")
+selected_info_template = ctk.StringVar(value="(없음)")
+
+# ───────── 로그창 ─────────
+log_box = ctk.CTkTextbox(app, width=440, height=200, font=("맑은 고딕", 11))
+def log(msg: str):
+    log_box.insert("end", f"{msg}\n")
+    log_box.see("end")
+
+# ───────── 서버 상태 ─────────
+status_label = ctk.CTkLabel(app, text="서버 중지됨", text_color="red", font=("맑은 고딕", 16))
+status_label.pack(pady=10)
+
+# ───────── 서버 제어 그룹 ─────────
+server_frame = ctk.CTkFrame(app)
+server_frame.pack(pady=5)
+
+# (row 0) 서버 시작/중지
+ctk.CTkButton(server_frame, text="서버 시작",
+              command=lambda: start_server()).grid(row=0, column=0, padx=5)
+ctk.CTkButton(server_frame, text="서버 중지",
+              command=lambda: stop_server()).grid(row=0, column=1, padx=5)
+
+# 훈련 모드 토글 함수
+def set_mode(mode: int):
+    global training_mode
+    training_mode = mode
+    if mode == 2:
+        step2_btn.configure(state="disabled")
+        step3_btn.configure(state="normal")
+        info_template_menu.configure(state="disabled")
+    else:
+        step2_btn.configure(state="normal")
+        step3_btn.configure(state="disabled")
+        info_template_menu.configure(state="normal")
+    mode_label.configure(text=f"현재 모드: {mode}단계")
+    log(f"🔧 훈련 모드 설정: {mode}단계")
+
+# (row 1) 2단계 / 3단계 버튼
+step2_btn = ctk.CTkButton(server_frame, text="2단계(열람/감염)",
+                          width=200, command=lambda: set_mode(2))
+step3_btn = ctk.CTkButton(server_frame, text="3단계(열람/개인정보/감염)",
+                          width=200, command=lambda: set_mode(3))
+step2_btn.grid(row=1, column=0, padx=5, pady=3)
+step3_btn.grid(row=1, column=1, padx=5, pady=3)
+step2_btn.configure(state="disabled")          # 기본 2단계
+mode_label = ctk.CTkLabel(server_frame, text="현재 모드: 2단계")
+mode_label.grid(row=2, column=0, columnspan=2, pady=(0,5))
+
+ctk.CTkLabel(app, text="──────────────────────────────────────",
+             text_color="gray").pack(pady=5)
+
+# ───────── 수신자·템플릿 선택 ─────────
+input_frame = ctk.CTkFrame(app)
+input_frame.pack(pady=5)
+ctk.CTkButton(input_frame, text="📁 수신자 CSV 선택",
+              command=lambda: select_csv()).pack(pady=3)
+csv_label = ctk.CTkLabel(input_frame, text="📄 대상자 수: 알 수 없음",
+                         font=("맑은 고딕", 12))
+csv_label.pack()
+
+ctk.CTkLabel(input_frame, text="📁 메일 템플릿 선택",
+             font=("맑은 고딕", 13)).pack(pady=(10,2))
+template_menu = ctk.CTkOptionMenu(input_frame, values=template_files,
+                                  variable=selected_template)
+template_menu.pack(pady=(0,5))
+ctk.CTkLabel(input_frame, text="📁 개인정보 입력 템플릿",
+             font=("맑은 고딕", 13)).pack(pady=(10,2))
+info_template_menu = ctk.CTkOptionMenu(input_frame, values=template_files,
+                                       variable=selected_info_template)
+info_template_menu.pack(pady=(0,5))
+info_template_menu.configure(state="disabled")
+ctk.CTkButton(input_frame, text="🔄 템플릿 목록 새로고침",
+              command=lambda: refresh_templates()).pack(pady=3)
+ctk.CTkButton(input_frame, text="템플릿 미리보기",
+              command=lambda: preview_template()).pack(pady=5)
+
+ctk.CTkButton(input_frame, text="메일 발송 시작",
+              command=lambda: send_emails()).pack(pady=5)
+job_frame = ctk.CTkFrame(input_frame)
+job_frame.pack(pady=(0,5))
+ctk.CTkButton(job_frame, text="⏸ 일시정지", width=90,
+              command=lambda: control_job("pause")).grid(row=0, column=0, padx=3)
+ctk.CTkButton(job_frame, text="▶ 재개", width=90,
+              command=lambda: control_job("resume")).grid(row=0, column=1, padx=3)
+ctk.CTkButton(job_frame, text="⏹ 취소", width=90,
+              command=lambda: control_job("cancel")).grid(row=0, column=2, padx=3)
+job_label = ctk.CTkLabel(input_frame, text="📤 발송 작업: 없음",
+                         font=("맑은 고딕", 12))
+job_label.pack()
+
+# ───────── 감염현황·보고서 그룹 ─────────
+status_frame = ctk.CTkFrame(app)
+status_frame.pack(pady=5)
+ctk.CTkButton(status_frame, text="📊 감염 현황 보기",
+              command=lambda: show_training_status_table()).pack(pady=3)
+ctk.CTkLabel(app, text="──────────────────────────────────────",
+             text_color="gray").pack(pady=5)
+ctk.CTkButton(status_frame, text="📁 결과 보고서 저장",
+              command=lambda: export_final_report()).pack(pady=3)
+
+# ───────── 훈련 제어 그룹 ─────────
+control_frame = ctk.CTkFrame(app)
+control_frame.pack(pady=5)
+ctk.CTkButton(control_frame, text="🆕 새 훈련 시작",
+              command=lambda: reset_training()).pack(pady=3)
+ctk.CTkButton(control_frame, text="📥 훈련 종료 및 잠금",
+              command=lambda: end_training()).pack(pady=3)
+
+# ───────── 감염자 수 ─────────
+infection_label = ctk.CTkLabel(app, text="🦠 감염자 수: --명",
+                               font=("맑은 고딕", 13))
+infection_label.pack(pady=8)
+
+# ───────── 로그 박스 ─────────
+log_box.pack(padx=10, pady=10)
+
+# ───────── 로고 ─────────
+def load_logo():
+    try:
+        from PIL import Image, ImageTk
+        logo = Image.open(resource_path("logo.png")).convert("RGBA").resize((160, 40))
+        logo_img = ImageTk.PhotoImage(logo)
+        logo_label = tk.Label(app, image=logo_img, bg=app.cget("bg"))
+        logo_label.image = logo_img
+        logo_label.place(relx=0.5, rely=1.0, x=0, y=-60, anchor="s")
+    except Exception:
+        log("🔔 로고 로드 실패")
+
+# ───────── 서명 ─────────
+signature_text = "Powered by 윤지환 | 정보보안부문 · 2025.06.20"
+author_label = ctk.CTkLabel(app, text=signature_text,
+                            font=("맑은 고딕", 10), anchor="e",
+                            justify="right")
+author_label.place(relx=1.0, rely=1.0, x=-10, y=-10, anchor="se")
+
+# ───────── 기능 함수 ─────────
+def preview_template():
+    template_name = selected_template.get()
+    if not template_name.endswith(".html"):
+        log("❌ HTML 템플릿만 미리보기 가능")
+        return
+    # 표본 추출·렌더링은 작업 스레드에서 (색인이 없는 큰 CSV 도 창이 멈추지 않음)
+    api.call_in_thread(_render_preview, template_name, csv_path,
+                       on_error=lambda e: log(f"❌ 미리보기 렌더링 실패: {e}"))
+
+def _render_preview(template_name: str, path: str):
+    import webbrowser
+    import recipient_csv
+    from jinja2 import Environment, FileSystemLoader
+    global template_env
+    if template_env is None:
+        template_env = Environment(loader=FileSystemLoader(template_dir))
+    preview_name = "홍길동"
+    preview_uuid = "0000-0000-0000-0000"
+    if os.path.exists(path):
+        # 전체를 읽지 않고 무작위 1명만 표본 추출 (CSV 선택 시 만든 색인이 있으면 바로 탐색)
+        sample = recipient_csv.RecipientSource(path).sample(1)
+        if sample:
+            preview_name = sample[0].get("성명", "홍길동")
+            preview_uuid = "샘플-UUID-1234"
+    template = template_env.get_template(template_name)
+    rendered = template.render(name=preview_name, uuid=preview_uuid)
+    preview_path = os.path.abspath("preview_temp.html")
+    with open(preview_path, "w", encoding="utf-8") as f:
+        f.write(rendered)
+    webbrowser.open("file://" + preview_path)
+
+STATUS_COLUMNS = ["name", "email", "department", "title", "clicked_at", "infected_at"]
+STATUS_HEADERS = ["이름", "이메일", "부서", "직책", "열람 시각", "감염 시각"]
+STATUS_FILTERS = {"전체": None, "미열람": "unopened", "열람": "opened", "감염": "infected"}
+VISIBLE_ROWS = 15
+PAGE_SIZE = 200
+
+class VirtualTable:
+    """Fixed grid of label rows that is re-filled on scroll; pages are fetched lazily."""
+
+    def __init__(self, parent, fetch_page):
+        self.fetch_page = fetch_page   # (cursor, on_done(rows, next_cursor), on_error) → Call
+        self.rows: list[list] = []
+        self.cursor = None
+        self.exhausted = False
+        self.offset = 0
+        self.pending = None            # 진행 중인 페이지 요청
+        frame = ctk.CTkFrame(parent)
+        frame.pack(fill="both", expand=True, padx=5, pady=5)
+        # 창을 닫거나 다시 조회하면 진행 중인 요청 취소
+        frame.bind("<Destroy>", lambda e: self.pending and self.pending.cancel())
+        for i, header in enumerate(STATUS_HEADERS):
+            ctk.CTkLabel(frame, text=header, font=("맑은 고딕", 11, "bold"),
+                         width=150, anchor="center").grid(row=0, column=i)
+        self.cells = [
+            [ctk.CTkLabel(frame, text="", font=("맑은 고딕", 10), width=150, anchor="center")
+             for _ in STATUS_COLUMNS]
+            for _ in range(VISIBLE_ROWS)
+        ]
+        for r, cells in enumerate(self.cells, start=1):
+            for c, cell in enumerate(cells):
+                cell.grid(row=r, column=c)
+        self.scrollbar = ctk.CTkScrollbar(frame, command=self.yview)
+        self.scrollbar.grid(row=0, column=len(STATUS_COLUMNS), rowspan=VISIBLE_ROWS + 1, sticky="ns")
+        parent.winfo_toplevel().bind("<MouseWheel>", lambda e: self.yview("scroll", -1 if e.delta > 0 else 1, "units"))
+        self.count_label = ctk.CTkLabel(parent, text="", font=("맑은 고딕", 10))
+        self.count_label.pack()
+        self.load_more()
+        self.render()
+
+    def load_more(self):
+        if self.exhausted or self.pending:
+            return
+        self.pending = self.fetch_page(self.cursor, self._loaded, self._failed)
+
+    def _loaded(self, rows, cursor):
+        self.pending = None
+        self.rows += rows
+        self.cursor = cursor
+        self.exhausted = cursor is None
+        self.render()
+
+    def _failed(self, e):
+        self.pending = None
+        log(f"❌ 감염현황 불러오기 실패: {e}")
+
+    def yview(self, *args):
+        if args[0] == "moveto":
+            target = int(float(args[1]) * len(self.rows))
+        else:
+            step = int(args[1]) * (VISIBLE_ROWS if args[2] == "pages" else 1)
+            target = self.offset + step
+        # 끝 근처까지 내려오면 다음 페이지를 미리 가져옴
+        if target + VISIBLE_ROWS * 2 >= len(self.rows):
+            self.load_more()
+        self.offset = max(0, min(target, len(self.rows) - VISIBLE_ROWS))
+        self.render()
+
+    def render(self):
+        for i, cells in enumerate(self.cells):
+            index = self.offset + i
+            values = self.rows[index] if index < len(self.rows) else [""] * len(STATUS_COLUMNS)
+            for cell, val in zip(cells, values):
+                cell.configure(text=str(val or ""))
+        n = len(self.rows)
+        if n:
+            self.scrollbar.set(self.offset / n, min(1.0, (self.offset + VISIBLE_ROWS) / n))
+        more = "" if self.exhausted else "+"
+        self.count_label.configure(text=f"{n}{more}건 중 {min(self.offset + 1, n)}~{min(self.offset + VISIBLE_ROWS, n)}")
+
+def fetch_status_page(cursor, on_done, on_error, status=None, department=None):
+    params = {"limit": PAGE_SIZE, "fields": ",".join(STATUS_COLUMNS), "format": "columnar"}
+    if cursor:
+        params["cursor"] = cursor
+    if status:
+        params["status"] = status
+    if department:
+        params["department"] = department
+
+    def done(data):
+        if "data" not in data:
+            on_done([], None)
+            return
+        # 컬럼형 응답을 행 목록으로 변환
+        on_done([list(row) for row in zip(*data["data"])], data.get("next_cursor"))
+    return api.get("/logs/clicks", params=params, on_done=done, on_error=on_error)
+
+def show_training_status_table():
+    window = ctk.CTkToplevel(app)
+    window.title("감염 현황")
+    window.geometry("1000x520")
+    filter_frame = ctk.CTkFrame(window)
+    filter_frame.pack(pady=5)
+    status_var = ctk.StringVar(value="전체")
+    ctk.CTkOptionMenu(filter_frame, values=list(STATUS_FILTERS), variable=status_var,
+                      width=100).grid(row=0, column=0, padx=5)
+    dept_entry = ctk.CTkEntry(filter_frame, placeholder_text="부서", width=160)
+    dept_entry.grid(row=0, column=1, padx=5)
+    table_holder = ctk.CTkFrame(window)
+    table_holder.pack(fill="both", expand=True)
+
+    def load():
+        for child in table_holder.winfo_children():
+            child.destroy()
+        status = STATUS_FILTERS[status_var.get()]
+        department = dept_entry.get().strip() or None
+        VirtualTable(table_holder, lambda cur, done, error: fetch_status_page(cur, done, error, status, department))
+
+    ctk.CTkButton(filter_frame, text="조회", width=80, command=load).grid(row=0, column=2, padx=5)
+    load()
+
+def refresh_templates(announce: bool = True):
+    """Reload template filenames from disk and update the menus."""
+    global template_files
+    try:
+        template_files = [f for f in os.listdir(template_dir) if f.endswith(".html")]
+        template_menu.configure(values=template_files)
+        info_template_menu.configure(values=template_files)
+        if template_files:
+            selected_template.set(template_files[0])
+            selected_info_template.set(template_files[0])
+        if announce:
+            log(f"🔄 템플릿 목록 갱신 완료 ({len(template_files)}개)")
+    except Exception as e:
+        log(f"❌ 템플릿 목록 갱신 실패: {e}")
+
+def _run_server():
+    """Run the FastAPI server using uvicorn in a background thread."""
+    global server
+    prev_cwd = os.getcwd()
+    os.chdir(BASE_DIR)
+    try:
+        import uvicorn
+        import main  # 같은 프로세스에서 앱 객체를 직접 넘김 — 두 번째 시작부터는 이미 로드된 모듈 재사용
+        config = uvicorn.Config(main.app, host="0.0.0.0", port=SERVER_PORT, log_level="info", reload=False)
+        server = uvicorn.Server(config)
+        server.run()
+    finally:
+        os.chdir(prev_cwd)
+
+def start_server():
+    global server_thread, running
+    if running:
+        log("⚠️ 서버가 이미 실행 중입니다.")
+        return
+    try:
+        server_thread = threading.Thread(target=_run_server, daemon=True)
+        server_thread.start()
+        running = True
+        status_label.configure(text="서버 실행 중", text_color="green")
+        log("✅ 서버 시작됨")
+        app.after(STATUS_POLL_MS, update_status)
+        start_live_stream()
+    except Exception as e:
+        log(f"❌ 서버 실행 오류: {e}")
+
+def stop_server():
+    global running, server
+    if live_call:
+        live_call.cancel()
+    if running and server:
+        server.should_exit = True
+        if server_thread:
+            server_thread.join(timeout=5)
+        server = None
+        running = False
+        status_label.configure(text="서버 중지됨", text_color="red")
+        log("🛑 서버 중지됨")
+
+def reset_training():
+    api.post("/start-training",
+             on_done=lambda d: log(f"🆕 새 훈련 시작됨: {d.get('message')}"),
+             on_error=lambda e: log(f"❌ 새 훈련 시작 실패: {e}"))
+
+def end_training():
+    # 종료 시 남은 이벤트 기록·요약 갱신을 기다리므로 타임아웃을 길게
+    api.post("/end-training", timeout=60,
+             on_done=lambda d: log(f"🔒 훈련 종료됨: {d.get('message')}"),
+             on_error=lambda e: log(f"❌ 훈련 종료 실패: {e}"))
+
+def export_final_report():
+    log("📁 보고서 저장 중...")
+    api.post("/export-final-report", timeout=300,
+             on_done=lambda d: log(f"📁 보고서 저장: {d.get('message')}"),
+             on_error=lambda e: log(f"❌ 보고서 저장 실패: {e}"))
+
+def update_status():
+    """Runs on the Tk thread every STATUS_POLL_MS while the server is up."""
+    global running, job_poll
+    if not running:
+        return
+    if server_thread and not server_thread.is_alive():
+        running = False
+        status_label.configure(text="서버 중지됨", text_color="red")
+        log("🛑 서버가 종료되었습니다.")
+        return
+    if current_job_id and (job_poll is None or job_poll.done):
+        job_poll = api.get(f"/jobs/{current_job_id}", on_done=update_job_label, timeout=5)
+    app.after(STATUS_POLL_MS, update_status)
+
+def update_infection_label(stats: dict):
+    count = stats.get("infected", 0)
+    total = stats.get("total") or csv_total
+    rate = round((count / total) * 100, 1) if total else 0.0
+    infection_label.configure(
+        text=f"🦠 감염자 수: {count}명 | 열람 {stats.get('opened', 0)}명\n전체 {total}명 | 감염률 {rate}%"
+    )
+
+def start_live_stream():
+    """Follow the server-sent /live/stream (reconnects until the server is stopped)."""
+    global live_call
+    if live_call:
+        live_call.cancel()
+    live_call = api.stream_events(
+        "/live/stream",
+        on_event=update_infection_label,
+        on_error=lambda e: infection_label.configure(text="❌ 감염자 수: 확인 실패"),
+    )
+
+def _count_csv(path: str) -> int:
+    import recipient_csv
+    source = recipient_csv.RecipientSource(path)
+    source.check()
+    return source.count()  # 스트리밍으로 행 수를 세며 오프셋 색인도 만들어 둠
+
+def select_csv():
+    global csv_path
+    path = filedialog.askopenfilename(filetypes=[("CSV files","*.csv")])
+    if not path:
+        return
+    csv_path = path
+    csv_label.configure(text="📄 대상자 수: 세는 중...")
+    def done(total):
+        global csv_total
+        if path != csv_path:
+            return  # 세는 동안 다른 파일을 선택함
+        csv_total = total
+        csv_label.configure(text=f"📄 대상자 수: 총 {csv_total}명")
+        log(f"📄 CSV 로드 완료: {csv_total}명 대상")
+    def failed(e):
+        if path == csv_path:
+            csv_label.configure(text="📄 대상자 수: 알 수 없음")
+        log(f"❌ CSV 읽기 실패: {e}")
+    # 큰 CSV 는 세는 데 수 초 걸리므로 작업 스레드에서 세고 결과만 Tk 스레드로 전달
+    api.call_in_thread(_count_csv, path, on_done=done, on_error=failed)
+
+def send_emails():
+    if not os.path.exists(csv_path):
+        log("❌ CSV 파일이 존재하지 않습니다.")
+        return
+    try:
+        tpl = selected_template.get()
+        if not os.path.exists(os.path.join(template_dir, tpl)):
+            log("❌ 템플릿 없음")
+            return
+        payload = {
+            "csv_path":      csv_path,
+            "template_name": tpl,
+            "training_mode": training_mode,  # 2 or 3
+            "server_base":   SERVER_BASE,
+            "info_template_name": selected_info_template.get()
+        }
+    except Exception as e:
+        log(f"❌ 메일 발송 실패: {e}")
+        return
+
+    def started(data):
+        global current_job_id
+        current_job_id = data["job_id"]
+        update_job_label(data)
+        log(f"📤 메일 발송 작업 시작: {current_job_id} (총 {data['total']}명)")
+    api.post("/send-emails", json_body=payload, on_done=started,
+             on_error=lambda e: log(f"❌ 메일 발송 실패: {e}"))
+
+def update_job_label(p: dict):
+    eta = f" | 남은시간 {int(p['eta_seconds'])}초" if p.get("eta_seconds") else ""
+    w = p.get("waves")
+    wave = f" | 웨이브 {w['released']}/{w['total']}" if w else ""
+    job_label.configure(
+        text=f"📤 {p['status']} | 성공 {p['sent']} · 실패 {p['failed']} · 대기 {p['queued']}"
+             f" | {p['rate_per_sec']}건/초{eta}{wave}"
+    )
+
+def control_job(action: str):
+    if not current_job_id:
+        log("⚠️ 진행 중인 발송 작업이 없습니다.")
+        return
+    job_id = current_job_id
+
+    def done(data):
+        update_job_label(data)
+        log(f"📤 발송 작업 {action}: {job_id}")
+    api.post(f"/jobs/{job_id}/{action}", on_done=done,
+             on_error=lambda e: log(f"❌ 발송 작업 제어 실패: {e}"))
+
+# ───────── 실행 ─────────
+def run():
+    # 창을 먼저 그린 뒤 나머지를 로드
+    app.after_idle(refresh_templates, False)
+    app.after_idle(load_logo)
+    if os.getenv("GUI_EXIT_AFTER_STARTUP"):
+        app.after_idle(app.destroy)  # bench/startup_profile.py 측정용: 첫 화면 준비 후 종료
+    app.mainloop()
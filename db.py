@@ -0,0 +1,189 @@
+import os
+import asyncio
+import time
+import logging
+from contextlib import asynccontextmanager
+
+import psycopg
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+# ───────── 접속 정보 ─────────
+def conninfo() -> str:
+    if os.getenv("DATABASE_URL"):
+        return os.getenv("DATABASE_URL")
+    return psycopg.conninfo.make_conninfo(
+        host=os.getenv("DB_HOST", "localhost"),
+        port=os.getenv("DB_PORT", "5432"),
+        dbname=os.getenv("DB_NAME", "phishing"),
+        user=os.getenv("DB_USER", "postgres"),
+        password=os.getenv("DB_PASSWORD", ""),
+    )
+
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN", "2"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX", "20"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+
+def get_connection():
+    """Open a standalone synchronous connection (scripts / tools only)."""
+    return psycopg.connect(conninfo())
+
+# ───────── 비동기 커넥션 풀 ─────────
+# 닫힌 AsyncConnectionPool 은 다시 열 수 없으므로 lifespan 마다 open_pool() 에서 새로 만든다
+pool: AsyncConnectionPool | None = None
+
+# 대기 시간 통계 (풀 자체 통계와 별도로 누적, 리셋되지 않음)
+_wait_stats = {"acquired": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+
+async def open_pool():
+    global pool
+    pool = AsyncConnectionPool(
+        conninfo(),
+        min_size=POOL_MIN_SIZE,
+        max_size=POOL_MAX_SIZE,
+        timeout=POOL_TIMEOUT,
+        max_idle=POOL_MAX_IDLE,
+        check=AsyncConnectionPool.check_connection,  # 대여 시 헬스체크
+        open=False,
+    )
+    await pool.open(wait=True, timeout=POOL_TIMEOUT)
+    logging.info("DB pool opened (min=%s, max=%s)", POOL_MIN_SIZE, POOL_MAX_SIZE)
+
+async def close_pool():
+    global pool
+    if pool is None:
+        return
+    await pool.close(timeout=POOL_TIMEOUT)
+    pool = None
+    logging.info("DB pool closed")
+
+@asynccontextmanager
+async def connection():
+    """Borrow a pooled connection; commits on success, rolls back on error."""
+    if pool is None:
+        raise RuntimeError("DB pool is not open")
+    started = time.perf_counter()
+    async with pool.connection() as conn:
+        waited = (time.perf_counter() - started) * 1000
+        _wait_stats["acquired"] += 1
+        _wait_stats["wait_ms_total"] += waited
+        _wait_stats["wait_ms_max"] = max(_wait_stats["wait_ms_max"], waited)
+        yield conn
+
+# 쿼리 문자열이 고정(파라미터만 변경)이면 psycopg 가 연결별로 prepared statement 로 캐시한다.
+# prepare=True 는 첫 실행부터 준비, None 은 psycopg 기본값(같은 쿼리 5회 실행 후 준비)
+async def execute(query: str, params=None, prepare: bool | None = None) -> int:
+    async with connection() as conn:
+        with metrics.db_timer(query):
+            cur = await conn.execute(query, params, prepare=prepare)
+        return cur.rowcount
+
+async def fetch_one(query: str, params=None, prepare: bool | None = None):
+    async with connection() as conn:
+        with metrics.db_timer(query):
+            cur = await conn.execute(query, params, prepare=prepare)
+            return await cur.fetchone()
+
+async def fetch_all(query: str, params=None, dict_rows: bool = False, prepare: bool | None = None):
+    async with connection() as conn:
+        cur = conn.cursor(row_factory=dict_row) if dict_rows else conn.cursor()
+        async with cur:
+            with metrics.db_timer(query):
+                await cur.execute(query, params, prepare=prepare)
+                return await cur.fetchall()
+
+# ───────── 풀 상태 ─────────
+def pool_stats() -> dict:
+    stats = pool.get_stats() if pool else {}
+    size = stats.get("pool_size", 0)
+    available = stats.get("pool_available", 0)
+    in_use = size - available
+    acquired = _wait_stats["acquired"]
+    return {
+        "min_size": POOL_MIN_SIZE,
+        "max_size": POOL_MAX_SIZE,
+        "pool_size": size,
+        "in_use": in_use,
+        "available": available,
+        "waiting": stats.get("requests_waiting", 0),
+        "saturation": round(in_use / POOL_MAX_SIZE, 3) if POOL_MAX_SIZE else 0.0,
+        "acquired_total": acquired,
+        "wait_ms_avg": round(_wait_stats["wait_ms_total"] / acquired, 3) if acquired else 0.0,
+        "wait_ms_max": round(_wait_stats["wait_ms_max"], 3),
+        "timeouts": stats.get("requests_errors", 0),
+        "connections_errors": stats.get("connections_errors", 0),
+        "connections_lost": stats.get("connections_lost", 0),
+    }
+
+# ───────── LISTEN / NOTIFY (워커 간 변경 전파) ─────────
+LISTEN_RESYNC_INTERVAL = float(os.getenv("TRAINING_STATE_RESYNC", "30"))  # 알림 유실 대비 주기적 재동기화(초)
+
+_subscribers: dict[str, list] = {}   # channel → [callback(payload: str)]
+_resync_callbacks: list = []          # 재접속 / 주기적으로 호출되는 async callback
+_listener: asyncio.Task | None = None
+
+def subscribe(channel: str, callback, resync=None):
+    """Register a callback for NOTIFY payloads on `channel` (call before start_listener)."""
+    _subscribers.setdefault(channel, []).append(callback)
+    if resync:
+        _resync_callbacks.append(resync)
+
+async def notify(conn, channel: str, payload: str):
+    # 트랜잭션 안에서 호출하면 커밋 시점에 전달됨
+    await conn.execute("SELECT pg_notify(%s, %s)", (channel, payload))
+
+async def _resync():
+    for cb in _resync_callbacks:
+        try:
+            await cb()
+        except Exception as e:
+            logging.error("resync error: %s", e)
+
+async def _listen():
+    backoff = 1.0
+    while True:
+        try:
+            # LISTEN 은 세션에 묶이므로 풀이 아닌 전용 연결을 사용
+            async with await psycopg.AsyncConnection.connect(conninfo(), autocommit=True) as conn:
+                for channel in _subscribers:
+                    await conn.execute(f"LISTEN {channel}")
+                await _resync()  # 연결이 끊긴 동안 놓친 변경 반영
+                backoff = 1.0
+                while True:
+                    async for n in conn.notifies(timeout=LISTEN_RESYNC_INTERVAL):
+                        for cb in _subscribers.get(n.channel, []):
+                            try:
+                                cb(n.payload)
+                            except Exception as e:
+                                logging.error("notify handler error (%s): %s", n.channel, e)
+                    await _resync()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error("listener error: %s", e)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+def start_listener():
+    global _listener
+    if _subscribers and _listener is None:
+        _listener = asyncio.create_task(_listen(), name="db-listener")
+
+async def stop_listener():
+    global _listener
+    if _listener:
+        _listener.cancel()
+        try:
+            await _listener
+        except asyncio.CancelledError:
+            pass
+        _listener = None
+    # 다음 lifespan 에서 모듈들이 다시 subscribe() 하므로 등록을 비워 중복 호출을 막음
+    _subscribers.clear()
+    _resync_callbacks.clear()
@@ -0,0 +1,203 @@
+import os
+import json
+import uuid
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+
+import db
+import metrics
+import campaigns
+
+# ───────── 버퍼 설정 ─────────
+EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "500"))         # 이 개수가 쌓이면 즉시 flush
+EVENT_FLUSH_INTERVAL = float(os.getenv("EVENT_FLUSH_INTERVAL", "1"))  # 최대 flush 간격(초)
+EVENT_BUFFER_MAX = int(os.getenv("EVENT_BUFFER_MAX", "50000"))       # 메모리 버퍼 상한, 초과분은 디스크로
+EVENT_SPILL_FILE = os.getenv("EVENT_SPILL_FILE", "events_spill.jsonl")
+
+CLICK, INFECT = "click", "infect"
+FIELDS = ("kind", "table", "id", "ts", "ip", "ua", "ref", "lang", "scanner")
+
+
+def from_request(kind: str, table: str, id, request, scanner: str = "") -> tuple:
+    return (
+        kind,
+        table,
+        str(id),
+        datetime.now(),
+        request.client.host if request.client else "",
+        request.headers.get("user-agent", ""),
+        request.headers.get("referer", ""),
+        request.headers.get("accept-language", ""),
+        scanner,  # trackfilter 판별 사유 ("" = 일반 요청)
+    )
+
+
+def _dump(event: tuple) -> str:
+    data = dict(zip(FIELDS, event))
+    data["ts"] = data["ts"].isoformat()
+    return json.dumps(data, ensure_ascii=False)
+
+
+def _load(line: str) -> tuple:
+    data = json.loads(line)
+    data["ts"] = datetime.fromisoformat(data["ts"])
+    data.setdefault("scanner", "")  # 이전 버전 저널
+    return tuple(data[f] for f in FIELDS)
+
+
+async def _append(conn, campaign_id: int, events: list[tuple]):
+    """Append the raw hits to the campaign's events partition (COPY, no row updates)."""
+    with metrics.db_timer("COPY"):
+        async with conn.cursor() as cur:
+            async with cur.copy(
+                "COPY events (campaign_id, recipient_id, kind, occurred_at, ip_address, user_agent, referer, accept_language,"
+                " scanner) FROM STDIN"
+            ) as copy:
+                for e in events:
+                    await copy.write_row((campaign_id, e[2], e[0], e[3], e[4], e[5], e[6], e[7], e[8] or None))
+
+
+class EventBuffer:
+    """In-process write-behind buffer for tracking hits.
+
+    Hits are appended in memory and written in batches by a background task.
+    Writes only append to `events`; the per-recipient state in `recipients`
+    is folded in separately by summaries.SummaryRefresher. Batches that cannot be written (DB outage, shutdown) are appended to a
+    JSONL spill journal and replayed once the database is reachable again.
+    """
+
+    def __init__(self, batch_size=EVENT_BATCH_SIZE, flush_interval=EVENT_FLUSH_INTERVAL,
+                 max_size=EVENT_BUFFER_MAX, spill_file=EVENT_SPILL_FILE):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.spill_file = spill_file
+        self._queue: deque[tuple] = deque()
+        # 이벤트 루프에 묶이므로 start() 에서 생성 (제어판은 같은 프로세스에서 서버를 다시 시작함)
+        self._wakeup: asyncio.Event | None = None
+        self._flush_lock: asyncio.Lock | None = None
+        self._task: asyncio.Task | None = None
+        self.stats = {"accepted": 0, "written": 0, "spilled": 0, "replayed": 0, "dropped": 0, "flush_errors": 0}
+
+    def add(self, event: tuple):
+        """Queue one hit; never blocks or touches the database."""
+        self.stats["accepted"] += 1
+        if len(self._queue) >= self.max_size:
+            self._spill([event])
+            return
+        self._queue.append(event)
+        if len(self._queue) >= self.batch_size and self._wakeup:
+            self._wakeup.set()
+
+    def pending(self) -> int:
+        return len(self._queue)
+
+    # ───────── 수명 주기 ─────────
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        await self.replay_spill()
+        self._task = asyncio.create_task(self._run(), name="event-buffer")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # 남은 이벤트는 DB 로, 실패하면 디스크로
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            if self.stats["spilled"] > self.stats["replayed"] and not self._queue:
+                await self.replay_spill()
+
+    # ───────── 기록 ─────────
+    async def flush(self):
+        async with self._flush_lock:
+            while self._queue:
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                if not await self._write(batch):
+                    self._spill(batch)
+                    return
+
+    async def _write(self, batch: list[tuple]) -> bool:
+        groups: dict[str, list[tuple]] = {}
+        for e in batch:
+            groups.setdefault(e[1], []).append(e)
+        written = 0
+        try:
+            # 배치 전체를 한 트랜잭션으로 기록 — 실패 시 통째로 저널에 남겨도 이벤트가 중복 추가되지 않음
+            async with db.connection() as conn, conn.transaction():
+                for table, events in groups.items():
+                    campaign_id = await campaigns.active_id(conn, table)
+                    if campaign_id is None:
+                        # 훈련 종료(잠금) 뒤 도착한 이벤트는 버림
+                        logging.warning("event buffer: campaign %s not active, dropping %d events", table, len(events))
+                        self.stats["dropped"] += len(events)
+                        continue
+                    await _append(conn, campaign_id, events)
+                    written += len(events)
+        except Exception as e:
+            self.stats["flush_errors"] += 1
+            logging.error("event buffer flush error: %s", e)
+            return False
+        self.stats["written"] += written
+        return True
+
+    # ───────── 디스크 저널 ─────────
+    def _spill(self, events: list[tuple]):
+        with open(self.spill_file, "a", encoding="utf-8") as f:
+            for e in events:
+                f.write(_dump(e) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.stats["spilled"] += len(events)
+
+    async def replay_spill(self):
+        # 여러 워커가 같은 저널을 공유하므로 파일을 고유 이름으로 rename 해 선점한 뒤 재생
+        # (rename 은 원자적이라 한 워커만 성공 → 같은 저널이 두 번 재생되지 않음)
+        spill_dir = os.path.dirname(os.path.abspath(self.spill_file))
+        prefix = os.path.basename(self.spill_file)
+        for name in sorted(os.listdir(spill_dir)):
+            if not name.startswith(prefix):
+                continue
+            claimed = os.path.join(spill_dir, f"{prefix}.replay-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+            try:
+                os.replace(os.path.join(spill_dir, name), claimed)
+            except FileNotFoundError:
+                continue  # 다른 워커가 먼저 가져감
+            await asyncio.sleep(0.2)  # rename 직전에 열린 append 가 끝나도록 잠시 대기
+            await self._replay_file(claimed)
+
+    async def _replay_file(self, path: str):
+        events = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    events.append(_load(line))
+                except (ValueError, KeyError):
+                    continue  # 잘린 줄
+        for i in range(0, len(events), self.batch_size):
+            batch = events[i:i + self.batch_size]
+            if not await self._write(batch):
+                self._spill(events[i:])
+                break
+            self.stats["replayed"] += len(batch)
+        else:
+            logging.info("event buffer: replayed %d spilled events", len(events))
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
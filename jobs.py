@@ -0,0 +1,510 @@
+import os
+import csv
+import json
+import time
+import uuid
+import asyncio
+import logging
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+import psycopg
+
+import db
+import waves
+import metrics
+import recipients
+
+# shard·render·mailer 는 발송이 시작될 때 불러옴 (서버 시작 시간 단축)
+if TYPE_CHECKING:
+    from mailer import SMTPPool
+    from render import MessageBuilder
+
+# ───────── 작업 상태 저장 위치 ─────────
+JOBS_DIR = os.getenv("JOBS_DIR", "jobs")
+CHECKPOINT_INTERVAL = float(os.getenv("JOBS_CHECKPOINT_INTERVAL", "2"))  # 진행상황 저장 주기(초)
+
+QUEUED, RUNNING, PAUSED, CANCELLED, COMPLETED, FAILED = (
+    "queued", "running", "paused", "cancelled", "completed", "failed"
+)
+ACTIVE_STATES = (QUEUED, RUNNING, PAUSED)
+SUBJECT = "[중요] 의심스러운 로그인 시도가 차단됨"
+CONTROL_CHANNEL = "campaign_jobs"  # 다른 워커가 소유한 작업에 pause/resume/cancel 전달
+
+
+def _write_json_atomic(path: str, data: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class CampaignJob:
+    """One background sending run; progress is checkpointed to JOBS_DIR."""
+
+    def __init__(self, job_id: str, table: str, payload: dict, template_env):
+        self.id = job_id
+        self.table = table
+        self.payload = payload
+        self.env = template_env
+        self.status = QUEUED
+        self.total = 0
+        self.sent = 0
+        self.failed = 0
+        self.rejected = 0
+        self.ingested = False  # 수신자 일괄 적재 완료 여부
+        self.created_at = datetime.now().isoformat(timespec="seconds")
+        self.finished_at = None
+        self.saved_csv = None
+        self.error = None
+        self.plan: waves.WavePlan | None = None  # 웨이브 발송 계획 (payload 의 waves 지정 시)
+        self.active_seconds = 0.0   # 일시정지 시간을 제외한 누적 실행 시간
+        self.done: dict[int, dict] = {}  # index → {"ok": bool, "error": str, "rejected": bool}
+        self._run_started = None
+        self._unpaused = asyncio.Event()
+        self._unpaused.set()
+        self._task: asyncio.Task | None = None
+        self._journal = None
+        self._last_checkpoint = 0.0
+        self._lock_conn = None
+
+    # ───────── 영속화 ─────────
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(JOBS_DIR, f"{self.id}.json")
+
+    @property
+    def journal_path(self) -> str:
+        return os.path.join(JOBS_DIR, f"{self.id}.jsonl")
+
+    def checkpoint(self):
+        self._last_checkpoint = time.monotonic()
+        if self._journal:
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+        _write_json_atomic(self.meta_path, {
+            "id": self.id,
+            "table": self.table,
+            "payload": self.payload,
+            "status": self.status,
+            "total": self.total,
+            "ingested": self.ingested,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "saved_csv": self.saved_csv,
+            "error": self.error,
+            "active_seconds": self._elapsed(),
+            "waves": self.plan.to_dict() if self.plan else None,
+        })
+
+    @classmethod
+    def load(cls, path: str, template_env) -> "CampaignJob":
+        with open(path, encoding="utf-8") as f:
+            meta = json.load(f)
+        job = cls(meta["id"], meta["table"], meta["payload"], template_env)
+        job.status = meta["status"]
+        job.total = meta["total"]
+        job.ingested = meta.get("ingested", False)
+        job.created_at = meta["created_at"]
+        job.finished_at = meta.get("finished_at")
+        job.saved_csv = meta.get("saved_csv")
+        job.error = meta.get("error")
+        job.active_seconds = meta.get("active_seconds", 0.0)
+        if meta.get("waves"):
+            job.plan = waves.WavePlan.from_dict(job.id, meta["waves"])
+        if os.path.exists(job.journal_path):
+            with open(job.journal_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # 비정상 종료로 잘린 마지막 줄
+                    job.done[entry["i"]] = entry
+        job.sent = sum(1 for e in job.done.values() if e["ok"])
+        job.rejected = sum(1 for e in job.done.values() if e.get("rejected"))
+        job.failed = len(job.done) - job.sent - job.rejected
+        if job.shards > 1:
+            import shard
+            sent, failed = shard.journal_counts(shard.shard_dir(JOBS_DIR, job.id))
+            job.sent += sent
+            job.failed += failed
+        if job.status == PAUSED:
+            job._unpaused.clear()
+        return job
+
+    def _record(self, index: int, ok: bool, error: str = "", rejected: bool = False):
+        entry = {"i": index, "ok": ok, "error": error}
+        if rejected:
+            entry["rejected"] = True
+        self.done[index] = entry
+        if ok:
+            self.sent += 1
+        elif rejected:
+            self.rejected += 1
+        else:
+            self.failed += 1
+        self._journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        if time.monotonic() - self._last_checkpoint >= CHECKPOINT_INTERVAL:
+            self.checkpoint()
+
+    @property
+    def shards(self) -> int:
+        import shard
+        return self.payload.get("shards") or shard.SEND_SHARDS
+
+    # ───────── 진행 현황 ─────────
+    def _elapsed(self) -> float:
+        if self._run_started is None:
+            return self.active_seconds
+        return self.active_seconds + (time.monotonic() - self._run_started)
+
+    def progress(self) -> dict:
+        done = self.sent + self.failed + self.rejected
+        elapsed = self._elapsed()
+        rate = done / elapsed if elapsed > 0 else 0.0
+        queued = max(self.total - done, 0)
+        return {
+            "job_id": self.id,
+            "table": self.table,
+            "status": self.status,
+            "total": self.total,
+            "sent": self.sent,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "queued": queued,
+            "rate_per_sec": round(rate, 2),
+            "eta_seconds": round(queued / rate, 1) if rate and self.status == RUNNING else None,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "saved_csv": self.saved_csv,
+            "error": self.error,
+            "waves": self.plan.progress() if self.plan else None,
+        }
+
+    # ───────── 제어 ─────────
+    def pause(self):
+        if self.status in (QUEUED, RUNNING):
+            self._unpaused.clear()
+            self._stop_clock()
+            self.status = PAUSED
+            self.checkpoint()
+
+    def resume(self):
+        if self.status == PAUSED:
+            self.status = RUNNING if self._task else QUEUED
+            self._start_clock()
+            self._unpaused.set()
+            self.checkpoint()
+
+    def cancel(self):
+        if self.status in ACTIVE_STATES:
+            self.status = CANCELLED
+            self._stop_clock()
+            self.finished_at = datetime.now().isoformat(timespec="seconds")
+            self._unpaused.set()
+            if self._task:
+                self._task.cancel()
+            self.checkpoint()
+
+    def _start_clock(self):
+        if self._run_started is None:
+            self._run_started = time.monotonic()
+
+    def _stop_clock(self):
+        if self._run_started is not None:
+            self.active_seconds += time.monotonic() - self._run_started
+            self._run_started = None
+
+    # ───────── 소유권 (워커 간 중복 실행 방지) ─────────
+    async def acquire(self) -> bool:
+        """Take a session advisory lock so only one worker process runs this job."""
+        conn = await psycopg.AsyncConnection.connect(db.conninfo(), autocommit=True)
+        cur = await conn.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (f"campaign:{self.id}",))
+        (ok,) = await cur.fetchone()
+        if not ok:
+            await conn.close()
+            return False
+        self._lock_conn = conn
+        return True
+
+    async def release(self):
+        # 연결을 닫으면 advisory lock 도 해제됨 (프로세스가 죽어도 마찬가지)
+        if self._lock_conn:
+            await self._lock_conn.close()
+            self._lock_conn = None
+
+    # ───────── 실행 ─────────
+    def start(self):
+        self._task = asyncio.create_task(self.run(), name=f"campaign-{self.id}")
+
+    async def stop(self):
+        """Stop for server shutdown; the persisted status is kept so the job resumes."""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self):
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        try:
+            if self.status == QUEUED:
+                self.status = RUNNING
+            if self.status == RUNNING:
+                self._start_clock()
+
+            import shard
+            from render import MessageBuilder
+
+            # 템플릿은 한 번만 컴파일하고, 수신자별로는 개인화 부분만 채워 MIME 바이트를 만든다
+            builder = MessageBuilder(
+                self.env,
+                self.payload["template_name"],
+                SUBJECT,
+                os.getenv("SMTP_FROM"),
+                {"training_mode": self.payload["training_mode"], "server_base": self.payload.get("server_base")},
+            )
+            if self.shards > 1:
+                # 대용량: 샤드별 프로세스가 적재·발송하고 여기서는 저널 집계·결과 병합만
+                self.saved_csv = await shard.run(self, builder, self.shards, JOBS_DIR)
+            else:
+                self.saved_csv = await self._run_inline(builder)
+            self.status = COMPLETED
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error("campaign job %s error: %s", self.id, e)
+            self.status = FAILED
+            self.error = str(e)
+        finally:
+            self._stop_clock()
+            if self.status in (COMPLETED, FAILED):
+                self.finished_at = datetime.now().isoformat(timespec="seconds")
+            self.checkpoint()
+            self._journal.close()
+            self._journal = None
+            await self.release()
+
+    async def _run_inline(self, builder: "MessageBuilder") -> str:
+        source = recipients.RecipientSource(self.payload["csv_path"])
+        source.check()
+        self.total = await asyncio.to_thread(source.count)
+
+        # 검증·중복 제거 후 전체 수신자를 COPY 한 번으로 적재 (CSV 는 스트리밍으로 읽음)
+        if not self.ingested:
+            rejects = []
+            def accepted():
+                # bulk_insert 가 작업 스레드에서 소비 — 제외 행은 모아 두었다가 루프에서 기록
+                for index, row, reason in source.validate():
+                    if not reason:
+                        yield recipients.recipient_id(self.id, index), row
+                    else:
+                        rejects.append((index, reason))
+            await recipients.bulk_insert(self.table, accepted())
+            for index, reason in rejects:
+                if index not in self.done:
+                    self._record(index, False, reason, rejected=True)
+            self.ingested = True
+        if self.payload.get("waves") and self.plan is None:
+            self.plan = await asyncio.to_thread(waves.WavePlan.build, self.id, self.payload["waves"], source)
+        self.checkpoint()
+
+        from render import RENDER_CHUNK, RENDER_PROCESSES
+
+        batch = RENDER_CHUNK * max(1, RENDER_PROCESSES)
+        outbox = asyncio.Queue(maxsize=batch)
+
+        from mailer import SMTPPool  # SMTP 클라이언트는 발송할 때만 로드 (서버 기동 시간 단축)
+
+        sent = recipients.SentMarker(self.table)
+        async with SMTPPool.from_env() as smtp:
+            async def producer():
+                # 웨이브 발송이면 웨이브마다 공개 조건을 기다린 뒤 해당 수신자만 골라 CSV 를 다시 스트리밍
+                for k in range(self.plan.total) if self.plan else [None]:
+                    if k is not None and k >= len(self.plan.released):
+                        await self._unpaused.wait()  # 일시정지 중에는 다음 웨이브를 열지 않음
+                        await self.plan.release_next(self.table)
+                        self.checkpoint()
+                    chunk = []
+                    for index, row, reason in source.validate():
+                        if reason or index in self.done:
+                            continue  # 적재 제외 행·이미 처리된 수신자는 재발송하지 않음
+                        if k is not None and self.plan.wave_of(index, row) != k:
+                            continue
+                        chunk.append((index, row))
+                        if len(chunk) >= batch:
+                            await enqueue(chunk)
+                            chunk = []
+                    await enqueue(chunk)
+                for _ in range(smtp.size):
+                    await outbox.put(None)
+
+            async def enqueue(chunk):
+                if not chunk:
+                    return
+                try:
+                    with metrics.span("render"):
+                        messages = await builder.build_many([
+                            (row.get("이메일", ""), {"name": row.get("성명", ""), "uuid": recipients.recipient_id(self.id, index)})
+                            for index, row in chunk
+                        ])
+                except Exception as e:
+                    logging.error("render error: %s", e)
+                    for index, _ in chunk:
+                        self._record(index, False, f"렌더링 실패: {e}")
+                    return
+                for (index, row), data in zip(chunk, messages):
+                    await outbox.put((index, row, data))
+
+            async def worker():
+                while True:
+                    item = await outbox.get()
+                    if item is None:
+                        return
+                    await self._unpaused.wait()
+                    if await self._deliver(smtp, builder.sender, *item):
+                        await sent.add(recipients.recipient_id(self.id, item[0]))
+
+            try:
+                await asyncio.gather(producer(), *(worker() for _ in range(smtp.size)))
+            finally:
+                await sent.flush()
+
+        return await asyncio.to_thread(self._write_result_csv, source)
+
+    async def _deliver(self, smtp: "SMTPPool", sender: str, index: int, row: dict, data: bytes) -> bool:
+        try:
+            await smtp.send_raw(sender, row.get("이메일", ""), data)
+            self._record(index, True)
+            return True
+        except Exception as e:
+            logging.error("SMTP send error for %s: %s", row.get("이메일"), e)
+            self._record(index, False, str(e))
+            return False
+
+    def rejects(self) -> list[dict]:
+        return [
+            {"row": i + 1, "reason": e["error"]}
+            for i, e in sorted(self.done.items()) if e.get("rejected")
+        ]
+
+    def _write_result_csv(self, source: recipients.RecipientSource) -> str:
+        now_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+        out_file = f"수신기록_{now_str}.csv"
+        original_keys = ["사번", "성명", "이메일", "부서", "직책"]
+        fieldnames = original_keys + ["수신", "오류메시지"]
+        with open(out_file, "w", newline="", encoding="utf-8-sig") as wf:
+            writer = csv.DictWriter(wf, fieldnames=fieldnames, extrasaction="ignore")
+            writer.writeheader()
+            # 성공 → 실패 순서로 원본을 두 번 스트리밍 (전체 행을 메모리에 올리지 않음)
+            for ok in (True, False):
+                for index, row in source.rows():
+                    entry = self.done.get(index)
+                    if entry is None or entry["ok"] != ok:
+                        continue
+                    row["수신"] = "성공" if ok else "실패"
+                    if not ok:
+                        row["오류메시지"] = entry["error"]
+                    writer.writerow(row)
+        return out_file
+
+
+class JobManager:
+    """Tracks campaign jobs across worker processes.
+
+    `jobs` holds only the jobs this process owns (runs). Jobs owned by
+    another worker are read from their checkpoint files, and control
+    actions for them are forwarded over NOTIFY.
+    """
+
+    def __init__(self, template_env):
+        self.env = template_env
+        self.jobs: dict[str, CampaignJob] = {}
+
+    async def submit(self, table: str, payload: dict) -> CampaignJob:
+        job = CampaignJob(uuid.uuid4().hex[:12], table, payload, self.env)
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        await job.acquire()
+        self.jobs[job.id] = job
+        job.checkpoint()
+        job.start()
+        return job
+
+    def queue_depth(self) -> int:
+        """Recipients still waiting to be sent in the jobs this process runs."""
+        return sum(
+            max(j.total - j.sent - j.failed - j.rejected, 0) for j in self.jobs.values() if j.status in ACTIVE_STATES
+        )
+
+    def get(self, job_id: str) -> CampaignJob | None:
+        if job_id in self.jobs:
+            return self.jobs[job_id]
+        path = os.path.join(JOBS_DIR, f"{job_id}.json")
+        if not os.path.exists(path):
+            return None
+        return CampaignJob.load(path, self.env)  # 다른 워커 소유: 체크포인트 기준 스냅샷
+
+    def summaries(self) -> list[dict]:
+        found = dict(self.jobs)
+        for job_id in self._persisted_ids():
+            if job_id not in found:
+                job = self.get(job_id)
+                if job:
+                    found[job_id] = job
+        return [j.progress() for j in sorted(found.values(), key=lambda j: j.created_at, reverse=True)]
+
+    async def control(self, job: CampaignJob, action: str):
+        if job.id in self.jobs:
+            getattr(job, action)()
+            return
+        async with db.connection() as conn:
+            await db.notify(conn, CONTROL_CHANNEL, json.dumps({"job_id": job.id, "action": action}))
+
+    def _on_control(self, payload: str):
+        msg = json.loads(payload)
+        job = self.jobs.get(msg["job_id"])
+        if job and msg["action"] in ("pause", "resume", "cancel"):
+            getattr(job, msg["action"])()
+
+    def _persisted_ids(self) -> list[str]:
+        if not os.path.isdir(JOBS_DIR):
+            return []
+        return [n[:-len(".json")] for n in os.listdir(JOBS_DIR) if n.endswith(".json")]
+
+    async def adopt(self):
+        """Start unfinished jobs that no live worker owns (restart / crashed worker)."""
+        for job_id in self._persisted_ids():
+            if job_id in self.jobs:
+                continue
+            try:
+                job = CampaignJob.load(os.path.join(JOBS_DIR, f"{job_id}.json"), self.env)
+            except Exception as e:
+                logging.error("job restore error (%s): %s", job_id, e)
+                continue
+            if job.status not in ACTIVE_STATES or not await job.acquire():
+                continue
+            # 잠금 획득 후 다시 읽어 다른 워커가 마지막으로 남긴 체크포인트를 반영
+            lock_conn = job._lock_conn
+            job = CampaignJob.load(os.path.join(JOBS_DIR, f"{job_id}.json"), self.env)
+            job._lock_conn = lock_conn
+            if job.status not in ACTIVE_STATES:
+                await job.release()
+                continue
+            logging.info("resuming campaign job %s (%d/%d done)", job.id, len(job.done), job.total)
+            self.jobs[job.id] = job
+            job.start()
+
+    async def restore(self):
+        """Resume unfinished jobs from their checkpoint and listen for forwarded controls."""
+        await self.adopt()
+        db.subscribe(CONTROL_CHANNEL, self._on_control, resync=self.adopt)
+
+    async def shutdown(self):
+        await asyncio.gather(*(j.stop() for j in self.jobs.values()), return_exceptions=True)
+        # 다음 lifespan 의 adopt() 가 체크포인트에서 다시 불러오도록 비움 (중지된 작업은 이전 루프에 묶여 있음)
+        self.jobs.clear()
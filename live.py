@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import asyncio
+import logging
+
+import db
+import campaigns
+import training_state
+
+# ───────── 실시간 현황 ─────────
+# 요약 갱신(summaries)이 반영한 "새로 열람/감염된 수신자"를 NOTIFY 로 모든 워커에 알리고,
+# 각 워커는 메모리 카운터를 갱신해 SSE 구독자에게 바로 전달한다.
+# DB 집계는 훈련이 바뀔 때와 주기적 보정(reconcile) 때만 수행한다.
+CHANNEL = "live_stats"
+RECONCILE_INTERVAL = float(os.getenv("LIVE_RECONCILE_INTERVAL", "30"))  # DB 와 카운터 보정 주기(초)
+HEARTBEAT_INTERVAL = 15.0
+SUBSCRIBER_QUEUE_MAX = 100
+
+
+def _empty_dept() -> dict:
+    return {"total": 0, "opened": 0, "infected": 0}
+
+
+class LiveStats:
+    def __init__(self):
+        self.table = None
+        self.mode = training_state.DEFAULT_MODE
+        self.departments: dict[str, dict] = {}
+        self.version = 0
+        self._subscribers: set[asyncio.Queue] = set()
+        self._task: asyncio.Task | None = None
+        self._last_reconcile = 0.0
+
+    # ───────── 카운터 ─────────
+    def _sum(self, key: str) -> int:
+        return sum(d[key] for d in self.departments.values())
+
+    def snapshot(self) -> dict:
+        infected = self._sum("infected")
+        return {
+            "table": self.table,
+            "version": self.version,
+            "total": self._sum("total"),
+            "opened": self._sum("opened"),
+            "infected": infected,
+            # 3단계 훈련에서는 개인정보 제출 시에만 감염 처리됨
+            "info_submitted": infected if self.mode == 3 else 0,
+            "departments": self.departments,
+        }
+
+    async def publish(self, table: str, opened: list, infected: list):
+        """SummaryRefresher.on_changed hook: broadcast newly opened/infected recipients to every worker."""
+        delta = {"table": table, "opened": {}, "infected": {}}
+        for dept in opened:
+            delta["opened"][dept or ""] = delta["opened"].get(dept or "", 0) + 1
+        for dept in infected:
+            delta["infected"][dept or ""] = delta["infected"].get(dept or "", 0) + 1
+        async with db.connection() as conn:
+            await db.notify(conn, CHANNEL, json.dumps(delta, ensure_ascii=False))
+
+    def _on_notify(self, payload: str):
+        delta = json.loads(payload)
+        if delta["table"] != self.table:
+            return
+        for key in ("opened", "infected"):
+            for dept, n in delta[key].items():
+                self.departments.setdefault(dept, _empty_dept())[key] += n
+        self.version += 1
+        self._broadcast("delta", {**self.snapshot(), "delta": {k: delta[k] for k in ("opened", "infected")}})
+
+    async def reconcile(self):
+        """Rebuild the counters from one GROUP BY over the active training table."""
+        table = training_state.current()["table"]
+        departments = {}
+        mode = training_state.DEFAULT_MODE
+        campaign_id = await campaigns.campaign_id(table) if table else None
+        if campaign_id is not None:
+            mode = (await training_state.campaign(table))["mode"]
+            for dept, total, opened, infected in await db.fetch_all(
+                "SELECT department, COUNT(*), COUNT(clicked_at), COUNT(infected_at) FROM recipients"
+                " WHERE campaign_id = %s GROUP BY department",
+                (campaign_id,),
+                prepare=True,
+            ):
+                departments[dept or ""] = {"total": total, "opened": opened, "infected": infected}
+        self._last_reconcile = time.monotonic()
+        if table == self.table and departments == self.departments and mode == self.mode:
+            return
+        self.table, self.mode, self.departments = table, mode, departments
+        self.version += 1
+        self._broadcast("snapshot", self.snapshot())
+
+    # ───────── 수명 주기 ─────────
+    def start(self):
+        db.subscribe(CHANNEL, self._on_notify)
+        self._task = asyncio.create_task(self._run(), name="live-stats")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                # 훈련이 바뀌면 즉시, 아니면 주기적으로 DB 와 보정
+                if (training_state.current()["table"] != self.table
+                        or time.monotonic() - self._last_reconcile >= RECONCILE_INTERVAL):
+                    await self.reconcile()
+            except Exception as e:
+                logging.error("live stats reconcile error: %s", e)
+                self._last_reconcile = time.monotonic()
+            await asyncio.sleep(1)
+
+    # ───────── SSE ─────────
+    def _broadcast(self, event: str, data: dict):
+        message = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+        for q in self._subscribers:
+            if q.full():
+                # 느린 구독자는 오래된 메시지를 버림 (모든 메시지가 누적 합계를 포함하므로 안전)
+                q.get_nowait()
+            q.put_nowait(message)
+
+    async def stream(self, request):
+        q: asyncio.Queue[str] = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_MAX)
+        self._subscribers.add(q)
+        try:
+            yield f"event: snapshot\ndata: {json.dumps(self.snapshot(), ensure_ascii=False)}\n\n"
+            while True:
+                try:
+                    yield await asyncio.wait_for(q.get(), timeout=HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keep-alive\n\n"
+        finally:
+            self._subscribers.discard(q)
+
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
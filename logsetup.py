@@ -0,0 +1,159 @@
+import os
+import sys
+import copy
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from datetime import datetime
+
+# ───────── 로깅 설정 ─────────
+# 로그 기록(포맷·파일 쓰기)은 QueueListener 스레드에서 처리하고, 이벤트 루프에서는 큐에 넣기만 한다.
+# 같은 위치(파일:줄)에서 반복되는 로그는 구간마다 LOG_RATE_LIMIT 건까지만 남기고 나머지는 개수만 요약한다.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")            # json | text
+LOG_FILE = os.getenv("LOG_FILE")                        # 지정 시 파일에도 기록 (크기 기준 회전)
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", "20"))        # 위치별 구간당 최대 기록 수 (0 = 제한 없음)
+LOG_RATE_WINDOW = float(os.getenv("LOG_RATE_WINDOW", "10"))    # 반복 제한 구간(초)
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))     # 큐가 가득 차면 버리고 개수만 셈
+
+# LogRecord 기본 속성 — 나머지(extra=...)는 JSON 필드로 출력
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_listener: logging.handlers.QueueListener | None = None
+_handler: "_QueueHandler | None" = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; constant `fields` (e.g. shard number) are added to every record."""
+
+    def __init__(self, fields: dict | None = None):
+        super().__init__()
+        self.fields = fields or {}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "pid": record.process,
+            **self.fields,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Pass at most `limit` records per call site per `window` seconds.
+
+    Runs before the record is formatted, so suppressed %-style records never
+    build their message. When a window with suppressed records ends, the next
+    record from that site carries `suppressed=<count>`.
+    """
+
+    def __init__(self, limit=LOG_RATE_LIMIT, window=LOG_RATE_WINDOW):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._sites: dict[tuple, list] = {}  # (pathname, lineno, level) → [window_start, passed, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not self.limit:
+            return True
+        key = (record.pathname, record.lineno, record.levelno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= self.window:
+                suppressed = site[2] if site else 0
+                self._sites[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if site[1] < self.limit:
+                site[1] += 1
+                return True
+            site[2] += 1
+            return False
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when the queue is full."""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 메시지·예외는 문자열로 만들어 넘김 (args·traceback 객체를 다른 스레드와 공유하지 않음)
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure(fields: dict | None = None):
+    """Route the root logger through a background QueueListener (idempotent per process)."""
+    global _listener, _handler
+    if _listener is not None:
+        return
+    if LOG_FORMAT == "json":
+        formatter = JsonFormatter(fields)
+    else:
+        prefix = "".join(f"[{k} {v}] " for k, v in (fields or {}).items())
+        formatter = logging.Formatter(f"%(asctime)s %(levelname)s {prefix}%(message)s")
+
+    targets: list[logging.Handler] = [logging.StreamHandler(sys.stderr)]
+    if LOG_FILE:
+        os.makedirs(os.path.dirname(os.path.abspath(LOG_FILE)), exist_ok=True)
+        targets.append(logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        ))
+    for h in targets:
+        h.setFormatter(formatter)
+
+    _handler = _QueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    _handler.addFilter(RateLimitFilter())
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(_handler.queue, *targets, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        if _handler.dropped:
+            sys.stderr.write(f"logging: {_handler.dropped} records dropped (queue full)\n")
+        for h in _listener.handlers:
+            h.close()
+        _listener = None
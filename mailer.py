@@ -0,0 +1,194 @@
+import os
+import time
+import asyncio
+import logging
+from email.message import EmailMessage
+
+import aiosmtplib
+
+import metrics
+
+# ───────── 발송 설정 ─────────
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))            # 유지할 SMTP 세션 수 (= 동시 발송 수)
+SMTP_RATE_PER_SEC = float(os.getenv("SMTP_RATE_PER_SEC", "10"))   # 릴레이 전체 초당 발송 한도 (0 = 무제한)
+SMTP_MAX_PER_CONN = int(os.getenv("SMTP_MAX_PER_CONN", "100"))    # 세션당 발송 후 재접속 (0 = 무제한)
+SMTP_MAX_RETRIES = int(os.getenv("SMTP_MAX_RETRIES", "3"))        # 일시 오류(4xx) 재시도 횟수
+SMTP_RETRY_BACKOFF = float(os.getenv("SMTP_RETRY_BACKOFF", "2"))  # 재시도 대기 기본값(초, 지수 증가)
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+
+
+class RateLimiter:
+    """Spaces acquisitions so that at most `rate` happen per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+                now = self._next
+            self._next = now + self.interval
+
+
+class _Session:
+    def __init__(self, pool: "SMTPPool"):
+        self.pool = pool
+        self.client: aiosmtplib.SMTP | None = None
+        self.sent = 0
+
+    async def ensure(self):
+        if self.client is not None and self.client.is_connected:
+            return self.client
+        self.client = aiosmtplib.SMTP(
+            hostname=self.pool.hostname,
+            port=self.pool.port,
+            username=self.pool.username,
+            password=self.pool.password,
+            start_tls=self.pool.start_tls,
+            timeout=self.pool.timeout,
+        )
+        await self.client.connect()  # username 지정 시 connect() 가 로그인까지 수행
+        self.sent = 0
+        return self.client
+
+    async def reset(self):
+        client, self.client = self.client, None
+        if client is None:
+            return
+        try:
+            if client.is_connected:
+                await client.quit()
+        except Exception:
+            client.close()
+
+
+def _is_transient(e: Exception) -> bool:
+    if isinstance(e, (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError,
+                      aiosmtplib.SMTPTimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(e, aiosmtplib.SMTPRecipientsRefused):
+        return all(400 <= r.code < 500 for r in e.recipients)
+    if isinstance(e, aiosmtplib.SMTPResponseException):
+        return 400 <= e.code < 500
+    return False
+
+
+class SMTPPool:
+    """Small pool of persistent, authenticated SMTP sessions with rate limiting."""
+
+    def __init__(self, hostname, port=25, username=None, password=None, start_tls=False,
+                 size=SMTP_POOL_SIZE, rate_per_sec=SMTP_RATE_PER_SEC,
+                 max_per_conn=SMTP_MAX_PER_CONN, max_retries=SMTP_MAX_RETRIES,
+                 retry_backoff=SMTP_RETRY_BACKOFF, timeout=SMTP_TIMEOUT):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.start_tls = start_tls
+        self.size = max(1, size)
+        self.max_per_conn = max_per_conn
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate_per_sec)
+        self.relay = f"{hostname}:{port}"  # 지표 라벨
+        self._idle: asyncio.Queue[_Session] = asyncio.Queue()
+        for _ in range(self.size):
+            self._idle.put_nowait(_Session(self))
+
+    @classmethod
+    def from_env(cls, **overrides) -> "SMTPPool":
+        kwargs = dict(
+            hostname=os.getenv("SMTP_HOST"),
+            port=int(os.getenv("SMTP_PORT", "25")),
+            username=os.getenv("SMTP_USER"),
+            password=os.getenv("SMTP_PASSWORD"),
+            start_tls=os.getenv("SMTP_STARTTLS", "false").lower() == "true",
+        )
+        kwargs.update(overrides)
+        return cls(**kwargs)
+
+    async def send(self, msg: EmailMessage):
+        """Send one message, retrying transient failures with exponential backoff."""
+        return await self._send_with_retry(msg["To"], lambda client: client.send_message(msg))
+
+    async def send_raw(self, sender: str, recipient: str, data: bytes):
+        """Send pre-encoded MIME bytes (see render.MessageBuilder)."""
+        return await self._send_with_retry(recipient, lambda client: client.sendmail(sender, [recipient], data))
+
+    async def _send_with_retry(self, recipient: str, submit):
+        attempt = 0
+        started = time.perf_counter()
+        while True:
+            try:
+                result = await self._send_once(submit)
+                metrics.SMTP_SEND.labels(self.relay, "ok").observe(time.perf_counter() - started)
+                return result
+            except Exception as e:
+                transient = _is_transient(e)
+                if not transient or attempt >= self.max_retries:
+                    metrics.SMTP_SEND.labels(self.relay, "error").observe(time.perf_counter() - started)
+                    metrics.SMTP_FAILURES.labels(self.relay, "transient" if transient else "permanent").inc()
+                    raise
+                metrics.SMTP_RETRIES.labels(self.relay).inc()
+                delay = self.retry_backoff * (2 ** attempt)
+                attempt += 1
+                # 릴레이 장애 시 대량으로 발생 → %-포맷으로 남겨 반복 제한에 걸린 로그는 문자열을 만들지 않음
+                logging.warning(
+                    "SMTP transient error for %s (%s); retry %d/%d in %.1fs",
+                    recipient, e, attempt, self.max_retries, delay,
+                )
+                await asyncio.sleep(delay)
+
+    async def _send_once(self, submit):
+        session = await self._idle.get()
+        try:
+            client = await session.ensure()
+            await self.limiter.acquire()
+            try:
+                result = await submit(client)
+            except (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPTimeoutError, ConnectionError):
+                await session.reset()
+                raise
+            except aiosmtplib.SMTPResponseException as e:
+                # 421 은 서버가 세션을 끊겠다는 의미 → 새 세션으로 재시도
+                if e.code == 421:
+                    await session.reset()
+                else:
+                    try:
+                        await client.rset()
+                    except Exception:
+                        await session.reset()
+                raise
+            session.sent += 1
+            if self.max_per_conn and session.sent >= self.max_per_conn:
+                await session.reset()
+            return result
+        except aiosmtplib.SMTPException:
+            raise
+        except Exception:
+            await session.reset()
+            raise
+        finally:
+            self._idle.put_nowait(session)
+
+    async def close(self):
+        sessions = []
+        while not self._idle.empty():
+            sessions.append(self._idle.get_nowait())
+        await asyncio.gather(*(s.reset() for s in sessions), return_exceptions=True)
+        for s in sessions:
+            self._idle.put_nowait(s)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
@@ -1,36 +1,89 @@
 import os
-import csv
-import uuid
+import json
+import time
+import asyncio
+import base64
 import logging
 from datetime import datetime
 from uuid import UUID
 from dotenv import load_dotenv
 import sys
+from contextlib import asynccontextmanager
 
 import uvicorn
 from fastapi import FastAPI, Request, Body
-from fastapi.responses import JSONResponse, HTMLResponse, RedirectResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
-import aiosmtplib
 from jinja2 import Environment, FileSystemLoader
-from psycopg2.extras import RealDictCursor
-from email.message import EmailMessage
 
-from db import get_connection
+# analytics·archive·reports·shard·render 는 사용하는 엔드포인트·lifespan 에서 불러옴 (import main 시작 시간 단축)
+import db
+import events
+import campaigns
+import recipients
+import metrics
+import logsetup
+import pages
+import summaries
+import trackfilter
+import waves
+import training_state
+from jobs import JobManager
+from live import LiveStats
 
 # ──────────────────────────────────────────────────────────
-# 로깅 설정
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s %(levelname)s %(message)s"
-)
+# 로깅 설정 (기록은 백그라운드 스레드에서, LOG_LEVEL / LOG_FORMAT / LOG_FILE 로 조정)
+logsetup.configure()
 # 환경 변수 로드
 load_dotenv()
 
-# FastAPI 앱 초기화
-app = FastAPI()
+# FastAPI 앱 초기화 (DB 풀·훈련 상태·이벤트 버퍼·발송 작업은 lifespan 에서 열고 닫음)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    import analytics
+    await db.open_pool()
+    await campaigns.create_schema()
+    await analytics.create_schema()
+    await training_state.start()
+    _warm_pages()
+    await event_buffer.start()
+    summary_refresher.start()
+    await jobs.restore()
+    live_stats.start()
+    loop_lag.start()
+    db.start_listener()
+    try:
+        yield
+    finally:
+        await db.stop_listener()
+        await loop_lag.stop()
+        await live_stats.stop()
+        await jobs.shutdown()
+        await event_buffer.stop()
+        await summary_refresher.stop()
+        if "render" in sys.modules:  # 렌더링 프로세스 풀은 발송이 있었을 때만 로드됨
+            sys.modules["render"].shutdown()
+        await db.close_pool()
+
+app = FastAPI(lifespan=lifespan)
+
+# 요청 지연 지표 — 라벨은 경로 템플릿이라 /track?id=<uuid> 같은 요청이 수신자별로 갈라지지 않음
+@app.middleware("http")
+async def observe_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.HTTP_LATENCY.labels(
+            request.method, getattr(route, "path", "unmatched"), str(status)
+        ).observe(time.perf_counter() - started)
 
 # ───────── 경로 헬퍼 ─────────
 def resource_path(relative: str) -> str:
@@ -43,95 +96,74 @@ app.mount("/files", StaticFiles(directory=resource_path("files")), name="files")
 templates = Jinja2Templates(directory=resource_path("templates"))
 env = Environment(loader=FileSystemLoader(resource_path("templates")))
 
-# 현재 훈련 테이블 관리
-CURRENT_TABLE_FILE = "current_training_table.txt"
+# 추적 픽셀·정적 랜딩 페이지는 메모리에서 바로 응답 (요청마다 디스크 읽기·렌더링 없음)
+LANDING_PAGE = "감염페이지.html"
+tracking_pixel = pages.load_pixel(resource_path(os.path.join("files", "1x1.png")))
+landing_pages = pages.PageCache(templates.env)
+
+# 메일 발송 작업 관리자 / 실시간 현황 / 추적 이벤트 버퍼
+jobs = JobManager(env)
+live_stats = LiveStats()
+event_buffer = events.EventBuffer()
+summary_refresher = summaries.SummaryRefresher(on_changed=live_stats.publish)
+loop_lag = metrics.LoopLagMonitor()
+track_filter = trackfilter.TrackingFilter()
+
+# 현재 훈련 테이블 관리 (메모리 캐시, 변경은 DB 저장 + 워커 간 NOTIFY)
 def get_current_table() -> str | None:
-    if os.path.exists(CURRENT_TABLE_FILE):
-        with open(CURRENT_TABLE_FILE) as f:
-            return f.read().strip()
-    return None
+    return training_state.current()["table"]
 
-def set_current_table(table_name: str):
-    with open(CURRENT_TABLE_FILE, "w") as f:
-        f.write(table_name)
+async def set_current_table(table_name: str):
+    await training_state.update(table_name)
 
 def is_locked(table: str) -> bool:
     return table.endswith("_locked")
 
-async def record_click(id: UUID, request: Request):
-    table = get_current_table()
-    if not table or is_locked(table):
-        return
-    now    = datetime.now()
-    ip     = request.client.host
-    ua     = request.headers.get("user-agent", "")
-    ref    = request.headers.get("referer", "")
-    lang   = request.headers.get("accept-language", "")
-    try:
-        conn = get_connection()
-        cur  = conn.cursor()
-        cur.execute(
-            f"""
-            UPDATE {table}
-               SET clicked_at      = %s,
-                   ip_address      = %s,
-                   user_agent      = %s,
-                   referer         = %s,
-                   accept_language = %s
-             WHERE id = %s
-               AND clicked_at IS NULL
-            """,
-            (now, ip, ua, ref, lang, str(id)),
-        )
-        conn.commit()
-        cur.close()
-        conn.close()
-    except Exception as e:
-        logging.error(f"record_click error: {e}")
+# 추적 이벤트는 메모리 버퍼에 쌓고 백그라운드에서 일괄 기록 (요청 경로에서 DB 대기 없음)
+def _admit(kind: str, id: UUID, request: Request) -> str | None:
+    # 열람 중복이면 None (기록 안 함), 아니면 스캐너 판별 사유 ("" = 일반) — 감염은 버리거나 한도로 표시하지 않음
+    ip = request.client.host if request.client else ""
+    return track_filter.check(kind, id, ip, request.headers.get("user-agent", ""), throttle=kind != events.INFECT)
+
+
+def record_click(id: UUID, request: Request):
+    with metrics.span("record_click"):
+        table = get_current_table()
+        if not table or is_locked(table):
+            return
+        scanner = _admit(events.CLICK, id, request)
+        if scanner is None:
+            return
+        event_buffer.add(events.from_request(events.CLICK, table, id, request, scanner))
+
+
+def record_infection(id: UUID, request: Request):
+    with metrics.span("record_infection"):
+        table = get_current_table()
+        if not table or is_locked(table):
+            return False
+        scanner = _admit(events.INFECT, id, request)
+        event_buffer.add(events.from_request(events.INFECT, table, id, request, scanner))
+        return True
 
+def _warm_pages():
+    landing_pages.warm([LANDING_PAGE], get_current_table())
 
-async def record_infection(id: UUID, request: Request):
-    table = get_current_table()
-    if not table or is_locked(table):
-        return False
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute(
-            f"""
-            INSERT INTO {table}
-                (id, ip_address, user_agent, referer, accept_language, clicked_at, infected_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (id) DO UPDATE
-              SET
-                infected_at      = EXCLUDED.infected_at,
-                clicked_at       = COALESCE(EXCLUDED.clicked_at, {table}.clicked_at),
-                ip_address       = EXCLUDED.ip_address,
-                user_agent       = EXCLUDED.user_agent,
-                referer          = EXCLUDED.referer,
-                accept_language  = EXCLUDED.accept_language
-            """,
-            (
-                str(id),
-                request.client.host,
-                request.headers.get("user-agent", ""),
-                request.headers.get("referer", ""),
-                request.headers.get("accept-language", ""),
-                datetime.now(),
-                datetime.now(),
-            ),
-        )
-        conn.commit()
-        cur.close()
-        conn.close()
-        return True
-    except Exception as e:
-        logging.error(f"record_infection error: {e}")
-        return False
+
+def landing_page(request: Request) -> Response:
+    response = landing_pages.response(LANDING_PAGE, get_current_table(), request)
+    if response is None:
+        # 요청 정보가 필요한 템플릿 등 미리 렌더링할 수 없으면 기존처럼 요청마다 렌더링
+        return templates.TemplateResponse(LANDING_PAGE, {"request": request})
+    return response
 
 # JSON 바디 모델
-training_mode = 2  # 2단계 기본값
-info_template_name = "개인정보입력페이지.html"
+class WaveRequest(BaseModel):
+    by: str = waves.RANDOM            # department | random | size
+    count: int | None = None          # random: 웨이브 수, department: 부서를 묶을 웨이브 수 (없으면 부서별 한 웨이브)
+    size: int | None = None           # size: 웨이브당 CSV 행 수
+    interval: float = 0               # 웨이브 간 최소 간격(초)
+    max_click_rate: float | None = None  # 최근 추적 요청이 분당 이 값 미만일 때 다음 웨이브 발송
 
 class SendEmailRequest(BaseModel):
     csv_path: str
@@ -139,6 +171,8 @@ class SendEmailRequest(BaseModel):
     training_mode: int = 2
     server_base: str | None = None
     info_template_name: str | None = None
+    shards: int | None = None  # 지정 시 SEND_SHARDS 대신 사용 (2 이상이면 프로세스별 샤드 발송)
+    waves: WaveRequest | None = None  # 지정 시 수신자를 웨이브로 나눠 순차 발송
 
 # 1) 훈련 시작
 @app.post("/start-training")
@@ -146,302 +180,445 @@ async def start_training():
     now = datetime.now().strftime("%Y%m%d_%H%M%S")
     table = f"phishing_click_logs_{now}"
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        
-        cur.execute(f"""
-            CREATE TABLE IF NOT EXISTS {table} (
-                id UUID PRIMARY KEY,
-                employee_no TEXT,
-                name TEXT,
-                email TEXT,
-                department TEXT,
-                title TEXT,
-                ip_address TEXT,
-                user_agent TEXT,
-                referer TEXT,
-                accept_language TEXT,
-                clicked_at TIMESTAMP,
-                infected_at TIMESTAMP
-            )
-        """)
-        conn.commit()
-        cur.close()
-        conn.close()
-        set_current_table(table)
+        # 훈련 행 + recipients/events 파티션 생성 (인덱스는 부모 테이블에서 상속)
+        await campaigns.create(table)
+        await set_current_table(table)
+        _warm_pages()
         return {"message": f"새 훈련 시작됨: {table}"}
     except Exception as e:
-        logging.error(f"start_training error: {e}")
+        logging.error("start_training error: %s", e)
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 # 2) 훈련 종료
 @app.post("/end-training")
 async def end_training():
+    import analytics
     table = get_current_table()
     if not table:
         return JSONResponse(status_code=400, content={"error": "진행 중인 훈련 없음"})
-    locked_table = f"{table}_locked"
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute(f"ALTER TABLE {table} RENAME TO {locked_table};")
-        conn.commit()
-        cur.close()
-        conn.close()
-        set_current_table(locked_table)
+        # 잠그기 전에 버퍼에 남은 이벤트를 먼저 기록
+        await event_buffer.flush()
+        locked_table = await campaigns.end(table)
+        # 잠금 전에 커밋된 이벤트까지 수신자 요약에 반영 (다른 워커가 갱신 중이면 기다림)
+        # 잠긴 훈련은 이후 갱신되지 않으므로 발송 시각 대기 없이 모두 반영
+        await summary_refresher.refresh(locked_table, wait=True, hold=False)
+        # 종료된 훈련의 개인별 결과를 반복 위반자 집계에 합침
+        await analytics.close_campaign(await campaigns.campaign_id(locked_table))
+        await set_current_table(locked_table)
         return {"message": f"훈련 종료 및 테이블 잠금: {locked_table}"}
     except Exception as e:
-        logging.error(f"end_training error: {e}")
+        logging.error("end_training error: %s", e)
         return JSONResponse(status_code=500, content={"error": str(e)})
 
-# 3) 최종보고서 저장
+# 3) 최종보고서 저장 (서버측 커서로 한 번만 읽으며 요청한 형식을 모두 기록)
 @app.post("/export-final-report")
-async def export_final_report():
+async def export_final_report(formats: str = "csv"):
+    import archive
+    import reports
     table = get_current_table()
     if not table:
         return JSONResponse(status_code=400, content={"error": "훈련 테이블이 설정되지 않음"})
 
     try:
-        # ① 추출할 컬럼 명시
-        cols = [
-            "id",
-            "employee_no",
-            "name",
-            "email",
-            "department",
-            "title",
-            "ip_address",
-            "user_agent",
-            "referer",
-            "accept_language",
-            "clicked_at",
-            "infected_at"
-        ]
-        conn = get_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute(f"SELECT {', '.join(cols)} FROM {table}")
-        records = cur.fetchall()
-        cur.close()
-        conn.close()
-
-        # ② 통계 계산
-        total = len(records)
-        viewed = sum(1 for r in records if r.get("clicked_at"))
-        infected = sum(1 for r in records if r.get("infected_at"))
-        infection_rate = round(infected / total * 100, 2) if total else 0
-
-        # ③ 시간 포맷
-        now = datetime.now()
-        now_str = now.strftime("%Y%m%d_%H%M")
-        display_ts = now.strftime("%Y-%m-%d %H:%M:%S")
-
-        # ④ CSV 쓰기
-        os.makedirs("logs", exist_ok=True)
-        filename = f"logs/final_report_{now_str}.csv"
-        with open(filename, "w", encoding="utf-8-sig", newline="") as f:
-            writer = csv.writer(f)
-
-            # 타이틀 행
-            writer.writerow(
-                ["", ""] +
-                [f"({display_ts}) 훈련결과"] +
-                [""] * (len(cols) - 2)
-            )
-            # 통계 행
-            writer.writerow([
-                "총 대상자 수", total,
-                "총 열람수", viewed,
-                "총 감염수", infected,
-                "감염률", f"{infection_rate}%"
-            ])
-            writer.writerow([])
-
-            # 상세 헤더 (한글 매핑)
-            header_map = {
-                "id": "ID",
-                "employee_no": "사번",
-                "name": "이름",
-                "email": "이메일",
-                "department": "부서",
-                "title": "직책",
-                "ip_address": "IP",
-                "user_agent": "User-Agent",
-                "referer": "Referer",
-                "accept_language": "Accept-Language",
-                "clicked_at": "열람 시각",
-                "infected_at": "감염 시각",
-            }
-            writer.writerow([header_map[c] for c in cols] + ["상태"])
-
-            # 데이터 행
-            for r in records:
-                status = (
-                    "감염" if r.get("infected_at")
-                    else ("열람" if r.get("clicked_at") else "미열람")
-                )
-                row = [r.get(c, "") for c in cols] + [status]
-                writer.writerow(row)
-
-        return {"message": f"보고서 저장 완료: {filename}"}
-
+        formats = [f.strip() for f in formats.split(",") if f.strip()]
+        if await archive.is_dropped(table):
+            files = await archive.export(table, formats)  # DB 에서 삭제된 훈련은 보관본에서
+        else:
+            files = await reports.export(table, formats)
+        return {"message": f"보고서 저장 완료: {', '.join(files)}", "files": files}
+    except (reports.ReportFormatError, archive.ArchiveError) as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
     except Exception as e:
-        logging.error(f"export_final_report error: {e}")
+        logging.error("export_final_report error: %s", e)
         return JSONResponse(status_code=500, content={"error": str(e)})
 
-# 4) 클릭 로그 조회
+# 3-1) 최종보고서 CSV 를 파일 저장 없이 바로 내려받기
+@app.get("/export-final-report/stream")
+async def stream_final_report():
+    import archive
+    import reports
+    table = get_current_table()
+    if not table:
+        return JSONResponse(status_code=400, content={"error": "훈련 테이블이 설정되지 않음"})
+    filename = f"final_report_{datetime.now().strftime('%Y%m%d_%H%M')}.csv"
+    return StreamingResponse(
+        archive.stream_csv(table) if await archive.is_dropped(table) else reports.stream_csv(table),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+# 4) 클릭 로그 조회 (keyset 페이지네이션 / 필터 / 컬럼 선택 / 컬럼형 응답)
+LOG_COLUMNS = [
+    "id", "employee_no", "name", "email", "department", "title",
+    "ip_address", "user_agent", "referer", "accept_language", "clicked_at", "infected_at",
+    "open_count", "infect_count", "last_seen_at",
+]
+LOG_STATUS_FILTERS = {
+    "unopened": "clicked_at IS NULL AND infected_at IS NULL",
+    "opened": "clicked_at IS NOT NULL AND infected_at IS NULL",
+    "infected": "infected_at IS NOT NULL",
+}
+LOG_PAGE_MAX = 1000
+
+def encode_cursor(row: dict) -> str:
+    ts = row["clicked_at"].isoformat() if row["clicked_at"] else None
+    raw = json.dumps([ts, str(row["id"])]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[datetime | None, str]:
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    ts, last_id = json.loads(raw)
+    return (datetime.fromisoformat(ts) if ts else None), str(UUID(last_id))
+
 @app.get("/logs/clicks")
-async def get_click_logs():
+async def get_click_logs(
+    limit: int = 100,
+    cursor: str | None = None,
+    department: str | None = None,
+    status: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    fields: str | None = None,
+    format: str = "rows",
+):
     table = get_current_table()
     if not table or is_locked(table):
-        return []
+        return {"rows": [], "next_cursor": None}
+    cols = [c.strip() for c in fields.split(",")] if fields else list(LOG_COLUMNS)
+    unknown = [c for c in cols if c not in LOG_COLUMNS]
+    if unknown:
+        return JSONResponse(status_code=400, content={"error": f"알 수 없는 컬럼: {', '.join(unknown)}"})
+    if status and status not in LOG_STATUS_FILTERS:
+        return JSONResponse(status_code=400, content={"error": f"알 수 없는 상태: {status}"})
+    limit = max(1, min(limit, LOG_PAGE_MAX))
+
+    campaign_id = await campaigns.campaign_id(table)
+    if campaign_id is None:
+        return {"rows": [], "next_cursor": None}
+    where, params = ["campaign_id = %s"], [campaign_id]
+    if department:
+        where.append("department = %s")
+        params.append(department)
+    if status:
+        where.append(LOG_STATUS_FILTERS[status])
+    if since:
+        where.append("clicked_at >= %s")
+        params.append(since)
+    if until:
+        where.append("clicked_at < %s")
+        params.append(until)
+    if cursor:
+        try:
+            last_ts, last_id = decode_cursor(cursor)
+        except Exception:
+            return JSONResponse(status_code=400, content={"error": "잘못된 cursor"})
+        # 정렬: clicked_at DESC NULLS LAST, id — 마지막 행 다음부터
+        if last_ts is None:
+            where.append("(clicked_at IS NULL AND id > %s)")
+            params.append(last_id)
+        else:
+            where.append("(clicked_at < %s OR (clicked_at = %s AND id > %s) OR clicked_at IS NULL)")
+            params += [last_ts, last_ts, last_id]
+
+    # 커서 계산에 필요한 키 컬럼은 항상 조회
+    select_cols = cols + [c for c in ("clicked_at", "id") if c not in cols]
+    sql = f"SELECT {', '.join(select_cols)} FROM recipients WHERE " + " AND ".join(where)
+    sql += " ORDER BY clicked_at DESC NULLS LAST, id LIMIT %s"
+    params.append(limit + 1)
+    try:
+        rows = await db.fetch_all(sql, params, dict_rows=True, prepare=True)
+    except Exception as e:
+        logging.error("get_click_logs error: %s", e)
+        return JSONResponse(status_code=500, content={"error": "조회 실패", "detail": str(e)})
+
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    rows = rows[:limit]
+    if format == "columnar":
+        # 컬럼별 값 배열 — 키 이름이 행마다 반복되지 않아 응답이 작음
+        return {
+            "columns": cols,
+            "data": [[jsonable_encoder(r[c]) for r in rows] for c in cols],
+            "next_cursor": next_cursor,
+        }
+    return {
+        "rows": [{c: r[c] for c in cols} for r in rows],
+        "next_cursor": next_cursor,
+    }
+
+# 4-1) 수신자별 추적 이벤트 이력 (열람·감염 요청 전체, 시간순)
+EVENT_COLUMNS = ["kind", "occurred_at", "ip_address", "user_agent", "referer", "accept_language", "scanner"]
+
+@app.get("/logs/events")
+async def get_recipient_events(id: UUID, limit: int = 100):
+    table = get_current_table()
+    campaign_id = await campaigns.campaign_id(table) if table else None
+    if campaign_id is None:
+        return {"events": []}
     try:
-        conn = get_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute(f"SELECT * FROM {table} ORDER BY clicked_at DESC NULLS LAST")
-        logs = cur.fetchall()
-        cur.close()
-        conn.close()
-        return logs
+        # scanner: 수집 시 판별 사유, 없으면 발송 직후 요청인지 여기서 판별 (요약과 같은 기준)
+        rows = await db.fetch_all(
+            f"SELECT {', '.join('e.' + c for c in EVENT_COLUMNS if c != 'scanner')},"
+            " COALESCE(e.scanner, CASE WHEN e.occurred_at < r.sent_at + make_interval(secs => %s) THEN %s END) AS scanner"
+            " FROM events e LEFT JOIN recipients r ON r.campaign_id = e.campaign_id AND r.id = e.recipient_id"
+            " WHERE e.campaign_id = %s AND e.recipient_id = %s ORDER BY e.occurred_at LIMIT %s",
+            (trackfilter.TRACK_SCANNER_DELAY, trackfilter.FAST, campaign_id, id, max(1, min(limit, LOG_PAGE_MAX))),
+            dict_rows=True,
+            prepare=True,
+        )
     except Exception as e:
-        logging.error(f"get_click_logs error: {e}")
+        logging.error("get_recipient_events error: %s", e)
         return JSONResponse(status_code=500, content={"error": "조회 실패", "detail": str(e)})
+    return {"events": rows}
+
+# 4-2) 훈련 간 분석 (롤업 테이블 조회 — 누적 훈련 수와 무관하게 수백 행 이내)
+@app.get("/analytics/campaigns")
+async def analytics_campaigns():
+    import analytics
+    return {"campaigns": await analytics.campaign_trend()}
+
+@app.get("/analytics/groups")
+async def analytics_groups(by: str = "department", finished_only: bool = False):
+    import analytics
+    try:
+        return {"rows": await analytics.group_trend(by, finished_only)}
+    except analytics.AnalyticsError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+@app.get("/analytics/hourly")
+async def analytics_hourly(campaign: str | None = None):
+    import analytics
+    campaign_id = await campaigns.campaign_id(campaign or get_current_table() or "")
+    if campaign_id is None:
+        return {"hours": []}
+    return {"hours": await analytics.hourly(campaign_id)}
+
+@app.get("/analytics/time-to-click")
+async def analytics_time_to_click(campaign: str | None = None):
+    import analytics
+    campaign_id = None
+    if campaign:
+        campaign_id = await campaigns.campaign_id(campaign)
+        if campaign_id is None:
+            return JSONResponse(status_code=404, content={"error": f"훈련 없음: {campaign}"})
+    return {"buckets": await analytics.time_to_click(campaign_id)}
+
+@app.get("/analytics/repeat-offenders")
+async def analytics_repeat_offenders(min_infected: int = 2, limit: int = 100):
+    import analytics
+    return {"people": await analytics.repeat_offenders(max(1, min_infected), max(1, min(limit, LOG_PAGE_MAX)))}
+
+# 저장된 parquet 보고서에 대한 임의 집계 (DuckDB, 요청 스레드 밖에서 실행)
+@app.get("/analytics/reports")
+async def analytics_reports(group_by: str = "department", since: datetime | None = None, until: datetime | None = None,
+                            source: str = "reports"):
+    # source=archive: 보관된 훈련 전체(archive/*/recipients.parquet)를 대상으로 집계
+    import analytics
+    import archive
+    pattern = archive.RECIPIENTS_GLOB if source == "archive" else analytics.REPORTS_GLOB
+    try:
+        return {"rows": await asyncio.to_thread(analytics.adhoc, group_by, since, until, pattern)}
+    except analytics.AnalyticsError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        logging.error("analytics_reports error: %s", e)
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+# 4-2) 보관 (종료된 훈련을 Parquet 로 내보내고 선택적으로 DB 파티션 삭제, 조회는 보관 파일에서)
+@app.get("/archive")
+async def list_archives():
+    import archive
+    return {"archives": await asyncio.to_thread(archive.list_archives)}
+
+@app.post("/archive/{name}")
+async def archive_campaign(name: str, drop: bool = False):
+    import archive
+    try:
+        return await archive.archive(name, drop=drop)
+    except LookupError as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
+    except archive.ArchiveError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        logging.error("archive_campaign error: %s", e)
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+async def _read_archive(fn, *args):
+    import archive
+    try:
+        return jsonable_encoder(await asyncio.to_thread(fn, *args))
+    except LookupError as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
+    except archive.ArchiveError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+@app.get("/archive/{name}/recipients")
+async def archive_recipients(name: str, status: str | None = None, department: str | None = None,
+                             fields: str | None = None, limit: int = 100, offset: int = 0):
+    import archive
+    columns = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    return await _read_archive(
+        archive.store.recipients, name, status, department, columns, max(1, min(limit, LOG_PAGE_MAX)), max(offset, 0)
+    )
+
+@app.get("/archive/{name}/departments")
+async def archive_departments(name: str):
+    import archive
+    return await _read_archive(archive.store.departments, name)
+
+@app.get("/archive/{name}/events")
+async def archive_events(name: str, id: UUID, limit: int = 100):
+    import archive
+    return await _read_archive(archive.store.events, name, str(id), max(1, min(limit, LOG_PAGE_MAX)))
+
+@app.post("/archive/{name}/export")
+async def archive_export(name: str, formats: str = "csv"):
+    import archive
+    import reports
+    try:
+        files = await archive.export(name, [f.strip() for f in formats.split(",") if f.strip()])
+        return {"message": f"보고서 저장 완료: {', '.join(files)}", "files": files}
+    except LookupError as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
+    except (reports.ReportFormatError, archive.ArchiveError) as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
 
 # 5) 메일 발송 (JSON 바디 방식)
 @app.post("/send-emails")
 async def send_emails(payload: SendEmailRequest = Body(...)):
-    global training_mode, info_template_name
-    training_mode = payload.training_mode
-    if payload.info_template_name:
-        info_template_name = payload.info_template_name
+    import shard
     table = get_current_table()
     if not table or is_locked(table):
         return JSONResponse(status_code=400, content={"error": "활성화된 훈련 없음 또는 이미 종료됨"})
+    if not os.path.exists(payload.csv_path):
+        return JSONResponse(status_code=400, content={"error": f"CSV 파일 없음: {payload.csv_path}"})
     try:
-        # CSV 파일 열기
-        with open(payload.csv_path, encoding="utf-8") as f:
-            rows = list(csv.DictReader(f))
-        total = len(rows)
-        success_list, fail_list = [], []
-        template = env.get_template(payload.template_name)
-
-        for row in rows:
-            unique_id = str(uuid.uuid4())
-            try:
-                # DB 삽입
-                conn = get_connection()
-                cur = conn.cursor()
-                cur.execute(
-                    f"INSERT INTO {table} (id, employee_no, name, email, department, title) "
-                    "VALUES (%s, %s, %s, %s, %s, %s) ON CONFLICT (id) DO NOTHING",
-                    (
-                        unique_id,
-                        row.get("사번", ""),
-                        row.get("성명", ""),
-                        row.get("이메일", ""),
-                        row.get("부서", ""),
-                        row.get("직책", "")
-                    )
-                )
-                conn.commit()
-                cur.close()
-                conn.close()
-
-                # 메일 전송
-                html = template.render(
-                    name=row.get("성명", ""),
-                    uuid=unique_id,
-                    training_mode=training_mode,
-                    server_base=payload.server_base,
-                )
-                msg = EmailMessage()
-                msg["Subject"] = "[중요] 의심스러운 로그인 시도가 차단됨"
-                msg["From"] = os.getenv("SMTP_FROM")
-                msg["To"] = row.get("이메일", "")
-                msg.set_content("HTML 미지원 메일입니다.")
-                msg.add_alternative(html, subtype="html")
-
-                await aiosmtplib.send(
-                    msg,
-                    hostname=os.getenv("SMTP_HOST"),
-                    port=int(os.getenv("SMTP_PORT", "25")),
-                    username=os.getenv("SMTP_USER"),
-                    password=os.getenv("SMTP_PASSWORD"),
-                    start_tls=False
-                )
-                row["수신"] = "성공"
-                success_list.append(row)
-
-            except Exception as e:
-                logging.error(f"SMTP send error for {row.get('이메일')}: {e}")
-                row["수신"] = "실패"
-                row["오류메시지"] = str(e)
-                fail_list.append(row)
-
-        # 결과 CSV 저장
-        now_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-        out_file = f"수신기록_{now_str}.csv"
-        original_keys = ["사번", "성명", "이메일", "부서", "직책"]
-        fieldnames = original_keys + ["수신", "오류메시지"]
-        with open(out_file, "w", newline="", encoding="utf-8-sig") as wf:
-            writer = csv.DictWriter(wf, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(success_list + fail_list)
-
-        return {"total": total, "sent": len(success_list), "fail": len(fail_list), "saved_csv": out_file}
-
-    except Exception as e:
-        logging.error(f"send_emails error: {e}")
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        recipients.RecipientSource(payload.csv_path).check()  # 헤더만 읽어 필수 컬럼 확인
+    except (recipients.RecipientSchemaError, UnicodeDecodeError) as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    if payload.waves:
+        try:
+            waves.check_spec(payload.waves.model_dump(), payload.shards or shard.SEND_SHARDS)
+        except waves.WaveSpecError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
+    # 모드·개인정보 입력 템플릿은 훈련별로 저장 (모든 워커가 같은 값을 조회)
+    await training_state.set_campaign(table, payload.training_mode, payload.info_template_name)
+    # 발송은 백그라운드 작업으로 진행하고 작업 ID 만 즉시 반환
+    job = await jobs.submit(table, payload.model_dump())
+    return JSONResponse(status_code=202, content=job.progress())
+
+# 5-1) 발송 작업 목록 / 진행 현황
+@app.get("/jobs")
+async def list_jobs():
+    return jobs.summaries()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if not job:
+        return JSONResponse(status_code=404, content={"error": "작업 없음"})
+    return job.progress()
+
+@app.get("/jobs/{job_id}/rejects")
+async def get_job_rejects(job_id: str):
+    job = jobs.get(job_id)
+    if not job:
+        return JSONResponse(status_code=404, content={"error": "작업 없음"})
+    return job.rejects()
+
+# 5-2) 발송 작업 제어 (pause / resume / cancel)
+@app.post("/jobs/{job_id}/{action}")
+async def control_job(job_id: str, action: str):
+    job = jobs.get(job_id)
+    if not job:
+        return JSONResponse(status_code=404, content={"error": "작업 없음"})
+    if action not in ("pause", "resume", "cancel"):
+        return JSONResponse(status_code=400, content={"error": f"알 수 없는 동작: {action}"})
+    await jobs.control(job, action)
+    return job.progress()
 
 # 6) 피싱 감염 기록
 @app.get("/infect")
 async def infect(id: UUID, request: Request):
-    await record_infection(id, request)
-    return templates.TemplateResponse("감염페이지.html", {"request": request})
+    record_infection(id, request)
+    return landing_page(request)
 
 
 # 7) 클릭 추적
 @app.get("/track")
 async def track_click(id: UUID, request: Request):
-    table = get_current_table()
-    if not table or is_locked(table):
-        return HTMLResponse(status_code=204)
-
-    await record_click(id, request)
-
-    # 투명 픽셀 응답
-    return RedirectResponse(url="/files/1x1.png", status_code=204)
+    # 진행 중인 훈련이 없어도 픽셀은 돌려줌 (record_click 이 기록 여부 판단)
+    record_click(id, request)
+    return pages.pixel_response(tracking_pixel)
 
 # 7-1) 개인정보 입력 화면 (3단계용)
 @app.get("/view-info")
 async def view_info(id: UUID, request: Request):
-    await record_click(id, request)
-    return templates.TemplateResponse(info_template_name, {"request": request, "id": id})
+    record_click(id, request)
+    table = get_current_table()
+    if table:
+        info_template = (await training_state.campaign(table))["info_template"]
+    else:
+        info_template = training_state.DEFAULT_INFO_TEMPLATE
+    return templates.TemplateResponse(info_template, {"request": request, "id": id})
 
 # 7-2) 개인정보 전송 후 감염 처리
 @app.post("/submit-info")
 async def submit_info(id: UUID, request: Request):
-    await record_infection(id, request)
-    return templates.TemplateResponse("감염페이지.html", {"request": request})
+    record_infection(id, request)
+    return landing_page(request)
 
-# 8) 감염 통계 제공
+# 8) 감염 통계 제공 (메모리 카운터, DB 조회 없음)
 @app.get("/infect-stats")
 async def get_infect_stats():
     table = get_current_table()
-    if not table or is_locked(table):
+    if not table or is_locked(table) or live_stats.table != table:
         return {"infected_count": 0}
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute(f"SELECT COUNT(*) FROM {table} WHERE infected_at IS NOT NULL")
-        count = cur.fetchone()[0]
-        cur.close()
-        conn.close()
-        return {"infected_count": count}
-    except Exception as e:
-        logging.error(f"get_infect_stats error: {e}")
-        return {"infected_count": 0, "error": str(e)}
-
-# 앱 실행
+    return {"infected_count": live_stats.snapshot()["infected"]}
+
+# 8-1) 실시간 현황 (열람/개인정보 제출/감염, 부서별) — 스냅샷과 SSE 스트림
+@app.get("/live/stats")
+async def get_live_stats():
+    return live_stats.snapshot()
+
+@app.get("/live/stream")
+async def live_stream(request: Request):
+    return StreamingResponse(
+        live_stats.stream(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# 9) DB 커넥션 풀 상태 (포화도 / 대기시간)
+@app.get("/db/pool-stats")
+async def get_pool_stats():
+    return db.pool_stats()
+
+# 10) 추적 이벤트 버퍼 상태
+@app.get("/events/buffer-stats")
+async def get_event_buffer_stats():
+    return {
+        "pending": event_buffer.pending(),
+        **event_buffer.stats,
+        "filter": track_filter.stats,
+        "summary": summary_refresher.stats,
+    }
+
+# 11) Prometheus 지표 (큐·버퍼·풀 gauge 는 수집 시점에 갱신)
+@app.get("/metrics")
+async def get_metrics():
+    pool = db.pool_stats()
+    metrics.SEND_QUEUE.set(jobs.queue_depth())
+    metrics.EVENT_BUFFER.set(event_buffer.pending())
+    metrics.DB_POOL_IN_USE.set(pool["in_use"])
+    metrics.DB_POOL_WAITING.set(pool["waiting"])
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+# 앱 실행 (WEB_WORKERS > 1 이면 멀티 워커 모드, 이 경우 reload 는 사용 불가)
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True, log_level="warning")
+    workers = int(os.getenv("WEB_WORKERS", "1"))
+    if workers > 1:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers, log_level="warning")
+    else:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True, log_level="warning")
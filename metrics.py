@@ -0,0 +1,120 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest,
+)
+
+# ───────── Prometheus 지표 ─────────
+# 멀티 워커(uvicorn --workers)에서는 PROMETHEUS_MULTIPROC_DIR 를 지정해야 모든 워커·샤드 프로세스의 값이 합쳐짐
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+TRACING = os.getenv("METRICS_TRACING", "false").lower() == "true"  # 구간별 span 측정 (record_click 등)
+LOOP_LAG_INTERVAL = float(os.getenv("METRICS_LOOP_LAG_INTERVAL", "0.5"))  # 이벤트 루프 지연 측정 주기(초)
+
+# 추적 요청은 대부분 수 ms 이내 → 낮은 구간을 촘촘하게
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route",
+    ["method", "route", "status"], buckets=FAST_BUCKETS,
+)
+DB_QUERY = Histogram(
+    "db_query_duration_seconds", "Database statement time by statement type",
+    ["statement"], buckets=FAST_BUCKETS,
+)
+SMTP_SEND = Histogram(
+    "smtp_send_duration_seconds", "SMTP send latency per relay (including retries)",
+    ["relay", "outcome"], buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+SMTP_FAILURES = Counter("smtp_send_failures_total", "Failed SMTP sends per relay", ["relay", "kind"])
+SMTP_RETRIES = Counter("smtp_send_retries_total", "Transient SMTP errors that were retried", ["relay"])
+SEND_QUEUE = Gauge("send_queue_depth", "Recipients not yet sent in running jobs", multiprocess_mode="livesum")
+EVENT_BUFFER = Gauge("event_buffer_pending", "Tracking events waiting to be written", multiprocess_mode="livesum")
+DB_POOL_IN_USE = Gauge("db_pool_in_use", "Pooled DB connections in use", multiprocess_mode="livesum")
+DB_POOL_WAITING = Gauge("db_pool_waiting", "Requests waiting for a DB connection", multiprocess_mode="livesum")
+LOOP_LAG = Histogram(
+    "event_loop_lag_seconds", "Delay between a scheduled wakeup and the event loop running it",
+    buckets=FAST_BUCKETS,
+)
+SPAN = Histogram("trace_span_duration_seconds", "Time spent in traced sections", ["span"], buckets=FAST_BUCKETS)
+
+try:
+    from opentelemetry import trace as _otel_trace
+    _tracer = _otel_trace.get_tracer("hacktraining")
+except ImportError:
+    _tracer = None
+
+
+def statement_type(query: str) -> str:
+    """First SQL keyword (SELECT / INSERT / UPDATE / COPY / WITH ...) — low-cardinality label."""
+    head = query.lstrip().split(None, 1)
+    return head[0].upper() if head else "UNKNOWN"
+
+
+@contextmanager
+def db_timer(query: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        DB_QUERY.labels(statement_type(query)).observe(time.perf_counter() - started)
+
+
+@contextmanager
+def span(name: str):
+    """Timed section, recorded only when METRICS_TRACING is on (also as an OpenTelemetry span if installed)."""
+    if not TRACING:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        if _tracer is not None:
+            with _tracer.start_as_current_span(name):
+                yield
+        else:
+            yield
+    finally:
+        SPAN.labels(name).observe(time.perf_counter() - started)
+
+
+def render() -> tuple[bytes, str]:
+    """Exposition payload for GET /metrics."""
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class LoopLagMonitor:
+    """Sleeps for a fixed interval and records how late the wakeup was."""
+
+    def __init__(self, interval=LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name="loop-lag-monitor")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            LOOP_LAG.observe(lag)
+            if lag > 1:
+                logging.warning("event loop lag %.2fs", lag)
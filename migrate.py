@@ -0,0 +1,141 @@
+"""Import the per-run phishing_click_logs_* tables into the campaigns schema.
+
+Each legacy table becomes one campaign (same name, so training_state and
+training_campaigns keep pointing at it); its recipients are copied into the
+campaign's recipients partition, the recorded first click / infection are
+written to events, and the recipient summaries and analytics rollups are
+then built from those events. Tables whose campaign already exists are skipped, so the tool can
+be re-run safely. Legacy rows only kept the IP/User-Agent of the last hit,
+so both imported events carry those values.
+
+    python migrate.py --dry-run
+    python migrate.py [--drop]
+"""
+import re
+import asyncio
+import argparse
+import logging
+from datetime import datetime
+
+import db
+import analytics
+import campaigns
+import summaries
+from recipients import DB_COLUMNS
+
+LEGACY_RE = re.compile(r"^phishing_click_logs_(\d{8}_\d{6})(_locked)?$")
+STATE_COLUMNS = ["ip_address", "user_agent", "referer", "accept_language", "clicked_at", "infected_at"]
+HIT_COLUMNS = ["ip_address", "user_agent", "referer", "accept_language"]
+
+
+async def legacy_tables(conn) -> list[str]:
+    cur = await conn.execute(
+        "SELECT table_name FROM information_schema.tables"
+        " WHERE table_schema = current_schema() AND table_name LIKE 'phishing_click_logs_%'"
+        " ORDER BY table_name"
+    )
+    return [name for (name,) in await cur.fetchall() if LEGACY_RE.match(name)]
+
+
+async def _columns(conn, table: str) -> set[str]:
+    cur = await conn.execute(
+        "SELECT column_name FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = %s",
+        (table,),
+    )
+    return {name for (name,) in await cur.fetchall()}
+
+
+async def import_table(conn, table: str, drop: bool = False) -> tuple[int, int] | None:
+    """Import one legacy table in the current transaction.
+
+    Returns (campaign id, rows copied), or None if it was imported before.
+    """
+    cur = await conn.execute("SELECT 1 FROM campaigns WHERE name = %s", (table,))
+    if await cur.fetchone():
+        return None
+
+    stamp, locked = LEGACY_RE.match(table).groups()
+    present = await _columns(conn, table)
+    # 이전 버전 테이블에 없는 컬럼은 NULL 로 채움
+    select = {c: (c if c in present else "NULL") for c in DB_COLUMNS + STATE_COLUMNS}
+    started_at = datetime.strptime(stamp, "%Y%m%d_%H%M%S")
+    ended_at = None
+    if locked:
+        # 종료 시각은 기록돼 있지 않으므로 마지막 활동 시각(없으면 시작 시각)으로 대신함
+        activity = [f"MAX({c})" for c in ("clicked_at", "infected_at") if c in present]
+        if activity:
+            cur = await conn.execute(f"SELECT GREATEST({', '.join(activity)}) FROM {table}")
+            ended_at = (await cur.fetchone())[0]
+        ended_at = ended_at or started_at
+
+    campaign_id = await campaigns.create(table, started_at, ended_at, conn=conn)
+    # 열람·감염 상태는 events 로 옮기고, 커밋 후 요약 갱신으로 recipients 에 다시 채움
+    cur = await conn.execute(
+        f"INSERT INTO recipients (campaign_id, {', '.join(DB_COLUMNS)})"
+        f" SELECT %s, {', '.join(select[c] for c in DB_COLUMNS)} FROM {table}"
+        " ON CONFLICT (campaign_id, id) DO NOTHING",
+        (campaign_id,),
+    )
+    copied = cur.rowcount
+    hit = ", ".join(select[c] for c in HIT_COLUMNS)
+    for kind, ts in (("click", select["clicked_at"]), ("infect", select["infected_at"])):
+        if ts == "NULL":
+            continue
+        await conn.execute(
+            f"INSERT INTO events (campaign_id, recipient_id, kind, occurred_at, {', '.join(HIT_COLUMNS)})"
+            f" SELECT %s, id, %s, {ts}, {hit} FROM {table} WHERE {ts} IS NOT NULL",
+            (campaign_id, kind),
+        )
+    if drop:
+        await conn.execute(f"DROP TABLE {table}")
+    return campaign_id, copied
+
+
+async def finish(campaign_id: int, table: str):
+    """Build summaries and rollups for an imported campaign (safe to repeat)."""
+    await summaries.refresh(campaign_id, wait=True, hold=False)  # 가져온 이벤트는 모두 확정된 것
+    # 가져온 대상자 수는 bulk_insert 를 거치지 않으므로 롤업은 한 번 다시 계산
+    await analytics.rebuild(campaign_id)
+    if LEGACY_RE.match(table).group(2):
+        await analytics.close_campaign(campaign_id)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="list the tables that would be imported")
+    parser.add_argument("--drop", action="store_true", help="drop each legacy table after importing it")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    await db.open_pool()
+    try:
+        await campaigns.create_schema()
+        await analytics.create_schema()
+        async with db.connection() as conn:
+            tables = await legacy_tables(conn)
+        if args.dry_run:
+            for table in tables:
+                print(table)
+            return
+        for table in tables:
+            # 테이블 하나씩 별도 트랜잭션 — 중간에 실패해도 가져온 훈련은 유지
+            try:
+                async with db.connection() as conn:
+                    imported = await import_table(conn, table, drop=args.drop)
+                if imported is None:
+                    # 이전 실행에서 요약 갱신 전에 중단됐을 수 있으므로 요약만 다시 (워터마크 기준이라 중복 없음)
+                    await finish(await campaigns.campaign_id(table), table)
+                    logging.info("%s: already imported, skipped", table)
+                    continue
+                campaign_id, copied = imported
+                await finish(campaign_id, table)
+            except Exception as e:
+                logging.error("%s: import failed: %s", table, e)
+                continue
+            logging.info("%s: %d recipients imported", table, copied)
+    finally:
+        await db.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
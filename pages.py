@@ -0,0 +1,115 @@
+import os
+import gzip
+import base64
+import hashlib
+import logging
+
+from fastapi import Request
+from fastapi.responses import Response
+
+# ───────── 메모리 응답 (추적 픽셀·랜딩 페이지) ─────────
+# 추적 요청마다 디스크를 읽거나 템플릿을 렌더링하지 않도록
+# 픽셀은 시작 시 한 번 읽어 두고, 수신자와 무관한 랜딩 페이지는 훈련마다 한 번 렌더링해
+# 원본·gzip·brotli 바이트와 ETag 를 메모리에 보관한다.
+PAGE_GZIP_LEVEL = int(os.getenv("PAGE_GZIP_LEVEL", "9"))         # 훈련당 한 번이므로 최대 압축
+PAGE_BROTLI_QUALITY = int(os.getenv("PAGE_BROTLI_QUALITY", "11"))
+PAGE_MIN_COMPRESS = 256  # 이보다 작은 페이지는 압축하지 않음
+
+try:
+    import brotli
+except ImportError:
+    brotli = None  # 설치되지 않았으면 gzip 만 제공
+
+# files/1x1.png 가 없을 때 쓰는 1x1 투명 PNG
+_BLANK_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+# 픽셀은 매 열람이 서버에 도달해야 하므로 캐시 금지 (프록시·메일 클라이언트 포함)
+PIXEL_HEADERS = {
+    "Cache-Control": "no-store, no-cache, must-revalidate, private, max-age=0",
+    "Pragma": "no-cache",
+    "Expires": "0",
+}
+
+
+def load_pixel(path: str) -> bytes:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        logging.warning("tracking pixel %s not found, using built-in blank PNG", path)
+        return _BLANK_PNG
+
+
+def pixel_response(pixel: bytes) -> Response:
+    return Response(content=pixel, media_type="image/png", headers=PIXEL_HEADERS)
+
+
+def _accepts(request: Request) -> set[str]:
+    # Accept-Encoding: gzip, deflate, br;q=0.9 — q=0 으로 명시한 인코딩은 제외
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        if coding and params not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(coding.lower())
+    return accepted
+
+
+class RenderedPage:
+    """One pre-rendered page: identity / gzip / brotli bodies sharing a single ETag."""
+
+    def __init__(self, html: str):
+        self.body = html.encode("utf-8")
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest()[:20] + '"'
+        self.encoded: dict[str, bytes] = {}
+        if len(self.body) >= PAGE_MIN_COMPRESS:
+            if brotli is not None:
+                self.encoded["br"] = brotli.compress(self.body, quality=PAGE_BROTLI_QUALITY)
+            self.encoded["gzip"] = gzip.compress(self.body, compresslevel=PAGE_GZIP_LEVEL, mtime=0)
+
+    def response(self, request: Request) -> Response:
+        headers = {"ETag": self.etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+        # no-cache: 브라우저는 보관하되 매번 재검증 → 방문(감염) 기록은 그대로 남고, 본문은 304 로 생략
+        if self.etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        accepted = _accepts(request)
+        for coding in ("br", "gzip"):
+            if coding in self.encoded and coding in accepted:
+                headers["Content-Encoding"] = coding
+                return Response(content=self.encoded[coding], media_type="text/html; charset=utf-8", headers=headers)
+        return Response(content=self.body, media_type="text/html; charset=utf-8", headers=headers)
+
+
+class PageCache:
+    """Static landing pages rendered once per campaign.
+
+    Pages are keyed by template name and tagged with the campaign table they
+    were rendered for; a hit for a different (new) campaign re-renders once,
+    so workers that learn about a new training via NOTIFY warm themselves.
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self._pages: dict[str, tuple[str | None, RenderedPage]] = {}
+
+    def warm(self, names, campaign: str | None):
+        for name in names:
+            self._render(name, campaign)
+
+    def _render(self, name: str, campaign: str | None) -> RenderedPage | None:
+        # 정적 페이지만 대상 — 템플릿에 넘기는 값 없음 (request 를 참조하는 템플릿은 렌더링 오류)
+        try:
+            page = RenderedPage(self.env.get_template(name).render())
+        except Exception as e:
+            # 실패도 훈련 단위로 기억 — 요청마다 다시 렌더링·경고하지 않음
+            logging.warning("landing page %s cannot be pre-rendered, rendering per request: %s", name, e)
+            page = None
+        self._pages[name] = (campaign, page)
+        return page
+
+    def response(self, name: str, campaign: str | None, request: Request) -> Response | None:
+        """Cached response, or None when the page cannot be pre-rendered (the caller renders it per request)."""
+        cached = self._pages.get(name)
+        page = cached[1] if cached and cached[0] == campaign else self._render(name, campaign)
+        return page.response(request) if page else None
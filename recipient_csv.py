@@ -0,0 +1,205 @@
+"""Recipient CSV: schema, validation and the streaming RecipientSource.
+
+Kept free of database imports so the control panel can count and sample a
+CSV without loading the DB layer; recipients re-exports everything here.
+"""
+import io
+import os
+import re
+import csv
+import uuid
+import codecs
+import random
+
+# ───────── 수신자 CSV 스키마 ─────────
+REQUIRED_COLUMNS = ["사번", "성명", "이메일", "부서", "직책"]
+EMAIL_RE = re.compile(r"^[^@\s,;<>]+@[^@\s,;<>]+\.[^@\s,;<>]+$")
+
+# 재시작 후에도 같은 수신자에게 같은 UUID 를 부여하기 위한 네임스페이스
+RECIPIENT_NAMESPACE = uuid.UUID("5f0c7c2e-4b1e-4d51-9d0a-2f3c1f6b7a10")
+
+
+# 대용량 CSV 스트리밍
+INDEX_STRIDE = 1000          # 바이트 오프셋을 기록하는 행 간격
+SNIFF_BYTES = 1 << 20        # 인코딩 판별에 읽는 앞부분 크기
+
+
+class RecipientSchemaError(ValueError):
+    pass
+
+
+def recipient_id(job_id: str, index: int) -> str:
+    return str(uuid.uuid5(RECIPIENT_NAMESPACE, f"{job_id}:{index}"))
+
+
+def check_columns(fieldnames):
+    missing = [c for c in REQUIRED_COLUMNS if c not in (fieldnames or [])]
+    if missing:
+        raise RecipientSchemaError(f"필수 컬럼 누락: {', '.join(missing)}")
+
+
+def validate_iter(rows):
+    """Yield (index, row, reject_reason) for (index, row) pairs without materialising them.
+
+    Addresses are checked for syntax and de-duplicated case-insensitively;
+    the first occurrence wins. reject_reason is None for accepted rows.
+    """
+    seen = {}
+    for index, row in rows:
+        email = (row.get("이메일") or "").strip()
+        if not email:
+            yield index, row, "이메일 없음"
+            continue
+        if not EMAIL_RE.match(email):
+            yield index, row, "이메일 형식 오류"
+            continue
+        key = email.lower()
+        if key in seen:
+            yield index, row, f"중복 (행 {seen[key] + 1})"
+            continue
+        seen[key] = index
+        row["이메일"] = email
+        yield index, row, None
+
+
+def validate(rows):
+    """Split (index, row) pairs into accepted rows and per-row rejects."""
+    accepted, rejects = [], []
+    for index, row, reason in validate_iter(rows):
+        if reason:
+            rejects.append({"index": index, "email": (row.get("이메일") or "").strip(), "reason": reason})
+        else:
+            accepted.append((index, row))
+    return accepted, rejects
+
+
+# ───────── 수신자 CSV 원본 ─────────
+class _Index:
+    def __init__(self, count: int, offsets: list[int]):
+        self.count = count        # 데이터 행 수 (헤더 제외)
+        self.offsets = offsets    # INDEX_STRIDE 행마다 해당 행의 시작 바이트 위치
+
+
+_indexes: dict[tuple, _Index] = {}
+
+
+def detect_encoding(path: str) -> str:
+    """utf-8 (with or without BOM) or cp949, judged from the head of the file."""
+    with open(path, "rb") as f:
+        head = f.read(SNIFF_BYTES)
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if len(head) == SNIFF_BYTES:
+        head = head[:head.rfind(b"\n") + 1]  # 잘린 멀티바이트 문자는 제외
+    try:
+        head.decode("utf-8")
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "cp949"  # 엑셀에서 저장한 한글 CSV
+
+
+def _record_starts(f, pos: int):
+    """Yield the byte offset of each non-blank CSV record, honouring quoted newlines.
+
+    '"' and '\\n' never occur inside multi-byte utf-8/cp949 characters, so
+    records can be delimited on raw bytes without decoding.
+    """
+    start, in_quotes = pos, False
+    for line in f:
+        if line.count(b'"') % 2:
+            in_quotes = not in_quotes
+        if not in_quotes:
+            if start != pos or line.strip(b"\r\n"):
+                yield start
+            start = pos + len(line)
+        pos += len(line)
+
+
+class RecipientSource:
+    """Lazily streamed recipient CSV.
+
+    Rows are read on demand; the first full scan caches the row count and a
+    sparse byte-offset index (keyed by path, size and mtime), so later
+    counts are free and random rows can be read with a seek.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.encoding = detect_encoding(path)
+        self._fieldnames = None
+
+    def _key(self) -> tuple:
+        st = os.stat(self.path)
+        return os.path.abspath(self.path), st.st_size, st.st_mtime_ns
+
+    @property
+    def fieldnames(self) -> list[str]:
+        if self._fieldnames is None:
+            with open(self.path, encoding=self.encoding, newline="") as f:
+                self._fieldnames = next(csv.reader(f), [])
+        return self._fieldnames
+
+    def check(self):
+        check_columns(self.fieldnames)
+
+    def index(self) -> _Index:
+        key = self._key()
+        idx = _indexes.get(key)
+        if idx is None:
+            with open(self.path, "rb") as f:
+                pos = 3 if f.read(3) == codecs.BOM_UTF8 else 0
+                f.seek(pos)
+                starts = _record_starts(f, pos)
+                next(starts, None)  # 헤더
+                count, offsets = 0, []
+                for start in starts:
+                    if count % INDEX_STRIDE == 0:
+                        offsets.append(start)
+                    count += 1
+            idx = _indexes[key] = _Index(count, offsets)
+        return idx
+
+    def count(self) -> int:
+        return self.index().count
+
+    def rows(self, start: int = 0):
+        """Yield (index, row) from data row `start` onwards."""
+        with open(self.path, "rb") as raw:
+            skip = 0
+            if start:
+                idx = self.index()
+                if start >= idx.count:
+                    return
+                raw.seek(idx.offsets[start // INDEX_STRIDE])
+                skip = start % INDEX_STRIDE
+                fieldnames = self.fieldnames
+            else:
+                fieldnames = None  # 첫 줄을 헤더로 읽음
+            text = io.TextIOWrapper(raw, encoding=self.encoding, newline="")
+            reader = csv.DictReader(text, fieldnames=fieldnames)
+            for i, row in enumerate(reader, start - skip):
+                if i >= start:
+                    yield i, row
+
+    def row(self, index: int) -> dict | None:
+        return next((row for _, row in self.rows(index)), None)
+
+    def validate(self):
+        """Stream (index, row, reject_reason) after checking the header; see validate_iter."""
+        self.check()
+        return validate_iter(self.rows())
+
+    def sample(self, k: int = 1, rng: random.Random = random) -> list[dict]:
+        """k random rows: direct seeks when the file is indexed, reservoir sampling otherwise."""
+        idx = _indexes.get(self._key())
+        if idx is not None:
+            return [self.row(i) for i in sorted(rng.sample(range(idx.count), min(k, idx.count)))]
+        reservoir = []
+        for i, row in self.rows():
+            if i < k:
+                reservoir.append(row)
+            else:
+                j = rng.randint(0, i)
+                if j < k:
+                    reservoir[j] = row
+        return reservoir
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import itertools
+from datetime import datetime
+
+import db
+import campaigns
+from recipient_csv import (  # CSV 스키마·검증·원본 (DB 비의존, GUI 에서도 사용)
+    REQUIRED_COLUMNS, EMAIL_RE, RECIPIENT_NAMESPACE, INDEX_STRIDE, SNIFF_BYTES,
+    RecipientSchemaError, RecipientSource, recipient_id, check_columns, validate_iter, validate, detect_encoding,
+)
+
+# CSV 컬럼 → 훈련 테이블 컬럼
+DB_COLUMNS = ["id", "employee_no", "name", "email", "department", "title"]
+
+INGEST_BATCH = 2000          # 작업 스레드에서 한 번에 읽어 오는 적재 행 수
+SENT_BATCH = 500             # 발송 시각을 모아서 기록하는 단위
+SENT_FLUSH_INTERVAL = 1.0    # 발송 시각 최대 기록 지연(초) — 발송 직후 스캐너 요청 판별에 사용되므로 짧게
+
+
+def _next_batch(recipients) -> list[tuple]:
+    return [
+        (unique_id, row.get("사번", ""), row.get("성명", ""), row.get("이메일", ""), row.get("부서", ""), row.get("직책", ""))
+        for unique_id, row in itertools.islice(recipients, INGEST_BATCH)
+    ]
+
+
+async def bulk_insert(table: str, recipients) -> int:
+    """Load (uuid, row) pairs into the recipients of campaign `table` with a single COPY.
+
+    Rows go through a temp staging table so the final insert can use
+    ON CONFLICT and stay idempotent when a job is resumed. The iterable is
+    consumed on a worker thread in INGEST_BATCH chunks, so it may parse and
+    validate the CSV but must not touch state owned by the event loop.
+    """
+    campaign_id = await campaigns.campaign_id(table)
+    if campaign_id is None:
+        raise LookupError(f"훈련 없음: {table}")
+    cols = ", ".join(DB_COLUMNS)
+    async with db.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "CREATE TEMP TABLE _recipients_stage (id UUID, employee_no TEXT, name TEXT, email TEXT,"
+                " department TEXT, title TEXT) ON COMMIT DROP"
+            )
+            # CSV 읽기·검증은 작업 스레드에서, 이벤트 루프는 COPY 쓰기만
+            recipients = iter(recipients)
+            async with cur.copy(f"COPY _recipients_stage ({cols}) FROM STDIN") as copy:
+                while batch := await asyncio.to_thread(_next_batch, recipients):
+                    for record in batch:
+                        await copy.write_row(record)
+            # 새로 들어간 행만 부서·직책별 대상자 수 롤업(analytics.py)에 더함 — 재개 시 중복 집계 없음
+            await cur.execute(
+                f"""
+                WITH ins AS (
+                    INSERT INTO recipients (campaign_id, {cols}) SELECT %(campaign_id)s, {cols} FROM _recipients_stage
+                    ON CONFLICT (campaign_id, id) DO NOTHING
+                    RETURNING department, title
+                ), rollup AS (
+                    INSERT INTO rollup_groups AS r (campaign_id, department, title, recipients)
+                    SELECT %(campaign_id)s, COALESCE(department, ''), COALESCE(title, ''), COUNT(*) FROM ins GROUP BY 2, 3
+                    ON CONFLICT (campaign_id, department, title) DO UPDATE SET recipients = r.recipients + EXCLUDED.recipients
+                )
+                SELECT COUNT(*) FROM ins
+                """,
+                {"campaign_id": campaign_id},
+            )
+            (inserted,) = await cur.fetchone()
+            return inserted
+
+
+async def mark_sent(table: str, sent: list[tuple[str, datetime]]):
+    """Record delivery times (for time-to-click analytics) in one statement."""
+    campaign_id = await campaigns.campaign_id(table)
+    if campaign_id is None:
+        return
+    await db.execute(
+        "UPDATE recipients AS t SET sent_at = v.sent_at"
+        " FROM unnest(%s::uuid[], %s::timestamp[]) AS v (id, sent_at)"
+        " WHERE t.campaign_id = %s AND t.id = v.id",
+        ([i for i, _ in sent], [ts for _, ts in sent], campaign_id),
+        prepare=True,
+    )
+
+
+class SentMarker:
+    """Buffers successful sends and writes their times in batches (SENT_BATCH / SENT_FLUSH_INTERVAL)."""
+
+    def __init__(self, table: str):
+        self.table = table
+        self._pending: list[tuple[str, datetime]] = []
+        self._timer: asyncio.Task | None = None
+
+    async def add(self, unique_id: str):
+        self._pending.append((unique_id, datetime.now()))
+        if len(self._pending) >= SENT_BATCH:
+            await self.flush()
+        elif self._timer is None:
+            # 발송이 뜸하거나 멈춰도(웨이브 대기 등) SENT_FLUSH_INTERVAL 안에 기록
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(SENT_FLUSH_INTERVAL)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        try:
+            await mark_sent(self.table, pending)
+        except Exception as e:
+            # 분석용 부가 정보라 실패해도 발송은 계속
+            logging.error("sent_at update error: %s", e)
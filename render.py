@@ -0,0 +1,171 @@
+import os
+import re
+import uuid
+import base64
+import asyncio
+import multiprocessing
+from email.header import Header
+from email.utils import formatdate, make_msgid
+from concurrent.futures import ProcessPoolExecutor
+
+from markupsafe import escape as html_escape
+from jinja2 import Environment, FileSystemLoader
+
+# ───────── 렌더링 설정 ─────────
+RENDER_PROCESSES = int(os.getenv("RENDER_PROCESSES", "0"))     # 0 = 현재 프로세스(작업 스레드)에서 렌더링
+RENDER_CHUNK = int(os.getenv("RENDER_CHUNK", "500"))           # 프로세스 풀에 넘기는 묶음 크기
+PLAIN_TEXT = "HTML 미지원 메일입니다.\n"
+CRLF = b"\r\n"
+
+# 수신자마다 달라지는 템플릿 변수
+PERSONAL_SLOTS = ("name", "uuid")
+
+_executor: ProcessPoolExecutor | None = None
+
+
+def _b64(data: bytes) -> bytes:
+    return base64.encodebytes(data).replace(b"\n", CRLF)
+
+
+def _header(name: str, value: str) -> bytes:
+    try:
+        value.encode("ascii")
+        encoded = value
+    except UnicodeEncodeError:
+        encoded = Header(value, "utf-8").encode()
+    return f"{name}: {encoded}".replace("\n", "\r\n").encode("ascii") + CRLF
+
+
+def _split(rendered: str, markers: dict[str, str]):
+    """Split a render into static fragments and the order in which slots appear."""
+    pattern = re.compile("|".join(re.escape(m) for m in markers.values()))
+    by_marker = {m: slot for slot, m in markers.items()}
+    fragments = pattern.split(rendered)
+    slots = [by_marker[m] for m in pattern.findall(rendered)]
+    return fragments, slots
+
+
+class MessageBuilder:
+    """Builds ready-to-send MIME bytes for one campaign template.
+
+    The template is rendered once with marker values for the personal slots
+    (name, uuid). If both marker renders split into identical static
+    fragments, per-recipient rendering is just a join of those fragments
+    with the escaped values; otherwise every message goes through Jinja.
+    The multipart envelope, subject and plain-text part are encoded once.
+    Instances are plain data so they can be shipped to a process pool.
+    """
+
+    def __init__(self, env: Environment, template_name: str, subject: str, sender: str, context: dict):
+        self.template_name = template_name
+        self.context = context
+        self.searchpath = list(getattr(env.loader, "searchpath", []))
+        autoescape = env.autoescape(template_name) if callable(env.autoescape) else env.autoescape
+        self.autoescape = bool(autoescape)
+        self.sender = sender or ""
+        self.msgid_domain = (sender or "localhost").rsplit("@", 1)[-1] or "localhost"
+        self._template = env.get_template(template_name)
+        self.fragments, self.slots = self._compile()
+
+        boundary = f"==============={uuid.uuid4().hex}=="
+        self.head = (
+            _header("Subject", subject)
+            + _header("From", self.sender)
+            + b"MIME-Version: 1.0" + CRLF
+            + f'Content-Type: multipart/alternative; boundary="{boundary}"'.encode() + CRLF
+        )
+        self.body_prefix = (
+            CRLF
+            + f"--{boundary}".encode() + CRLF
+            + b'Content-Type: text/plain; charset="utf-8"' + CRLF
+            + b"Content-Transfer-Encoding: base64" + CRLF + CRLF
+            + _b64(PLAIN_TEXT.encode("utf-8"))
+            + f"--{boundary}".encode() + CRLF
+            + b'Content-Type: text/html; charset="utf-8"' + CRLF
+            + b"Content-Transfer-Encoding: base64" + CRLF + CRLF
+        )
+        self.body_suffix = f"--{boundary}--".encode() + CRLF
+
+    @property
+    def precompiled(self) -> bool:
+        return self.fragments is not None
+
+    def _compile(self):
+        renders = []
+        for variant in ("a", "b"):
+            markers = {slot: f"\x00rcpt{variant}{slot}{uuid.uuid4().hex}\x00" for slot in PERSONAL_SLOTS}
+            html = self._template.render(**self.context, **markers)
+            renders.append(_split(html, markers))
+        (frag_a, slots_a), (frag_b, slots_b) = renders
+        # 필터·조건문 등으로 변수가 가공되면 두 렌더 결과가 달라짐 → Jinja 렌더링으로 대체
+        if frag_a != frag_b or slots_a != slots_b or "\x00" in "".join(frag_a):
+            return None, None
+        return frag_a, slots_a
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_template"] = None  # 프로세스 풀로 보낼 때는 템플릿 객체 대신 경로만 전달
+        return state
+
+    def _jinja_template(self):
+        if self._template is None:
+            env = Environment(loader=FileSystemLoader(self.searchpath), autoescape=self.autoescape)
+            self._template = env.get_template(self.template_name)
+        return self._template
+
+    def render_html(self, values: dict) -> str:
+        if self.fragments is None:
+            return self._jinja_template().render(**self.context, **values)
+        esc = html_escape if self.autoescape else str
+        out = [self.fragments[0]]
+        for slot, fragment in zip(self.slots, self.fragments[1:]):
+            out.append(str(esc(values.get(slot, ""))))
+            out.append(fragment)
+        return "".join(out)
+
+    def build(self, to: str, values: dict) -> bytes:
+        html = self.render_html(values)
+        return (
+            self.head
+            + _header("To", to)
+            + _header("Date", formatdate(localtime=True))
+            + _header("Message-ID", make_msgid(domain=self.msgid_domain))
+            + self.body_prefix
+            + _b64(html.encode("utf-8"))
+            + self.body_suffix
+        )
+
+    def build_chunk(self, items: list[tuple[str, dict]]) -> list[bytes]:
+        return [self.build(to, values) for to, values in items]
+
+    async def build_many(self, items: list[tuple[str, dict]]) -> list[bytes]:
+        """Build a batch of messages, fanned out over the process pool when configured."""
+        if not RENDER_PROCESSES or len(items) <= RENDER_CHUNK:
+            # 풀이 없어도 렌더링·base64 인코딩은 작업 스레드에서 — 발송 중에도 추적 요청이 밀리지 않음
+            return await asyncio.to_thread(self.build_chunk, items)
+        loop = asyncio.get_running_loop()
+        chunks = [items[i:i + RENDER_CHUNK] for i in range(0, len(items), RENDER_CHUNK)]
+        results = await asyncio.gather(*(
+            loop.run_in_executor(_pool(), _build_chunk, self, chunk) for chunk in chunks
+        ))
+        return [m for chunk in results for m in chunk]
+
+
+def _build_chunk(builder: MessageBuilder, items):
+    return builder.build_chunk(items)
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: 이벤트 루프·DB 연결을 가진 서버 프로세스를 fork 하지 않음
+        _executor = ProcessPoolExecutor(max_workers=RENDER_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
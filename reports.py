@@ -0,0 +1,203 @@
+import io
+import os
+import csv
+import asyncio
+from datetime import datetime
+
+import db
+import campaigns
+
+# ───────── 보고서 컬럼 ─────────
+COLUMNS = [
+    "id", "employee_no", "name", "email", "department", "title", "open_count", "infect_count",
+    "ip_address", "user_agent", "referer", "accept_language", "clicked_at", "infected_at",
+]
+HEADER_MAP = {
+    "id": "ID",
+    "employee_no": "사번",
+    "name": "이름",
+    "email": "이메일",
+    "department": "부서",
+    "title": "직책",
+    "open_count": "열람 횟수",
+    "infect_count": "감염 횟수",
+    "ip_address": "IP",
+    "user_agent": "User-Agent",
+    "referer": "Referer",
+    "accept_language": "Accept-Language",
+    "clicked_at": "열람 시각",
+    "infected_at": "감염 시각",
+}
+BATCH_SIZE = int(os.getenv("REPORT_BATCH_SIZE", "5000"))  # 서버측 커서에서 한 번에 가져올 행 수
+
+
+class ReportFormatError(ValueError):
+    pass
+
+
+def _status(row) -> str:
+    # row 마지막 두 컬럼이 clicked_at, infected_at
+    return "감염" if row[-1] else ("열람" if row[-2] else "미열람")
+
+
+def _title_rows(summary: dict, display_ts: str) -> list[list]:
+    return [
+        ["", ""] + [f"({display_ts}) 훈련결과"] + [""] * (len(COLUMNS) - 2),
+        [
+            "총 대상자 수", summary["total"],
+            "총 열람수", summary["viewed"],
+            "총 감염수", summary["infected"],
+            "감염률", f"{summary['infection_rate']}%",
+        ],
+        [],
+        [HEADER_MAP[c] for c in COLUMNS] + ["상태"],
+    ]
+
+
+# ───────── 형식별 writer (행 묶음 단위로 기록) ─────────
+class CsvReport:
+    ext = "csv"
+
+    def __init__(self, path: str, summary: dict, display_ts: str):
+        self.f = open(path, "w", encoding="utf-8-sig", newline="")
+        self.writer = csv.writer(self.f)
+        self.writer.writerows(_title_rows(summary, display_ts))
+
+    def write_rows(self, rows):
+        self.writer.writerows(list(r) + [_status(r)] for r in rows)
+
+    def close(self):
+        self.f.close()
+
+
+class XlsxReport:
+    ext = "xlsx"
+
+    def __init__(self, path: str, summary: dict, display_ts: str):
+        try:
+            from openpyxl import Workbook
+        except ImportError:
+            raise ReportFormatError("xlsx 보고서에는 openpyxl 패키지가 필요합니다")
+        self.path = path
+        self.wb = Workbook(write_only=True)  # 행을 메모리에 쌓지 않고 바로 기록
+        self.ws = self.wb.create_sheet("훈련결과")
+        for row in _title_rows(summary, display_ts):
+            self.ws.append(row)
+
+    def write_rows(self, rows):
+        for r in rows:
+            self.ws.append([str(v) if k == "id" and v else v for k, v in zip(COLUMNS, r)] + [_status(r)])
+
+    def close(self):
+        self.wb.save(self.path)
+
+
+class ParquetReport:
+    ext = "parquet"
+
+    def __init__(self, path: str, summary: dict, display_ts: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ReportFormatError("parquet 보고서에는 pyarrow 패키지가 필요합니다")
+        self.pa = pa
+        fields = [
+            pa.field(c, pa.timestamp("us") if c.endswith("_at") else pa.int32() if c.endswith("_count") else pa.string())
+            for c in COLUMNS
+        ] + [pa.field("status", pa.string())]
+        # 요약 통계는 파일 메타데이터로 보관
+        metadata = {k: str(v) for k, v in summary.items()}
+        metadata["generated_at"] = display_ts
+        self.schema = pa.schema(fields, metadata=metadata)
+        self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write_rows(self, rows):
+        columns = [list(col) for col in zip(*rows)] if rows else [[] for _ in COLUMNS]
+        columns[0] = [str(v) for v in columns[0]]
+        columns.append([_status(r) for r in rows])
+        self.writer.write_table(self.pa.Table.from_arrays(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {w.ext: w for w in (CsvReport, XlsxReport, ParquetReport)}
+
+
+# ───────── 조회 ─────────
+async def _campaign_id(table: str) -> int:
+    campaign_id = await campaigns.campaign_id(table)
+    if campaign_id is None:
+        raise LookupError(f"훈련 없음: {table}")
+    return campaign_id
+
+
+async def summary(table: str) -> dict:
+    total, viewed, infected = await db.fetch_one(
+        "SELECT COUNT(*), COUNT(clicked_at), COUNT(infected_at) FROM recipients WHERE campaign_id = %s",
+        (await _campaign_id(table),),
+    )
+    return {
+        "total": total,
+        "viewed": viewed,
+        "infected": infected,
+        "infection_rate": round(infected / total * 100, 2) if total else 0,
+    }
+
+
+async def iter_batches(table: str, batch_size: int = BATCH_SIZE):
+    """Yield row batches from a server-side (named) cursor; memory stays at one batch."""
+    campaign_id = await _campaign_id(table)
+    async with db.connection() as conn:
+        async with conn.cursor(name=f"report_c{campaign_id}") as cur:
+            await cur.execute(f"SELECT {', '.join(COLUMNS)} FROM recipients WHERE campaign_id = %s", (campaign_id,))
+            while True:
+                rows = await cur.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield rows
+
+
+async def export(table: str, formats: list[str], out_dir: str = "logs", stats: dict | None = None,
+                 batches=None) -> list[str]:
+    """Write every requested format in one pass over the table; returns file paths.
+
+    `stats` / `batches` replace the database summary and cursor (archive.py re-exports from Parquet).
+    """
+    unknown = [f for f in formats if f not in WRITERS]
+    if unknown:
+        raise ReportFormatError(f"지원하지 않는 형식: {', '.join(unknown)}")
+    stats = stats or await summary(table)
+    now = datetime.now()
+    now_str = now.strftime("%Y%m%d_%H%M")
+    display_ts = now.strftime("%Y-%m-%d %H:%M:%S")
+    os.makedirs(out_dir, exist_ok=True)
+
+    writers = []
+    try:
+        for fmt in formats:
+            path = os.path.join(out_dir, f"final_report_{now_str}.{fmt}")
+            writers.append((path, WRITERS[fmt](path, stats, display_ts)))
+        async for rows in batches or iter_batches(table):
+            # 파일 기록은 스레드에서 → 이벤트 루프를 막지 않음
+            await asyncio.gather(*(asyncio.to_thread(w.write_rows, rows) for _, w in writers))
+    finally:
+        for _, w in writers:
+            await asyncio.to_thread(w.close)
+    return [path for path, _ in writers]
+
+
+async def stream_csv(table: str, stats: dict | None = None, batches=None):
+    """CSV report as an async iterator of text chunks, for a StreamingResponse."""
+    stats = stats or await summary(table)
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    buf.write("﻿")  # 엑셀에서 한글이 깨지지 않도록 BOM
+    writer.writerows(_title_rows(stats, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+    async for rows in batches or iter_batches(table):
+        writer.writerows(list(r) + [_status(r)] for r in rows)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()
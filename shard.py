@@ -0,0 +1,410 @@
+import os
+import csv
+import json
+import time
+import shutil
+import asyncio
+import logging
+import multiprocessing
+
+import db
+import metrics
+import logsetup
+import recipients
+from render import MessageBuilder, RENDER_CHUNK
+
+# ───────── 샤드 발송 설정 ─────────
+# 대용량 CSV 는 수신자를 N 개 샤드로 나눠 각각 별도 프로세스(자체 SMTP 세션·DB 연결)에서 발송하고,
+# 작업(CampaignJob)은 샤드 저널을 모아 진행 현황과 최종 수신기록 CSV 를 만든다.
+SEND_SHARDS = int(os.getenv("SEND_SHARDS", "0"))                          # 0/1 = 서버 프로세스에서 발송
+SHARD_SMTP_POOL_SIZE = int(os.getenv("SHARD_SMTP_POOL_SIZE", "0"))   # 샤드별 SMTP 세션 수 (0 = SMTP_POOL_SIZE)
+POLL_INTERVAL = 1.0      # 작업 측 저널 집계·제어 파일 갱신 주기(초)
+CONTROL_POLL = 0.5       # 샤드 측 제어 파일 확인 주기(초)
+STOP_TIMEOUT = 30.0      # 중단 요청 후 샤드 프로세스 종료 대기(초)
+
+RUN, PAUSE, STOP = "run", "pause", "stop"
+ROW_COLUMNS = ["_index"] + recipients.REQUIRED_COLUMNS
+RESULT_COLUMNS = recipients.REQUIRED_COLUMNS + ["수신", "오류메시지"]
+
+
+def shard_dir(jobs_dir: str, job_id: str) -> str:
+    return os.path.join(jobs_dir, f"{job_id}.shards")
+
+
+class ShardFiles:
+    """File layout of one shard inside the job's shard directory."""
+
+    def __init__(self, directory: str, k: int):
+        self.rows = os.path.join(directory, f"shard-{k}.csv")        # 분할된 수신자 (행 번호 포함)
+        self.journal = os.path.join(directory, f"shard-{k}.jsonl")   # 수신자별 발송 결과
+        self.ok = os.path.join(directory, f"shard-{k}.ok.csv")       # 완료 시 성공 행
+        self.fail = os.path.join(directory, f"shard-{k}.fail.csv")   # 완료 시 실패 행 (완료 표시)
+
+    @property
+    def complete(self) -> bool:
+        return os.path.exists(self.fail)
+
+
+def _write_text_atomic(path: str, text: str):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _read_control(directory: str) -> str:
+    try:
+        with open(os.path.join(directory, "control"), encoding="utf-8") as f:
+            return f.read().strip() or RUN
+    except FileNotFoundError:
+        return RUN
+
+
+def _write_control(directory: str, state: str):
+    _write_text_atomic(os.path.join(directory, "control"), state)
+
+
+def _iter_rows(path: str):
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            yield int(row.pop("_index")), row
+
+
+def _read_journal(path: str) -> dict[int, dict]:
+    done = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # 비정상 종료로 잘린 마지막 줄
+                done[entry["i"]] = entry
+    return done
+
+
+class JournalTail:
+    """Incrementally counts successes/failures appended to a shard journal."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offset = 0
+        self.sent = 0
+        self.failed = 0
+
+    def poll(self):
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(self.offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n") + 1  # 아직 쓰는 중인 마지막 줄은 다음 번에
+        for line in data[:end].splitlines():
+            try:
+                ok = json.loads(line)["ok"]
+            except ValueError:
+                continue
+            if ok:
+                self.sent += 1
+            else:
+                self.failed += 1
+        self.offset += end
+
+
+def journal_counts(directory: str) -> tuple[int, int]:
+    """(sent, failed) summed over every shard journal in `directory`."""
+    sent = failed = 0
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.endswith(".jsonl"):
+                tail = JournalTail(os.path.join(directory, name))
+                tail.poll()
+                sent += tail.sent
+                failed += tail.failed
+    return sent, failed
+
+
+# ───────── 분할 (작업 프로세스, 스레드에서 실행) ─────────
+def partition(csv_path: str, directory: str, shards: int) -> dict:
+    """Stream the CSV once into `shards` row files plus a rejects file; returns the manifest.
+
+    Rows are validated and de-duplicated on the fly and dealt round-robin,
+    so only one row and the set of seen addresses are held in memory.
+    """
+    os.makedirs(directory, exist_ok=True)
+    files = [ShardFiles(directory, k) for k in range(shards)]
+    handles = [open(f.rows, "w", encoding="utf-8", newline="") for f in files]
+    rejects_path = os.path.join(directory, "rejects.csv")
+    total = accepted = 0
+    try:
+        writers = [csv.DictWriter(h, fieldnames=ROW_COLUMNS, extrasaction="ignore") for h in handles]
+        for w in writers:
+            w.writeheader()
+        with open(rejects_path, "w", encoding="utf-8", newline="") as rf:
+            rejects = csv.DictWriter(rf, fieldnames=ROW_COLUMNS + ["오류메시지"], extrasaction="ignore")
+            rejects.writeheader()
+            for index, row, reason in recipients.RecipientSource(csv_path).validate():
+                total += 1
+                if reason:
+                    rejects.writerow({**row, "_index": index, "오류메시지": reason})
+                    continue
+                writers[accepted % shards].writerow({**row, "_index": index})
+                accepted += 1
+    finally:
+        for h in handles:
+            h.close()
+    manifest = {"shards": shards, "total": total, "accepted": accepted}
+    _write_text_atomic(os.path.join(directory, "manifest.json"), json.dumps(manifest))
+    return manifest
+
+
+def _load_manifest(directory: str) -> dict | None:
+    try:
+        with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def iter_rejects(directory: str):
+    """(index, reason) for every row rejected during partitioning."""
+    with open(os.path.join(directory, "rejects.csv"), encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            yield int(row["_index"]), row["오류메시지"]
+
+
+# ───────── 샤드 프로세스 ─────────
+def _shard_main(spec: dict):
+    logsetup.configure({"shard": spec["k"]})
+    asyncio.run(_run_shard(spec))
+
+
+async def _run_shard(spec: dict):
+    files = ShardFiles(spec["dir"], spec["k"])
+    job_id = spec["job_id"]
+
+    # 샤드 몫의 수신자를 자체 DB 연결로 적재 (ON CONFLICT 로 재개 시에도 안전)
+    # 풀은 발송 시각 기록을 위해 발송이 끝날 때까지 유지
+    await db.open_pool()
+    try:
+        await recipients.bulk_insert(
+            spec["table"], ((recipients.recipient_id(job_id, i), row) for i, row in _iter_rows(files.rows))
+        )
+
+        done = _read_journal(files.journal)
+        sent = recipients.SentMarker(spec["table"])
+        with open(files.journal, "a", encoding="utf-8") as journal:
+            def record(index: int, ok: bool, error: str = ""):
+                entry = {"i": index, "ok": ok, "error": error}
+                done[index] = entry
+                journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                journal.flush()
+
+            try:
+                finished = await _send_shard(spec, files, done, record, sent)
+            finally:
+                await sent.flush()
+    finally:
+        await db.close_pool()
+
+    if finished:
+        _write_parts(files, done)
+        logging.info("shard done (%d recipients)", len(done))
+
+
+async def _send_shard(spec: dict, files: ShardFiles, done: dict, record, sent: recipients.SentMarker) -> bool:
+    """Send every not-yet-journaled row; returns False if stopped by the job."""
+    builder: MessageBuilder = spec["builder"]
+    running, stopped = asyncio.Event(), asyncio.Event()
+
+    async def watch():
+        while True:
+            state = _read_control(spec["dir"])
+            if state == STOP:
+                stopped.set()
+                return
+            if state == PAUSE:
+                running.clear()
+            else:
+                running.set()
+            await asyncio.sleep(CONTROL_POLL)
+
+    from mailer import SMTPPool
+
+    async with SMTPPool.from_env(size=spec["smtp_size"], rate_per_sec=spec["rate"]) as smtp:
+        outbox = asyncio.Queue(maxsize=RENDER_CHUNK)
+
+        async def producer():
+            chunk = []
+            for index, row in _iter_rows(files.rows):
+                if index in done:
+                    continue  # 이미 처리된 수신자는 재발송하지 않음
+                chunk.append((index, row))
+                if len(chunk) >= RENDER_CHUNK:
+                    await flush(chunk)
+                    chunk = []
+            await flush(chunk)
+            for _ in range(smtp.size):
+                await outbox.put(None)
+
+        async def flush(chunk):
+            if not chunk:
+                return
+            try:
+                with metrics.span("render"):
+                    messages = builder.build_chunk([
+                        (row.get("이메일", ""), {"name": row.get("성명", ""), "uuid": recipients.recipient_id(spec["job_id"], index)})
+                        for index, row in chunk
+                    ])
+            except Exception as e:
+                logging.error("render error: %s", e)
+                for index, _ in chunk:
+                    record(index, False, f"렌더링 실패: {e}")
+                return
+            for (index, row), data in zip(chunk, messages):
+                await outbox.put((index, row, data))
+
+        async def worker():
+            while True:
+                item = await outbox.get()
+                if item is None:
+                    return
+                await running.wait()
+                index, row, data = item
+                try:
+                    await smtp.send_raw(builder.sender, row.get("이메일", ""), data)
+                    record(index, True)
+                except Exception as e:
+                    logging.error("SMTP send error for %s: %s", row.get("이메일"), e)
+                    record(index, False, str(e))
+                    continue
+                await sent.add(recipients.recipient_id(spec["job_id"], index))
+
+        watcher = asyncio.create_task(watch())
+        sending = asyncio.ensure_future(asyncio.gather(producer(), *(worker() for _ in range(smtp.size))))
+        await asyncio.wait({watcher, sending}, return_when=asyncio.FIRST_COMPLETED)
+        if not sending.done():
+            sending.cancel()
+            try:
+                await sending
+            except asyncio.CancelledError:
+                pass
+            return False
+        watcher.cancel()
+        sending.result()
+        return True
+
+
+def _write_parts(files: ShardFiles, done: dict):
+    with open(files.ok, "w", encoding="utf-8", newline="") as ok_f, \
+            open(f"{files.fail}.tmp", "w", encoding="utf-8", newline="") as fail_f:
+        ok_w = csv.DictWriter(ok_f, fieldnames=RESULT_COLUMNS, extrasaction="ignore")
+        fail_w = csv.DictWriter(fail_f, fieldnames=RESULT_COLUMNS, extrasaction="ignore")
+        for index, row in _iter_rows(files.rows):
+            entry = done.get(index)
+            if entry is None:
+                continue
+            if entry["ok"]:
+                ok_w.writerow({**row, "수신": "성공"})
+            else:
+                fail_w.writerow({**row, "수신": "실패", "오류메시지": entry["error"]})
+    os.replace(f"{files.fail}.tmp", files.fail)  # 실패 파일이 생기면 샤드 완료
+
+
+# ───────── 작업 측 조정 ─────────
+async def run(job, builder: MessageBuilder, shards: int, jobs_dir: str) -> str:
+    """Drive a sharded send for `job` and return the merged 수신기록 CSV path.
+
+    Partitions the CSV once (kept across restarts), records rejects in the
+    job journal, starts one spawned process per unfinished shard and mirrors
+    the job's pause/resume state into a control file the shards poll.
+    Cancelling the calling task asks the shards to stop and waits for them.
+    """
+    directory = shard_dir(jobs_dir, job.id)
+    manifest = _load_manifest(directory)
+    if manifest is None:
+        manifest = await asyncio.to_thread(partition, job.payload["csv_path"], directory, shards)
+    shards = manifest["shards"]
+    job.total = manifest["total"]
+    for index, reason in iter_rejects(directory):
+        if index not in job.done:
+            job._record(index, False, reason, rejected=True)
+    job.ingested = True
+    job.checkpoint()
+
+    files = [ShardFiles(directory, k) for k in range(shards)]
+    tails = [JournalTail(f.journal) for f in files]
+    _write_control(directory, RUN if job._unpaused.is_set() else PAUSE)
+
+    # mailer(aiosmtplib)는 발송 시에만 로드
+    from mailer import SMTP_POOL_SIZE, SMTP_RATE_PER_SEC
+
+    ctx = multiprocessing.get_context("spawn")
+    rate = SMTP_RATE_PER_SEC / shards if SMTP_RATE_PER_SEC else 0  # 릴레이 전체 한도를 샤드에 나눔
+    procs = {}
+    for k, f in enumerate(files):
+        if f.complete:
+            continue
+        spec = {
+            "k": k, "dir": directory, "job_id": job.id, "table": job.table,
+            "builder": builder, "smtp_size": SHARD_SMTP_POOL_SIZE or SMTP_POOL_SIZE, "rate": rate,
+        }
+        procs[k] = ctx.Process(target=_shard_main, args=(spec,), name=f"campaign-{job.id}-shard-{k}")
+        procs[k].start()
+
+    def tally():
+        for t in tails:
+            t.poll()
+        # 샤드 모드에서 작업 저널에는 적재 제외 행만 기록되므로 성공·실패는 샤드 저널이 기준
+        job.sent = sum(t.sent for t in tails)
+        job.failed = sum(t.failed for t in tails)
+
+    try:
+        while any(p.is_alive() for p in procs.values()):
+            _write_control(directory, RUN if job._unpaused.is_set() else PAUSE)
+            tally()
+            if time.monotonic() - job._last_checkpoint >= POLL_INTERVAL:
+                job.checkpoint()
+            await asyncio.sleep(POLL_INTERVAL)
+    except asyncio.CancelledError:
+        _write_control(directory, STOP)
+        await asyncio.to_thread(_join, procs.values(), STOP_TIMEOUT)
+        tally()
+        raise
+    tally()
+
+    broken = [k for k, f in enumerate(files) if not f.complete]
+    if broken:
+        codes = ", ".join(f"{k}:{procs[k].exitcode}" for k in broken if k in procs)
+        raise RuntimeError(f"샤드 발송 실패 (shard:exitcode {codes})")
+    return await asyncio.to_thread(_merge, directory, files)
+
+
+def _join(procs, timeout: float):
+    deadline = time.monotonic() + timeout
+    for p in procs:
+        p.join(max(0.0, deadline - time.monotonic()))
+        if p.is_alive():
+            logging.warning("%s did not stop in time, terminating", p.name)
+            p.terminate()
+            p.join()
+
+
+def _merge(directory: str, files: list[ShardFiles]) -> str:
+    """Concatenate shard results (successes, then failures, then rejects) into one CSV."""
+    out_file = f"수신기록_{time.strftime('%Y%m%d_%H%M%S')}.csv"
+    with open(out_file, "w", newline="", encoding="utf-8-sig") as out:
+        csv.DictWriter(out, fieldnames=RESULT_COLUMNS).writeheader()
+        for part in [f.ok for f in files] + [f.fail for f in files]:
+            with open(part, encoding="utf-8", newline="") as src:
+                shutil.copyfileobj(src, out)
+        writer = csv.DictWriter(out, fieldnames=RESULT_COLUMNS, extrasaction="ignore")
+        with open(os.path.join(directory, "rejects.csv"), encoding="utf-8", newline="") as rf:
+            writer.writerows({**row, "수신": "실패"} for row in csv.DictReader(rf))
+    # 수신자 사본은 지우고 저널(행 번호·결과만)은 진행 현황 조회용으로 남김
+    for f in files:
+        for path in (f.rows, f.ok, f.fail):
+            os.remove(path)
+    os.remove(os.path.join(directory, "rejects.csv"))
+    return out_file
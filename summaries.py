@@ -0,0 +1,184 @@
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+import db
+import metrics
+import campaigns
+import recipients
+import trackfilter
+import training_state
+
+# ───────── 수신자별 요약 (events → recipients) ─────────
+# 추적 요청은 events 에 추가만 하고(행 잠금 경쟁 없음), recipients 의 상태 컬럼
+# (최초 열람·감염 시각, 횟수, 마지막 접속 정보)은 여기서 주기적으로 증분 갱신한다.
+# 증분 구간은 트랜잭션 ID(xid8) 기준: 이전 워터마크 이상 ~ 현재 스냅샷 xmin 미만인 이벤트는
+# 모두 커밋(또는 롤백)이 끝난 것이므로, 늦게 커밋된 배치도 빠짐없이 정확히 한 번 반영된다.
+SUMMARY_INTERVAL = float(os.getenv("SUMMARY_INTERVAL", "1"))  # 요약 갱신 주기(초)
+# 발송 시각(sent_at)은 SentMarker 가 모아서 기록하므로, 아직 sent_at 이 없는 수신자의 최근 이벤트는
+# 발송 직후(스캐너) 요청인지 판단할 수 없다 → 이 시간(초)이 지날 때까지 워터마크를 그 앞에서 멈춘다.
+SUMMARY_HOLD = trackfilter.TRACK_SCANNER_DELAY + recipients.SENT_FLUSH_INTERVAL + 1
+
+# 판별 보류 대상 중 가장 앞선 이벤트 — 워터마크 상한을 여기로 낮춤
+_HOLD_SQL = """
+    SELECT min(e.xid)::text
+      FROM events e
+      LEFT JOIN recipients s ON s.campaign_id = e.campaign_id AND s.id = e.recipient_id
+     WHERE e.campaign_id = %(campaign_id)s
+       AND e.xid >= %(lo)s::xid8 AND e.xid < %(hi)s::xid8
+       AND e.scanner IS NULL AND s.sent_at IS NULL
+       AND e.occurred_at > %(cutoff)s
+"""
+
+_REFRESH_SQL = """
+    WITH agg AS (
+        SELECT e.recipient_id,
+               MIN(e.occurred_at)                                     AS first_open,  -- 감염은 열람을 포함
+               MIN(e.occurred_at) FILTER (WHERE e.kind = 'infect')    AS first_infect,
+               COUNT(*) FILTER (WHERE e.kind = 'click')               AS opens,
+               COUNT(*) FILTER (WHERE e.kind = 'infect')              AS infects,
+               MAX(e.occurred_at)                                     AS last_seen,
+               (array_agg(e.ip_address ORDER BY e.occurred_at DESC))[1]      AS ip,
+               (array_agg(e.user_agent ORDER BY e.occurred_at DESC))[1]      AS ua,
+               (array_agg(e.referer ORDER BY e.occurred_at DESC))[1]         AS ref,
+               (array_agg(e.accept_language ORDER BY e.occurred_at DESC))[1] AS lang
+          FROM events e
+          LEFT JOIN recipients s ON s.campaign_id = e.campaign_id AND s.id = e.recipient_id
+         WHERE e.campaign_id = %(campaign_id)s
+           AND e.xid >= %(lo)s::xid8 AND e.xid < %(hi)s::xid8
+           -- 스캐너 요청은 요약에서 제외: 수집 시 판별된 것 + 발송 직후(TRACK_SCANNER_DELAY 이내) 요청
+           AND e.scanner IS NULL
+           AND (s.sent_at IS NULL OR e.occurred_at >= s.sent_at + make_interval(secs => %(scanner_delay)s))
+         GROUP BY e.recipient_id
+    ), prev AS (
+        SELECT r.id, r.clicked_at, r.infected_at
+          FROM recipients r JOIN agg ON agg.recipient_id = r.id
+         WHERE r.campaign_id = %(campaign_id)s
+    )
+    UPDATE recipients AS t
+       SET clicked_at      = LEAST(t.clicked_at, agg.first_open),
+           infected_at     = LEAST(t.infected_at, agg.first_infect),
+           open_count      = t.open_count + agg.opens,
+           infect_count    = t.infect_count + agg.infects,
+           last_seen_at    = GREATEST(t.last_seen_at, agg.last_seen),
+           -- 접속 정보는 가장 최근 요청 기준 (반영 순서와 무관하게 시각으로 판단)
+           ip_address      = CASE WHEN t.last_seen_at IS NULL OR agg.last_seen >= t.last_seen_at THEN agg.ip ELSE t.ip_address END,
+           user_agent      = CASE WHEN t.last_seen_at IS NULL OR agg.last_seen >= t.last_seen_at THEN agg.ua ELSE t.user_agent END,
+           referer         = CASE WHEN t.last_seen_at IS NULL OR agg.last_seen >= t.last_seen_at THEN agg.ref ELSE t.referer END,
+           accept_language = CASE WHEN t.last_seen_at IS NULL OR agg.last_seen >= t.last_seen_at THEN agg.lang ELSE t.accept_language END
+      FROM agg JOIN prev p ON p.id = agg.recipient_id
+     WHERE t.campaign_id = %(campaign_id)s
+       AND t.id = agg.recipient_id
+    RETURNING t.department,
+              t.title,
+              p.clicked_at IS NULL AND t.clicked_at IS NOT NULL,
+              p.infected_at IS NULL AND t.infected_at IS NOT NULL,
+              agg.opens,
+              agg.infects,
+              t.id
+"""
+
+
+async def refresh(campaign_id: int, wait: bool = False, hold: bool = True) -> tuple[str, list, list] | None:
+    """Fold newly committed events into the campaign's recipient rows.
+
+    Returns (campaign name, departments newly opened, departments newly
+    infected), or None when another worker is refreshing the same campaign
+    (with wait=True it waits for that worker instead). hold=False folds
+    everything up to the snapshot, including recent hits whose recipient has
+    no sent_at yet — for the closing refresh of an ended campaign.
+    """
+    import analytics  # 롤업 계층은 첫 갱신 때 로드 (import main 을 가볍게)
+    async with db.connection() as conn, conn.transaction():
+        # 상한은 행 잠금(= 자기 트랜잭션 ID 할당) 전에 구함
+        cur = await conn.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text", prepare=True)
+        (hi,) = await cur.fetchone()
+        # NO KEY UPDATE: 이벤트·수신자 INSERT 의 외래키 잠금(KEY SHARE)과 충돌하지 않음
+        cur = await conn.execute(
+            "SELECT name, summarized_xid::text FROM campaigns WHERE id = %s FOR NO KEY UPDATE"
+            + ("" if wait else " SKIP LOCKED"),
+            (campaign_id,),
+            prepare=True,
+        )
+        row = await cur.fetchone()
+        if row is None:
+            return None
+        name, lo = row
+        if hold and int(lo) < int(hi):
+            # occurred_at·sent_at 과 같은 앱 시계 기준
+            cutoff = datetime.now() - timedelta(seconds=SUMMARY_HOLD)
+            cur = await conn.execute(_HOLD_SQL, {"campaign_id": campaign_id, "lo": lo, "hi": hi, "cutoff": cutoff}, prepare=True)
+            (held,) = await cur.fetchone()
+            if held is not None:
+                hi = held  # 다음 갱신에서 다시 확인
+        changes = []
+        # lo >= hi: 새 이벤트 없음 (또는 다른 워커가 이미 더 멀리 반영)
+        if int(lo) < int(hi):
+            with metrics.db_timer("UPDATE"):
+                cur = await conn.execute(
+                    _REFRESH_SQL,
+                    {"campaign_id": campaign_id, "lo": lo, "hi": hi, "scanner_delay": trackfilter.TRACK_SCANNER_DELAY},
+                    prepare=True,
+                )
+                changes = await cur.fetchall()
+            # 롤업도 같은 트랜잭션에서 갱신 → 요약과 롤업이 항상 같은 워터마크
+            await analytics.apply(conn, campaign_id, changes, lo, hi)
+            await conn.execute(
+                "UPDATE campaigns SET summarized_xid = %s::xid8 WHERE id = %s", (hi, campaign_id), prepare=True
+            )
+        # 발송 시각이 열람보다 늦게 기록된 수신자는 새 이벤트가 없어도 여기서 반영
+        await analytics.fold_time_to_click(conn, campaign_id, [c[-1] for c in changes])
+    opened = [dept for dept, _, first_open, *_ in changes if first_open]
+    infected = [dept for dept, _, _, first_infect, *_ in changes if first_infect]
+    return name, opened, infected
+
+
+class SummaryRefresher:
+    """Background task that keeps the active campaign's recipient summaries current."""
+
+    def __init__(self, interval=SUMMARY_INTERVAL, on_changed=None):
+        self.on_changed = on_changed  # async callback(table, opened_depts, infected_depts)
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+        self.stats = {"runs": 0, "skipped": 0, "errors": 0}
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name="summary-refresher")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            state = training_state.current()
+            if not state["table"] or state["locked"]:
+                continue
+            try:
+                await self.refresh(state["table"])
+            except Exception as e:
+                self.stats["errors"] += 1
+                logging.error("summary refresh error: %s", e)
+
+    async def refresh(self, table: str, wait: bool = False, hold: bool = True):
+        campaign_id = await campaigns.campaign_id(table)
+        if campaign_id is None:
+            return
+        result = await refresh(campaign_id, wait, hold)
+        if result is None:
+            self.stats["skipped"] += 1  # 다른 워커가 갱신 중
+            return
+        self.stats["runs"] += 1
+        _, opened, infected = result
+        if self.on_changed and (opened or infected):
+            try:
+                await self.on_changed(table, opened, infected)
+            except Exception as e:
+                logging.error("summary on_changed error: %s", e)
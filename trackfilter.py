@@ -0,0 +1,111 @@
+import os
+import re
+import time
+import ipaddress
+from collections import OrderedDict
+
+# ───────── 추적 요청 필터 ─────────
+# 메일 보안 게이트웨이·링크 스캐너는 메일마다 픽셀과 링크를 미리 열어 보므로
+# 기록 전에 (1) IP 별 요청 한도 (2) 짧은 시간 안의 중복 요청 흡수 (3) 스캐너 판별을 거친다.
+# 스캐너로 판별되거나 IP 한도를 넘은 요청은 버리지 않고 events.scanner 에 사유를 남겨 기록하며,
+# 수신자 요약·집계에서는 제외된다. 버려지는 것은 열람(click) 중복뿐 — 감염 요청은 항상 그대로 기록한다.
+TRACK_DEDUPE_TTL = float(os.getenv("TRACK_DEDUPE_TTL", "30"))        # 같은 (수신자, 종류) 반복 요청 흡수 시간(초, 0 = 끔)
+TRACK_DEDUPE_MAX = int(os.getenv("TRACK_DEDUPE_MAX", "200000"))      # 중복 캐시 최대 항목 수
+TRACK_IP_RATE = float(os.getenv("TRACK_IP_RATE", "0"))               # IP 별 초당 요청 한도 (0 = 끔, NAT 뒤 사용자는 한 IP 를 공유)
+TRACK_IP_BURST = int(os.getenv("TRACK_IP_BURST", "50"))              # IP 별 순간 허용량
+TRACK_SCANNER_UA = os.getenv(
+    "TRACK_SCANNER_UA",
+    r"bot|crawler|spider|scanner|preview|python-requests|curl/|wget/|go-http-client|java/|okhttp|headless"
+    r"|barracuda|proofpoint|mimecast|urldefense|safelinks|fireeye|trendmicro|symantec|forcepoint|zscaler",
+)  # 정규식, 대소문자 무시 (빈 값 = 끔)
+TRACK_SCANNER_CIDRS = os.getenv("TRACK_SCANNER_CIDRS", "")           # 스캐너 IP 대역, 쉼표 구분
+TRACK_SCANNER_DELAY = float(os.getenv("TRACK_SCANNER_DELAY", "1"))   # 발송 후 이 시간(초) 안의 요청은 스캐너로 간주
+
+UA, IP, FAST, RATE = "ua", "ip", "fast", "rate"  # events.scanner 값 (FAST 는 요약 시점에 발송 시각과 비교해 판별)
+
+
+class TrackingFilter:
+    """Per-process gate in front of the event buffer; never touches the database.
+
+    check() returns None when the hit should not be recorded at all (a
+    duplicate), otherwise the scanner tag to store with it ("" for a normal
+    hit, RATE when the IP is over its rate). With throttle=False (infections)
+    the hit is only classified, never dropped or rate-tagged.
+    """
+
+    def __init__(self, ttl=TRACK_DEDUPE_TTL, max_entries=TRACK_DEDUPE_MAX, rate=TRACK_IP_RATE,
+                 burst=TRACK_IP_BURST, scanner_ua=TRACK_SCANNER_UA, scanner_cidrs=TRACK_SCANNER_CIDRS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.rate = rate
+        self.burst = burst
+        self.scanner_ua = re.compile(scanner_ua, re.IGNORECASE) if scanner_ua else None
+        self.scanner_nets = [ipaddress.ip_network(c.strip(), strict=False) for c in scanner_cidrs.split(",") if c.strip()]
+        self._seen: OrderedDict[tuple, float] = OrderedDict()   # 키 → 만료 시각 (TTL 이 같으므로 삽입 순 = 만료 순)
+        self._buckets: dict[str, list[float]] = {}             # IP → [남은 토큰, 마지막 갱신 시각]
+        self._next_prune = 0.0
+        self.stats = {"passed": 0, "duplicates": 0, "rate_limited": 0, "scanners": 0}
+
+    def classify(self, ip: str, ua: str) -> str:
+        if self.scanner_ua and ua and self.scanner_ua.search(ua):
+            return UA
+        if self.scanner_nets and ip:
+            try:
+                addr = ipaddress.ip_address(ip)
+            except ValueError:
+                return ""
+            if any(addr in net for net in self.scanner_nets):
+                return IP
+        return ""
+
+    def check(self, kind: str, id, ip: str, ua: str, throttle: bool = True) -> str | None:
+        now = time.monotonic()
+        scanner = self.classify(ip, ua)
+        if throttle:
+            # 한도를 먼저 확인 — 중복 키는 실제로 기록되는 요청에 대해서만 남김
+            if not self._allow(ip, now):
+                scanner = scanner or RATE
+            if self._duplicate((str(id), kind, bool(scanner)), now):
+                return None
+        self.stats["passed"] += 1
+        if scanner and scanner != RATE:
+            self.stats["scanners"] += 1
+        return scanner
+
+    def _duplicate(self, key: tuple, now: float) -> bool:
+        if not self.ttl:
+            return False
+        seen = self._seen
+        while seen:
+            oldest, expires = next(iter(seen.items()))
+            if expires > now and len(seen) < self.max_entries:
+                break
+            del seen[oldest]
+        if key in seen:
+            self.stats["duplicates"] += 1
+            return True
+        seen[key] = now + self.ttl
+        return False
+
+    def _allow(self, ip: str, now: float) -> bool:
+        if not self.rate or not ip:
+            return True
+        if now >= self._next_prune:
+            self._prune(now)
+        bucket = self._buckets.get(ip)
+        if bucket is None:
+            bucket = self._buckets[ip] = [float(self.burst), now]
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            self.stats["rate_limited"] += 1
+            return False
+        bucket[0] = tokens - 1
+        return True
+
+    def _prune(self, now: float):
+        # 토큰이 가득 찼을 시점이 지난 IP 는 새로 만든 것과 같으므로 삭제
+        refill = self.burst / self.rate
+        self._buckets = {ip: b for ip, b in self._buckets.items() if now - b[1] < refill}
+        self._next_prune = now + max(refill, 10.0)
@@ -0,0 +1,142 @@
+import os
+import json
+import logging
+
+import db
+
+# ───────── 활성 훈련 상태 / 훈련별 설정 ─────────
+# 상태는 DB 에 저장하고 각 워커는 메모리 사본을 읽는다.
+# 변경 시 NOTIFY 로 다른 워커의 사본을 갱신한다 (uvicorn --workers N / gunicorn 대응).
+CHANNEL = "training_state"
+LEGACY_FILE = "current_training_table.txt"  # 이전 버전의 상태 파일 (최초 1회 가져오기)
+
+DEFAULT_MODE = 2
+DEFAULT_INFO_TEMPLATE = "개인정보입력페이지.html"
+
+_state = {"table": None, "locked": False}
+_campaigns: dict[str, dict] = {}  # campaign key → 설정
+
+
+def campaign_key(table: str) -> str:
+    """Trainings keep their config across end_training's rename to *_locked."""
+    return table[:-len("_locked")] if table.endswith("_locked") else table
+
+
+def current() -> dict:
+    """Return the cached state; a plain dict read, no I/O."""
+    return _state
+
+
+def _apply_state(table):
+    global _state
+    # 통째로 교체해 읽는 쪽이 항상 일관된 스냅샷을 보도록 함
+    _state = {"table": table, "locked": bool(table and table.endswith("_locked"))}
+
+
+def _apply_campaign(key, mode, info_template):
+    _campaigns[key] = {
+        "mode": mode or DEFAULT_MODE,
+        "info_template": info_template or DEFAULT_INFO_TEMPLATE,
+    }
+
+
+def _on_notify(payload: str):
+    msg = json.loads(payload)
+    if msg["kind"] == "state":
+        _apply_state(msg["table"])
+    elif msg["kind"] == "campaign":
+        _apply_campaign(msg["key"], msg["mode"], msg["info_template"])
+
+
+async def _create_schema():
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS training_state (
+            id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+            table_name TEXT,
+            updated_at TIMESTAMP DEFAULT now()
+        )
+    """)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS training_campaigns (
+            campaign_key TEXT PRIMARY KEY,
+            training_mode INT NOT NULL DEFAULT 2,
+            info_template_name TEXT,
+            updated_at TIMESTAMP DEFAULT now()
+        )
+    """)
+
+
+async def reload():
+    row = await db.fetch_one("SELECT table_name FROM training_state WHERE id = 1")
+    if row:
+        _apply_state(row[0])
+    for key, mode, info_template in await db.fetch_all(
+        "SELECT campaign_key, training_mode, info_template_name FROM training_campaigns"
+    ):
+        _apply_campaign(key, mode, info_template)
+
+
+async def update(table: str):
+    """Persist the active table and notify other workers."""
+    async with db.connection() as conn:
+        await conn.execute(
+            """
+            INSERT INTO training_state (id, table_name, updated_at)
+            VALUES (1, %s, now())
+            ON CONFLICT (id) DO UPDATE
+              SET table_name = EXCLUDED.table_name,
+                  updated_at = EXCLUDED.updated_at
+            """,
+            (table,),
+        )
+        await db.notify(conn, CHANNEL, json.dumps({"kind": "state", "table": table}, ensure_ascii=False))
+    _apply_state(table)
+
+
+async def campaign(table: str) -> dict:
+    """Config of the training stored in `table`; cached, DB lookup only on a miss."""
+    key = campaign_key(table)
+    config = _campaigns.get(key)
+    if config is None:
+        row = await db.fetch_one(
+            "SELECT training_mode, info_template_name FROM training_campaigns WHERE campaign_key = %s",
+            (key,),
+        )
+        _apply_campaign(key, *(row or (None, None)))
+        config = _campaigns[key]
+    return config
+
+
+async def set_campaign(table: str, mode: int, info_template: str | None):
+    """Store the sending config of one training; a missing info template keeps the old one."""
+    key = campaign_key(table)
+    async with db.connection() as conn:
+        cur = await conn.execute(
+            """
+            INSERT INTO training_campaigns (campaign_key, training_mode, info_template_name, updated_at)
+            VALUES (%s, %s, %s, now())
+            ON CONFLICT (campaign_key) DO UPDATE
+              SET training_mode = EXCLUDED.training_mode,
+                  info_template_name = COALESCE(EXCLUDED.info_template_name, training_campaigns.info_template_name),
+                  updated_at = EXCLUDED.updated_at
+            RETURNING training_mode, info_template_name
+            """,
+            (key, mode, info_template),
+        )
+        mode, info_template = await cur.fetchone()
+        await db.notify(conn, CHANNEL, json.dumps(
+            {"kind": "campaign", "key": key, "mode": mode, "info_template": info_template}, ensure_ascii=False
+        ))
+    _apply_campaign(key, mode, info_template)
+
+
+async def start():
+    await _create_schema()
+    await reload()
+    if _state["table"] is None and os.path.exists(LEGACY_FILE):
+        with open(LEGACY_FILE) as f:
+            legacy = f.read().strip()
+        if legacy:
+            logging.info("training state imported from %s: %s", LEGACY_FILE, legacy)
+            await update(legacy)
+    db.subscribe(CHANNEL, _on_notify, resync=reload)
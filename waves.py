@@ -0,0 +1,168 @@
+import os
+import zlib
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+import db
+import recipients
+
+# ───────── 단계(웨이브) 발송 ─────────
+# 수신자 전체를 한 번에 보내면 열람·감염 요청이 한꺼번에 몰리므로
+# 수신자를 여러 웨이브로 나눠 일정 간격으로, 또는 최근 클릭 속도가 기준 아래로 내려갔을 때 다음 웨이브를 보낸다.
+# 웨이브 배정은 CSV 행 번호·수신자 ID 로 결정되고 계획·발송 시각은 작업 체크포인트에 저장되므로 재시작 후에도 이어진다.
+WAVE_POLL_INTERVAL = float(os.getenv("WAVE_POLL_INTERVAL", "10"))  # 클릭 속도 확인 주기(초)
+WAVE_RATE_WINDOW = float(os.getenv("WAVE_RATE_WINDOW", "60"))      # 클릭 속도 측정 구간(초)
+
+DEPARTMENT, RANDOM, SIZE = "department", "random", "size"
+SPLITS = (DEPARTMENT, RANDOM, SIZE)
+
+
+class WaveSpecError(ValueError):
+    pass
+
+
+def check_spec(spec: dict, shards: int):
+    """Validate a `waves` request body before the job is created."""
+    by = spec.get("by")
+    if by not in SPLITS:
+        raise WaveSpecError(f"웨이브 분할 기준은 {', '.join(SPLITS)} 중 하나: {by}")
+    if spec.get("count") is not None and spec["count"] < 1:
+        raise WaveSpecError("count 는 1 이상이어야 합니다")
+    if by == RANDOM and not (spec.get("count") or 0) >= 2:
+        raise WaveSpecError("random 분할은 count(2 이상)가 필요합니다")
+    if by == SIZE and not (spec.get("size") or 0) >= 1:
+        raise WaveSpecError("size 분할은 size(1 이상)가 필요합니다")
+    if (spec.get("interval") or 0) < 0:
+        raise WaveSpecError("interval 은 0 이상이어야 합니다")
+    if shards > 1:
+        # 샤드 발송은 최대 처리량용 — 웨이브로 나누는 발송과 함께 쓰지 않음
+        raise WaveSpecError("웨이브 발송은 샤드 발송(shards > 1)과 함께 사용할 수 없습니다")
+
+
+async def click_rate(table: str) -> float:
+    """Tracking hits per minute for the campaign over the last WAVE_RATE_WINDOW seconds (scanners excluded)."""
+    # occurred_at 은 앱 시계(datetime.now())로 기록되므로 기준 시각도 앱에서 계산 (DB 시계와 어긋나도 무관)
+    cutoff = datetime.now() - timedelta(seconds=WAVE_RATE_WINDOW)
+    row = await db.fetch_one(
+        "SELECT count(*) FROM events"
+        " WHERE campaign_id = (SELECT id FROM campaigns WHERE name = %s)"
+        " AND occurred_at > %s AND scanner IS NULL",
+        (table, cutoff),
+        prepare=True,
+    )
+    return row[0] * 60 / WAVE_RATE_WINDOW
+
+
+class WavePlan:
+    """How a job's recipients are split into waves, and which waves have been released.
+
+    spec: {"by": department|random|size, "count", "size", "interval" (s between
+    releases), "max_click_rate" (hits/min; the next wave waits until the
+    campaign is below it)}. `departments` maps department → wave for the
+    department split; `released` holds the release time of each wave sent so far.
+    """
+
+    def __init__(self, job_id: str, spec: dict, sizes: list[int],
+                 departments: dict[str, int] | None = None, released: list[str] | None = None):
+        self.job_id = job_id
+        self.spec = spec
+        self.sizes = sizes
+        self.departments = departments or {}
+        self.released = released or []
+        self.waiting_since: str | None = None  # 다음 웨이브 대기 시작 시각 (진행 현황 표시용)
+
+    @classmethod
+    def build(cls, job_id: str, spec: dict, source: recipients.RecipientSource) -> "WavePlan":
+        """Stream the CSV once to assign departments and count each wave (run in a thread)."""
+        by = spec["by"]
+        departments: dict[str, int] = {}
+        if by == DEPARTMENT:
+            counts: dict[str, int] = {}
+            for _, row, reason in source.validate():
+                if not reason:
+                    dept = row.get("부서", "")
+                    counts[dept] = counts.get(dept, 0) + 1
+            if spec.get("count"):
+                # 부서를 나누지 않고 count 개 웨이브에 인원이 고르게 되도록 배정 (큰 부서부터 가장 적은 웨이브로)
+                loads = [0] * min(spec["count"], max(len(counts), 1))
+                for dept, n in sorted(counts.items(), key=lambda kv: -kv[1]):
+                    k = loads.index(min(loads))
+                    departments[dept] = k
+                    loads[k] += n
+            else:
+                departments = {dept: k for k, dept in enumerate(counts)}  # 부서별 한 웨이브 (CSV 등장 순서)
+        plan = cls(job_id, spec, [], departments)
+        sizes: dict[int, int] = {}
+        for index, row, reason in source.validate():
+            if not reason:
+                k = plan.wave_of(index, row)
+                sizes[k] = sizes.get(k, 0) + 1
+        if by == DEPARTMENT:
+            total = max(departments.values()) + 1 if departments else 1
+        elif by == RANDOM:
+            total = spec["count"]
+        else:
+            total = max(sizes) + 1 if sizes else 1
+        plan.sizes = [sizes.get(k, 0) for k in range(total)]
+        return plan
+
+    def wave_of(self, index: int, row: dict) -> int:
+        by = self.spec["by"]
+        if by == DEPARTMENT:
+            return self.departments.get(row.get("부서", ""), 0)
+        if by == SIZE:
+            return index // self.spec["size"]
+        # random: 수신자 ID 해시 — 프로세스와 무관하게 항상 같은 웨이브
+        return zlib.crc32(recipients.recipient_id(self.job_id, index).encode()) % self.spec["count"]
+
+    @property
+    def total(self) -> int:
+        return len(self.sizes)
+
+    def next_due(self) -> datetime | None:
+        if not self.released:
+            return None
+        return datetime.fromisoformat(self.released[-1]) + timedelta(seconds=self.spec.get("interval") or 0)
+
+    async def release_next(self, table: str):
+        """Wait until the next wave may go out (interval elapsed, click rate below the limit)."""
+        k = len(self.released)
+        if k and self.sizes[k]:  # 빈 웨이브(적재 제외 행만 있는 구간)는 기다리지 않음
+            self.waiting_since = datetime.now().isoformat(timespec="seconds")
+            delay = (self.next_due() - datetime.now()).total_seconds()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            limit = self.spec.get("max_click_rate")
+            while limit:
+                try:
+                    rate = await click_rate(table)
+                except Exception as e:
+                    logging.error("wave click rate check failed: %s", e)
+                    rate = limit  # 확인할 수 없으면 기다림
+                if rate < limit:
+                    break
+                logging.info("job %s: wave %d/%d held, %.0f hits/min >= %s", self.job_id, k + 1, self.total, rate, limit)
+                await asyncio.sleep(WAVE_POLL_INTERVAL)
+        self.waiting_since = None
+        self.released.append(datetime.now().isoformat(timespec="seconds"))
+        logging.info("job %s: releasing wave %d/%d (%d recipients)", self.job_id, k + 1, self.total, self.sizes[k])
+
+    # ───────── 영속화·현황 ─────────
+    def to_dict(self) -> dict:
+        return {"spec": self.spec, "sizes": self.sizes, "departments": self.departments, "released": self.released}
+
+    @classmethod
+    def from_dict(cls, job_id: str, data: dict) -> "WavePlan":
+        return cls(job_id, data["spec"], data["sizes"], data.get("departments"), data.get("released"))
+
+    def progress(self) -> dict:
+        due = self.next_due() if len(self.released) < self.total else None
+        return {
+            "by": self.spec["by"],
+            "total": self.total,
+            "released": len(self.released),
+            "sizes": self.sizes,
+            "waiting_since": self.waiting_since,
+            "next_release_at": due.isoformat(timespec="seconds") if due and self.released else None,
+        }